@@ -4,20 +4,33 @@ import logging
 import traceback
 from glob import glob
 from datetime import datetime
-import boto3
+import pyarrow as pa
 import pyarrow.parquet as pq
 import concurrent.futures
-from botocore.exceptions import ClientError
 from aws_utils_func import log_errors, configure_logging
-import re
 import shutil
+from dr_zip_reader import (read_zip_parquet_headers, read_zip_manifest, get_zip_staging_dir,
+                           get_cached_zip_headers, put_zip_headers, extract_zip_incremental)
+from glue_catalog import get_glue_catalog_metadata
+from dr_drop_index import get_local_drop_index
+from dr_table_schema import intern_schema
+from dr_quick_validation import get_footer_statistics
+from dr_schema_cache import cached_parquet_metadata
 
 # Logger configuration
 logger = configure_logging()
 
-def unzip_file(input_zip_file: str, output_dir: str) -> bool:
-    """Unzips the specified zip file to the given output directory, overwriting existing files."""
+def unzip_file(input_zip_file: str, output_dir: str, incremental: bool = False) -> bool:
+    """
+    Unzips the specified zip file to the given output directory.
+
+    With incremental only the members whose CRC32, size or timestamp differ from the files on disk are rewritten;
+    the per-zip staging directories of the DR runs are extracted that way.
+    """
     try:
+        if incremental:
+            extract_zip_incremental(input_zip_file, output_dir)
+            return True
         with zipfile.ZipFile(input_zip_file, 'r') as zip_ref:
             for member in zip_ref.namelist():
                 target_path = os.path.join(output_dir, member)
@@ -32,23 +45,26 @@ def unzip_file(input_zip_file: str, output_dir: str) -> bool:
         log_errors(e, detailed_traceback=True)
         return False
 
-def read_parquet_file_metadata(parquet_file: str) -> dict:
-    """Reads metadata from the specified parquet file."""
+@cached_parquet_metadata('pyarrow_counts')
+def read_parquet_file_metadata(parquet_file: str, source=None) -> dict:
+    """Reads the column names and footer statistics of the specified parquet file, or of an already opened source for it."""
     try:
         parquet_file_name = os.path.basename(parquet_file).split('.parquet')[0]
-        pq_df = pq.read_schema(parquet_file)
-        pq_cols_name_ls = pq_df.names
+        pq_md = pq.read_metadata(parquet_file if source is None else source)
+        pq_cols_name_ls = intern_schema(pq_md.schema.to_arrow_schema().names)
         metadata = {
             'File_Columns_Names': pq_cols_name_ls,
             'File_Columns_Counts': len(pq_cols_name_ls)
         }
+        metadata.update(get_footer_statistics(pq_md))
         logger.debug(f"{parquet_file_name}: {pq_cols_name_ls}")
         return parquet_file_name, metadata
-    except (pq.ArrowInvalid, OSError) as e:
+    except (pa.ArrowInvalid, OSError) as e:
         log_errors(e, detailed_traceback=True)
         return os.path.basename(parquet_file).split('.parquet')[0], {
-            'File_Columns_Names': [],
-            'File_Columns_Counts': 0
+            'File_Columns_Names': intern_schema([]),
+            'File_Columns_Counts': 0,
+            'File_Num_Rows': None
         }
 
 def process_parquet_file(parquet_file: str) -> dict:
@@ -56,13 +72,18 @@ def process_parquet_file(parquet_file: str) -> dict:
     return read_parquet_file_metadata(parquet_file)
 
 def process_zip_file(zip_file: str, output_dr_dir: str) -> dict:
-    """Processes a single zip file: unzips it and reads metadata from contained parquet files."""
+    """Processes a single zip file: stages it in its own directory and reads metadata from the parquet files in its manifest."""
+    file_metadata_dict = get_cached_zip_headers(zip_file, read_parquet_file_metadata)
+    if file_metadata_dict is not None:
+        return file_metadata_dict
+
     file_metadata_dict = {}
-    if not unzip_file(zip_file, output_dr_dir):
+    staging_dir = get_zip_staging_dir(zip_file, output_dr_dir)
+    if not unzip_file(zip_file, staging_dir, incremental=True):
         logger.error(f"Failed to extract zip file: {zip_file}")
         return None  # Indicate failure to process this zip file
 
-    parquet_files = glob(f"{output_dr_dir}/*.parquet")
+    parquet_files = [os.path.join(staging_dir, member) for member in read_zip_manifest(zip_file)]
     with concurrent.futures.ProcessPoolExecutor() as executor:
         results = executor.map(process_parquet_file, parquet_files)
         for parquet_file_name, metadata in results:
@@ -70,17 +91,25 @@ def process_zip_file(zip_file: str, output_dr_dir: str) -> dict:
                 logger.warning(f"Failed to extract column names for parquet file: {parquet_file_name}")
             file_metadata_dict[parquet_file_name] = metadata
 
+    put_zip_headers(zip_file, file_metadata_dict, read_parquet_file_metadata)
     return file_metadata_dict
 
-def get_dr_file_header(input_dr_zip_dir: str, output_dr_dir: str) -> dict:
-    """Retrieves metadata for parquet files within zip files in the specified directory."""
+def process_zip_file_in_place(zip_file: str) -> dict:
+    """Processes a single zip file: reads metadata from contained parquet files without extracting them."""
+    return read_zip_parquet_headers(zip_file, read_parquet_file_metadata)
+
+def get_dr_file_header(input_dr_zip_dir: str, output_dr_dir: str, extract_members: bool = True) -> dict:
+    """Retrieves metadata for parquet files within zip files, extracting them only if extract_members is set."""
     try:
         zip_files = glob(f"{input_dr_zip_dir}/*.zip")
         logger.info(f"Found {len(zip_files)} zip files in {input_dr_zip_dir}")
 
         file_metadata_dict = {}
         with concurrent.futures.ProcessPoolExecutor() as executor:
-            results = executor.map(process_zip_file, zip_files, [output_dr_dir] * len(zip_files))
+            if extract_members:
+                results = executor.map(process_zip_file, zip_files, [output_dr_dir] * len(zip_files))
+            else:
+                results = executor.map(process_zip_file_in_place, zip_files)
             for result in results:
                 if result is None:
                     logger.error("Stopping execution due to failed zip file extraction.")
@@ -92,51 +121,14 @@ def get_dr_file_header(input_dr_zip_dir: str, output_dr_dir: str) -> dict:
         log_errors(e, detailed_traceback=True)
         return {}
 
-def get_glue_table_metadata(client, db_name: str, table_name: str) -> dict:
-    """Retrieves metadata for a specific Glue table."""
-    table_metadata = {}
-    try:
-        response = client.get_table(DatabaseName=db_name, Name=table_name)
-        if response:
-            tbl_name = response['Table']['Name']
-            if table_name == tbl_name:
-                tbl_cols_names = [col['Name'] for col in response['Table']['StorageDescriptor']['Columns']]
-                table_metadata['Table_Columns_Names'] = tbl_cols_names
-                table_metadata['Table_Columns_Counts'] = len(tbl_cols_names)
-            else:
-                logger.warning(f"Retrieved incorrect metadata for table: {table_name}")
-                table_metadata['Table_Columns_Names'] = []
-                table_metadata['Table_Columns_Counts'] = 0
-        else:
-            logger.warning(f"No response received for Glue table: {db_name}.{table_name}")
-            table_metadata['Table_Columns_Names'] = []
-            table_metadata['Table_Columns_Counts'] = 0
-    except ClientError as e:
-        log_errors(e, detailed_traceback=True)
-        if e.response['Error']['Code'] == 'EntityNotFoundException':
-            logger.error(f"Table does not exist: {db_name}.{table_name}")
-        table_metadata['Table_Columns_Names'] = []
-        table_metadata['Table_Columns_Counts'] = 0
-    except Exception as e:
-        log_errors(e, detailed_traceback=True)
-        table_metadata['Table_Columns_Names'] = []
-        table_metadata['Table_Columns_Counts'] = 0
-    return table_metadata
-
-def get_glue_table_metadata_helper(args):
-    client, db_name, table_name = args
-    return get_glue_table_metadata(client, db_name, table_name)
-
 def get_glue_tbls_metadata(tables_list: list) -> dict:
-    """Retrieves metadata for a list of Glue tables."""
-    client = boto3.client('glue')
-    table_metadata_dict = {}
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        results = executor.map(get_glue_table_metadata_helper, [(client, table.split(',')[0].lower(), table.split(',')[1].lower()) for table in tables_list])
-        for table, table_metadata in zip(tables_list, results):
-            table_name = table.split(',')[1].lower()
-            table_metadata_dict[table_name] = table_metadata
-    return table_metadata_dict
+    """
+    Retrieves metadata for a list of Glue tables, pulling each database with paginated get_tables calls.
+
+    :raises GlueFetchError: If a table could not be fetched despite retries; dr_glue_main_process then fails
+        the run rather than comparing the file headers with an empty schema.
+    """
+    return get_glue_catalog_metadata(tables_list)
 
 def compare_glue_tbl_structure(table_list: list, file_md_dict: dict, tbl_md_dict: dict) -> str:
     """Compares Glue table structures with parquet file headers."""
@@ -188,14 +180,14 @@ def compare_glue_tbl_structure(table_list: list, file_md_dict: dict, tbl_md_dict
         logger.error("".join(tb.format()))
         return "FAILED"
 
-def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str) -> dict:
+def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str, extract_members: bool = False) -> dict:
     """Main process to fetch and compare Glue table structures and DR file headers."""
     try:
         with open(f'./config/dr_table_config.txt', 'r') as tbl_cfg_fl:
             table_list = tbl_cfg_fl.read().splitlines()
             if table_list:
                 logger.info(f"Fetching DR Parquet Files Headers.")
-                file_md_dict = get_dr_file_header(dr_zip_file_dir, dr_input_file_dir)
+                file_md_dict = get_dr_file_header(dr_zip_file_dir, dr_input_file_dir, extract_members)
                 if not file_md_dict:
                     return {"Glue Table Validation": "FAILED"}
                 logger.info(f"Fetching Glue Tables Metadata.")
@@ -213,41 +205,14 @@ def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str) -> dict:
 
 def get_latest_files(file_dir, file_type, file_count=3):
     """
-    Returns the latest files matching the required file pattern.
+    Returns the files of the latest complete DR drop (par01-par03) in a directory.
 
     :param file_dir: Directory containing the files.
     :param file_type: File type such as zip, text, etc.
     :param file_count: Number of latest files to return. Default is 3.
     :return: List of the latest files matching the pattern.
     """
-    # Use glob to get all files of the specified type in the directory
-    file_list = glob(os.path.join(file_dir, f'*.{file_type}'))
-    logger.info(f'Test data found: {file_list} in {file_dir}')
-
-    pattern = re.compile(r'(\d{8})-\d{4}_par0[1-3]\.zip')
-    files_by_date = {}
-
-    for file_path in file_list:
-        filename = os.path.basename(file_path)
-        match = pattern.match(filename)
-        if match:
-            date_str = match.group(1)
-            date = datetime.strptime(date_str, '%Y%m%d')
-            if date not in files_by_date:
-                files_by_date[date] = []
-            files_by_date[date].append(filename)
-
-    sorted_dates = sorted(files_by_date.keys(), reverse=True)
-    latest_files = []
-
-    for date in sorted_dates:
-        parts = sorted(files_by_date[date])
-        latest_files.extend(parts)
-        if len(latest_files) >= file_count:
-            break
-
-    logger.info(f'Latest file data found: {latest_files}')
-
-    latest_data = [os.path.join(file_dir, file) for file in latest_files]
-    logger.info(f'Path to latest zip files: {latest_data}')
+    latest_data = [file_path for file_path in get_local_drop_index(file_dir).latest_complete_set()
+                   if file_path.endswith(f'.{file_type}')]
+    logger.info(f'Path to latest {file_type} files: {latest_data}')
     return latest_data[:file_count]
@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+import threading
+from collections import Counter
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+from moto import mock_aws
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import J28
+import new_dr_compare_glue
+from dr_sharding import run_sharded_validation
+from config import APP_CONFIG
+from glue_catalog import get_glue_client
+from dr_s3_zip_reader import get_s3_dr_file_header
+from dr_schema_cache import configure_schema_cache
+from glue_metadata_cache import configure_glue_cache
+
+COMPRESSION_TYPES = {'stored': zipfile.ZIP_STORED, 'deflated': zipfile.ZIP_DEFLATED}
+
+# Local worker processes the sharded comparison is timed with
+SHARD_WORKER_COUNTS = (1, 2, 4)
+
+
+def generate_dr_drop(work_dir: str, zip_count: int, files_per_zip: int, column_count: int, row_count: int,
+                     row_group_size: int, compression: str) -> list:
+    """
+    Writes N zips x M parquet files x K columns under work_dir/dr_zip and returns the table config lines.
+
+    Tables are spread over two Glue databases; the parquet files are written once and zipped.
+    """
+    zip_dir = os.path.join(work_dir, 'dr_zip')
+    parquet_dir = os.path.join(work_dir, 'parquet')
+    os.makedirs(zip_dir, exist_ok=True)
+    os.makedirs(parquet_dir, exist_ok=True)
+    table = pa.table({f'col_{idx}': pa.array(range(row_count), type=pa.int64()) for idx in range(column_count)})
+    tables_list = []
+    for zip_idx in range(zip_count):
+        zip_file = os.path.join(zip_dir, f'20240101-0000_par{zip_idx + 1:02d}.zip')
+        with zipfile.ZipFile(zip_file, 'w', compression=COMPRESSION_TYPES[compression]) as zip_ref:
+            for file_idx in range(files_per_zip):
+                table_name = f'dr_table_{zip_idx}_{file_idx}'
+                parquet_file = os.path.join(parquet_dir, f'{table_name}.parquet')
+                pq.write_table(table, parquet_file, row_group_size=row_group_size)
+                zip_ref.write(parquet_file, f'{table_name}.parquet')
+                tables_list.append(f'dr_db_{file_idx % 2},{table_name}')
+    shutil.rmtree(parquet_dir)
+    return tables_list
+
+
+def populate_glue_catalog(client, tables_list: list, column_count: int, mismatch_every: int) -> int:
+    """Creates the configured tables in the local Glue stand-in, dropping a column from every Nth table."""
+    mismatched = 0
+    for db_name in sorted({table.split(',')[0] for table in tables_list}):
+        client.create_database(DatabaseInput={'Name': db_name})
+    for idx, table in enumerate(tables_list):
+        db_name, table_name = table.split(',')
+        table_columns = column_count
+        if mismatch_every and idx % mismatch_every == 0:
+            table_columns -= 1
+            mismatched += 1
+        client.create_table(DatabaseName=db_name, TableInput={
+            'Name': table_name,
+            'StorageDescriptor': {'Columns': [{'Name': f'col_{col}', 'Type': 'bigint'}
+                                              for col in range(table_columns)]}
+        })
+    return mismatched
+
+
+def upload_dr_drop(client, zip_dir: str, s3_key_prefix: str):
+    """Uploads the synthetic drop to the local S3 stand-in under a prefix of the configured bucket."""
+    client.create_bucket(Bucket=APP_CONFIG["S3_Bucket"])
+    for zip_name in sorted(os.listdir(zip_dir)):
+        client.upload_file(os.path.join(zip_dir, zip_name), APP_CONFIG["S3_Bucket"], f'{s3_key_prefix}{zip_name}')
+
+
+def time_call(name: str, func, repeat: int) -> dict:
+    """Runs a benchmark case repeatedly and records its best and mean wall time and Glue calls."""
+    timings = []
+    call_counts = Counter()
+    lock = threading.Lock()
+
+    def record_call(model, **kwargs):
+        with lock:
+            call_counts[model.name] += 1
+
+    # Clients created by the code under test inherit the handlers of the default session, but the shared
+    # Glue client copied them when it was created, so it gets the handler too; creating it first keeps it
+    # from inheriting the handler and counting its calls twice
+    event_emitters = [get_glue_client().meta.events, boto3.DEFAULT_SESSION.events]
+    for events in event_emitters:
+        events.register('after-call.glue', record_call)
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+    finally:
+        for events in event_emitters:
+            events.unregister('after-call.glue', record_call)
+    return {
+        'case': name,
+        'repeat': repeat,
+        'best_seconds': round(min(timings), 4),
+        'mean_seconds': round(sum(timings) / len(timings), 4),
+        'glue_calls': sum(call_counts.values()) // repeat,
+        'result_size': len(result) if isinstance(result, dict) else None,
+        'result': result if isinstance(result, str) else None
+    }
+
+
+def run_benchmark(zip_count: int, files_per_zip: int, column_count: int, row_count: int, row_group_size: int,
+                  compression: str, mismatch_every: int, repeat: int) -> dict:
+    """Generates a synthetic DR drop and Glue catalog, then times every stage of both pool variants."""
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    configure_schema_cache('bypass')
+    configure_glue_cache('bypass')
+    work_dir = tempfile.mkdtemp(prefix='dr_compare_benchmark_')
+    cwd = os.getcwd()
+    try:
+        tables_list = generate_dr_drop(work_dir, zip_count, files_per_zip, column_count, row_count,
+                                       row_group_size, compression)
+        os.chdir(work_dir)
+        os.makedirs('config', exist_ok=True)
+        os.makedirs('logs', exist_ok=True)
+        with open('config/dr_table_config.txt', 'w') as tbl_cfg_fl:
+            tbl_cfg_fl.write('\n'.join(tables_list))
+        zip_dir, output_dir = 'dr_zip', 'dr_input'
+
+        with mock_aws():
+            boto3.setup_default_session()
+            client = boto3.client('glue')
+            mismatched = populate_glue_catalog(client, tables_list, column_count, mismatch_every)
+            upload_dr_drop(boto3.client('s3'), zip_dir, 'dr_drop/')
+            file_md_dict = new_dr_compare_glue.get_dr_file_header(zip_dir, output_dir, extract_members=False)
+            tbl_md_dict = new_dr_compare_glue.get_glue_tbls_metadata(tables_list)
+
+            cases = {
+                'thread.get_dr_file_header.in_place':
+                    lambda: new_dr_compare_glue.get_dr_file_header(zip_dir, output_dir, extract_members=False),
+                'thread.get_dr_file_header.extract':
+                    lambda: new_dr_compare_glue.get_dr_file_header(zip_dir, output_dir, extract_members=True),
+                'process.get_dr_file_header.in_place':
+                    lambda: J28.get_dr_file_header(zip_dir, output_dir, extract_members=False),
+                'process.get_dr_file_header.extract':
+                    lambda: J28.get_dr_file_header(zip_dir, output_dir, extract_members=True),
+                's3.get_s3_dr_file_header':
+                    lambda: get_s3_dr_file_header('dr_drop/', new_dr_compare_glue.read_parquet_file_metadata),
+                'get_glue_tbls_metadata':
+                    lambda: new_dr_compare_glue.get_glue_tbls_metadata(tables_list),
+                'compare_glue_tbl_structure':
+                    lambda: new_dr_compare_glue.compare_glue_tbl_structure(tables_list, file_md_dict, tbl_md_dict),
+                'thread.dr_glue_main_process':
+                    lambda: new_dr_compare_glue.dr_glue_main_process(zip_dir, output_dir)["Glue Table Validation"],
+                'thread.dr_glue_main_process.pipelined':
+                    lambda: new_dr_compare_glue.dr_glue_main_process(zip_dir, output_dir,
+                                                                     pipelined=True)["Glue Table Validation"],
+                'process.dr_glue_main_process':
+                    lambda: J28.dr_glue_main_process(zip_dir, output_dir)["Glue Table Validation"],
+            }
+            # Forked shard workers inherit the mocked Glue catalog
+            for workers in SHARD_WORKER_COUNTS:
+                cases[f'sharded.run_sharded_validation.workers_{workers}'] = \
+                    lambda workers=workers: run_sharded_validation(tables_list, zip_dir, 'dr_queue', workers)
+            results = [time_call(name, func, repeat) for name, func in cases.items()]
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'parameters': {
+            'zips': zip_count,
+            'files_per_zip': files_per_zip,
+            'columns': column_count,
+            'rows': row_count,
+            'row_group_size': row_group_size,
+            'compression': compression,
+            'tables': len(tables_list),
+            'mismatched_tables': mismatched
+        },
+        'results': results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the DR compare stages on a synthetic drop and Glue catalog.")
+    parser.add_argument('--zips', type=int, default=3)
+    parser.add_argument('--files-per-zip', type=int, default=50)
+    parser.add_argument('--columns', type=int, default=30)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--row-group-size', type=int, default=2500)
+    parser.add_argument('--compression', choices=sorted(COMPRESSION_TYPES), default='deflated')
+    parser.add_argument('--mismatch-every', type=int, default=10,
+                        help="Drop a Glue column from every Nth table; 0 keeps every schema matching.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+    report = run_benchmark(args.zips, args.files_per_zip, args.columns, args.rows, args.row_group_size,
+                           args.compression, args.mismatch_every, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as output_fl:
+            json.dump(report, output_fl, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
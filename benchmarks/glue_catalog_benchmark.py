@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import argparse
+import concurrent.futures
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from glue_catalog import get_glue_catalog_metadata, count_glue_calls
+from glue_metadata_cache import configure_glue_cache
+
+
+def populate_glue_catalog(client, db_count: int, tables_per_db: int, column_count: int) -> list:
+    """Creates databases and tables in the local Glue stand-in and returns the matching config lines."""
+    tables_list = []
+    columns = [{'Name': f'col_{idx}', 'Type': 'string'} for idx in range(column_count)]
+    for db_idx in range(db_count):
+        db_name = f'dr_db_{db_idx}'
+        client.create_database(DatabaseInput={'Name': db_name})
+        for tbl_idx in range(tables_per_db):
+            table_name = f'dr_table_{db_idx}_{tbl_idx}'
+            client.create_table(DatabaseName=db_name, TableInput={
+                'Name': table_name,
+                'StorageDescriptor': {'Columns': columns}
+            })
+            tables_list.append(f'{db_name},{table_name}')
+    return tables_list
+
+
+def get_glue_table_metadata(client, db_name: str, table_name: str) -> dict:
+    """The previous per-table loader: one get_table call, with an empty schema on any error."""
+    try:
+        response = client.get_table(DatabaseName=db_name, Name=table_name)
+        tbl_cols_names = [col['Name'] for col in response['Table']['StorageDescriptor']['Columns']]
+    except ClientError:
+        tbl_cols_names = []
+    return {'Table_Columns_Names': tbl_cols_names, 'Table_Columns_Counts': len(tbl_cols_names)}
+
+
+def fetch_per_table(client, tables_list: list) -> dict:
+    """The previous approach: one get_table call per configured table."""
+    table_metadata_dict = {}
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        future_to_table = {
+            executor.submit(get_glue_table_metadata, client, table.split(',')[0].lower(),
+                            table.split(',')[1].lower()): table
+            for table in tables_list
+        }
+        for future in concurrent.futures.as_completed(future_to_table):
+            table_metadata_dict[future_to_table[future].split(',')[1].lower()] = future.result()
+    return table_metadata_dict
+
+
+def run_benchmark(db_count: int, tables_per_db: int, column_count: int, missing_tables: int) -> list:
+    """Times both loaders against the same catalog and reports their Glue call counts."""
+    results = []
+    configure_glue_cache('bypass')
+    with mock_aws():
+        client = boto3.client('glue', region_name='us-east-1')
+        tables_list = populate_glue_catalog(client, db_count, tables_per_db, column_count)
+        tables_list += [f'dr_db_0,dr_missing_table_{idx}' for idx in range(missing_tables)]
+
+        loaders = {
+            'get_table_per_table': lambda: fetch_per_table(client, tables_list),
+            'get_tables_bulk': lambda: get_glue_catalog_metadata(tables_list, client=client),
+            'get_tables_bulk_no_expression': lambda: get_glue_catalog_metadata(tables_list, client=client,
+                                                                               use_expression=False),
+        }
+        for loader_name, loader in loaders.items():
+            with count_glue_calls(client) as call_counts:
+                start = time.perf_counter()
+                table_metadata_dict = loader()
+                elapsed = time.perf_counter() - start
+            results.append({
+                'loader': loader_name,
+                'tables': len(tables_list),
+                'tables_with_columns': sum(1 for md in table_metadata_dict.values() if md['Table_Columns_Counts']),
+                'glue_calls': sum(call_counts.values()),
+                'glue_calls_by_operation': dict(call_counts),
+                'seconds': round(elapsed, 3)
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Glue call counts of per-table and bulk catalog loaders.")
+    parser.add_argument('--databases', type=int, default=3)
+    parser.add_argument('--tables-per-db', type=int, default=500)
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--missing-tables', type=int, default=5)
+    args = parser.parse_args()
+    for result in run_benchmark(args.databases, args.tables_per_db, args.columns, args.missing_tables):
+        print(json.dumps(result))
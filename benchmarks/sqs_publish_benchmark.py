@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The publisher uses the default session, so give it the region of the local stand-in
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from aws_utils_func import send_queue_message, send_queue_messages
+
+# Worker counts the batched publisher is timed with
+SEND_WORKER_COUNTS = (1, 4, 8)
+# Messages published per queue; the stand-in scans the whole queue on every batch entry, so each round
+# publishes on a fresh queue to keep the benchmark timing the publisher rather than the queue depth
+ROUND_MESSAGES = 100
+
+
+def generate_messages(message_count: int, message_size: int, group_count: int = 0):
+    """Yields message dicts of message_size bytes, spread over group_count FIFO groups if any."""
+    padding = 'x' * message_size
+    for idx in range(message_count):
+        message = {'MessageBody': json.dumps({'seq': idx, 'padding': padding})[:max(message_size, 16)]}
+        if group_count:
+            message['MessageGroupId'] = f'group_{idx % group_count}'
+            message['MessageDeduplicationId'] = str(idx)
+        yield message
+
+
+def publish_one_by_one(queue_url: str, messages) -> dict:
+    """The previous approach: one send_message call per message."""
+    report = {'Messages': 0, 'Sent': 0}
+    for message in messages:
+        report['Messages'] += 1
+        response = send_queue_message(queue_url, message['MessageBody'],
+                                      message_group_id=message.get('MessageGroupId'),
+                                      message_deduplication_id=message.get('MessageDeduplicationId'))
+        report['Sent'] += 1 if response else 0
+    return report
+
+
+def create_queues(client, round_count: int, fifo: bool) -> list:
+    """Creates one queue per publishing round in the local SQS stand-in."""
+    attributes = {'FifoQueue': 'true'} if fifo else {}
+    suffix = '.fifo' if fifo else ''
+    return [client.create_queue(QueueName=f'dr-publish-benchmark-{uuid.uuid4().hex[:12]}{suffix}',
+                                Attributes=attributes)['QueueUrl'] for _ in range(round_count)]
+
+
+def time_rounds(publisher, queue_urls: list, message_count: int, message_size: int, group_count: int) -> dict:
+    """Publishes message_count messages split over the queues and times only the publishing calls."""
+    report = {'Messages': 0, 'Sent': 0}
+    elapsed = 0
+    for round_idx, queue_url in enumerate(queue_urls):
+        round_count = min(ROUND_MESSAGES, message_count - round_idx * ROUND_MESSAGES)
+        start = time.perf_counter()
+        round_report = publisher(queue_url, generate_messages(round_count, message_size, group_count))
+        elapsed += time.perf_counter() - start
+        report['Messages'] += round_report['Messages']
+        report['Sent'] += round_report['Sent']
+    report['Seconds'] = elapsed
+    return report
+
+
+def run_benchmark(message_count: int, message_size: int, group_count: int, single_count: int) -> list:
+    """Times one-by-one and batched publishing against queues of the local SQS stand-in."""
+    results = []
+    with mock_aws():
+        client = boto3.client('sqs', region_name='us-east-1')
+        publishers = {'send_message': (publish_one_by_one, single_count)}
+        for workers in SEND_WORKER_COUNTS:
+            publishers[f'send_message_batch_{workers}_workers'] = (
+                lambda queue_url, messages, workers=workers: send_queue_messages(queue_url, messages,
+                                                                                  max_workers=workers),
+                message_count)
+        for publisher_name, (publisher, count) in publishers.items():
+            queue_urls = create_queues(client, -(-count // ROUND_MESSAGES), bool(group_count))
+            report = time_rounds(publisher, queue_urls, count, message_size, group_count)
+            results.append({
+                'publisher': publisher_name,
+                'messages': report['Messages'],
+                'sent': report['Sent'],
+                'seconds': round(report['Seconds'], 3),
+                'messages_per_second': round(report['Sent'] / report['Seconds'], 1) if report['Seconds'] else None
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare one-by-one and batched SQS publishing throughput.")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--message-size', type=int, default=1024)
+    parser.add_argument('--fifo-groups', type=int, default=0, help="Publish on a FIFO queue over this many groups")
+    parser.add_argument('--single-messages', type=int, default=2000,
+                        help="Messages published one by one, kept lower since that path is the slow one")
+    args = parser.parse_args()
+    for result in run_benchmark(args.messages, args.message_size, args.fifo_groups, args.single_messages):
+        print(json.dumps(result))
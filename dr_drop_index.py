@@ -0,0 +1,157 @@
+import os
+import re
+import bisect
+import threading
+from datetime import datetime
+from botocore.exceptions import ClientError
+from config import APP_CONFIG
+from aws_utils_func import configure_logging, iter_s3_objects
+
+# Logger configuration
+logger = configure_logging()
+
+# DR drop files are named <YYYYMMDD><-|_><HHMM><_|.>par<01-03>.zip; both separator conventions are in use
+DROP_FILE_PATTERN = re.compile(r'(?P<date>\d{8})[-_](?P<time>\d{4})[._]par(?P<part>0[1-3])\.zip$')
+DROP_PARTS = ('01', '02', '03')
+
+
+def parse_drop_file(location: str):
+    """
+    Parses the drop key and part number out of a DR file path or S3 key.
+
+    :param location: Local path or S3 key of the file.
+    :return: Tuple of the (date, time) drop key and the part number, or None if it is not a DR drop file.
+    """
+    match = DROP_FILE_PATTERN.match(location.replace('\\', '/').split('/')[-1])
+    if not match:
+        return None
+    return (match.group('date'), match.group('time')), match.group('part')
+
+
+def get_drop_key(since) -> tuple:
+    """Converts a datetime, 'YYYYMMDD' or 'YYYYMMDD-HHMM' value into a comparable drop key."""
+    if isinstance(since, datetime):
+        return since.strftime('%Y%m%d'), since.strftime('%H%M')
+    since = str(since).replace('_', '-')
+    date_str, _, time_str = since.partition('-')
+    return date_str, time_str or '0000'
+
+
+class DropIndex:
+    """Incrementally maintained index of DR drops keyed by date/time and part number."""
+
+    def __init__(self):
+        self.drops = {}
+        self.complete_keys = []
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def add(self, location: str) -> bool:
+        """Indexes one file, returning True if it completed a drop."""
+        with self.lock:
+            if location in self.seen:
+                return False
+            self.seen.add(location)
+            parsed = parse_drop_file(location)
+            if parsed is None:
+                return False
+            drop_key, part = parsed
+            parts = self.drops.setdefault(drop_key, {})
+            was_complete = len(parts) == len(DROP_PARTS)
+            parts[part] = location
+            if not was_complete and len(parts) == len(DROP_PARTS):
+                bisect.insort(self.complete_keys, drop_key)
+                logger.info(f"DR drop {'-'.join(drop_key)} is complete")
+                return True
+            return False
+
+    def add_many(self, locations) -> int:
+        """Indexes several files, returning the number of drops they completed."""
+        return sum(self.add(location) for location in locations)
+
+    def remove(self, location: str):
+        """Forgets a file that no longer exists; its drop is no longer complete."""
+        with self.lock:
+            self.seen.discard(location)
+            parsed = parse_drop_file(location)
+            if parsed is None:
+                return
+            drop_key, part = parsed
+            parts = self.drops.get(drop_key, {})
+            if parts.get(part) != location:
+                return
+            if len(parts) == len(DROP_PARTS):
+                del self.complete_keys[bisect.bisect_left(self.complete_keys, drop_key)]
+                logger.info(f"DR drop {'-'.join(drop_key)} is no longer complete")
+            del parts[part]
+            if not parts:
+                del self.drops[drop_key]
+
+    def sync(self, locations: set) -> int:
+        """Makes the index match a full listing: forgets the files missing from it and indexes the new ones."""
+        with self.lock:
+            missing = self.seen - locations
+        for location in missing:
+            self.remove(location)
+        return self.add_many(location for location in locations if location not in self.seen)
+
+    def refresh_local(self, file_dir: str) -> int:
+        """Indexes the new files of a local directory and forgets the deleted ones."""
+        with os.scandir(file_dir) as entries:
+            return self.sync({entry.path for entry in entries if entry.is_file()})
+
+    def refresh_s3(self, s3_key_prefix: str, bucket: str = None) -> int:
+        """Indexes the new objects of an S3 prefix and forgets the deleted ones, in the configured bucket by default."""
+        try:
+            locations = {s3_object['Key'] for s3_object in iter_s3_objects(s3_key_prefix, s3_bucket=bucket)}
+        except ClientError as e:
+            logger.error(f"Unable to list S3 prefix {s3_key_prefix}: {e}")
+            return 0
+        return self.sync(locations)
+
+    def get_drop_files(self, drop_key: tuple) -> list:
+        """Returns the files of a drop ordered by part number."""
+        parts = self.drops.get(drop_key, {})
+        return [parts[part] for part in DROP_PARTS if part in parts]
+
+    def latest_complete_set(self) -> list:
+        """Returns the par01-par03 files of the most recent complete drop, or an empty list."""
+        with self.lock:
+            return self.get_drop_files(self.complete_keys[-1]) if self.complete_keys else []
+
+    def complete_sets_since(self, since) -> list:
+        """Returns the complete drops at or after a date/time, oldest first, each as its par01-par03 files."""
+        with self.lock:
+            start = bisect.bisect_left(self.complete_keys, get_drop_key(since))
+            return [self.get_drop_files(drop_key) for drop_key in self.complete_keys[start:]]
+
+
+# Indexes shared by every caller in the process, keyed by local directory or S3 bucket and prefix
+drop_indexes = {}
+drop_indexes_lock = threading.Lock()
+
+
+def get_drop_index(source: str) -> DropIndex:
+    """Returns the process-wide drop index of a local directory or S3 prefix."""
+    with drop_indexes_lock:
+        return drop_indexes.setdefault(source, DropIndex())
+
+
+def get_local_drop_index(file_dir: str) -> DropIndex:
+    """Returns the drop index of a local directory, indexing any files that arrived since the last call."""
+    drop_index = get_drop_index(os.path.abspath(file_dir))
+    drop_index.refresh_local(file_dir)
+    return drop_index
+
+
+def get_s3_drop_index(s3_key_prefix: str, bucket: str = None) -> DropIndex:
+    """
+    Returns the drop index of an S3 prefix, indexing any objects that arrived since the last call.
+
+    :param s3_key_prefix: S3 prefix the DR files land under.
+    :param bucket: Bucket of the prefix, APP_CONFIG["S3_Bucket"] if not provided.
+    """
+    bucket = bucket or APP_CONFIG["S3_Bucket"]
+    drop_index = get_drop_index(f"s3://{bucket}/{s3_key_prefix}")
+    drop_index.refresh_s3(s3_key_prefix, bucket)
+    return drop_index
@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import threading
+from aws_utils_func import configure_logging
+from dr_table_schema import intern_metadata, encode_schema
+
+# Logger configuration
+logger = configure_logging()
+
+JOURNAL_DIR = './logs'
+
+
+def get_run_key(table_list: list, zip_files: list, extract_members: bool) -> str:
+    """
+    Identifies a DR comparison run by its configured tables, its zip files and how they are read.
+
+    A run resumed with any of those changed gets a new key and therefore starts over.
+    """
+    zip_signatures = []
+    for zip_file in sorted(zip_files):
+        stat = os.stat(zip_file)
+        zip_signatures.append([os.path.basename(zip_file), stat.st_size, stat.st_mtime_ns])
+    payload = json.dumps({'Tables': table_list, 'Zips': zip_signatures, 'Extract': extract_members})
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class RunJournal:
+    """
+    Append-only, fsynced journal of the work a DR comparison run has completed.
+
+    Every record is one JSON line: the metadata read from a zip file, the Glue metadata fetched, and the
+    verdict and details report entry of each compared table. A run restarted over the same inputs replays
+    the journal and only does the remaining work; the journal is removed once the run completes.
+    """
+
+    def __init__(self, journal_path: str):
+        self.journal_path = journal_path
+        self.zips = {}
+        self.glue = None
+        self.verdicts = {}
+        self.lock = threading.Lock()
+        self.replay()
+        self.journal_fl = open(journal_path, 'a', encoding='utf-8')
+
+    def replay(self):
+        """Loads the records of an earlier attempt, dropping a last line torn by a crash."""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb+') as journal_fl:
+            content = journal_fl.read()
+            complete_length = content.rfind(b'\n') + 1
+            if complete_length < len(content):
+                logger.warning(f"Dropping a torn record at the end of {self.journal_path}")
+                journal_fl.truncate(complete_length)
+        for line in content[:complete_length].decode('utf-8').splitlines():
+            record = json.loads(line)
+            if record['Type'] == 'zip':
+                self.zips[record['Zip_File']] = {name: intern_metadata(metadata)
+                                                 for name, metadata in record['Metadata'].items()}
+            elif record['Type'] == 'glue':
+                self.glue = {name: intern_metadata(metadata) for name, metadata in record['Metadata'].items()}
+            elif record['Type'] == 'verdict':
+                self.verdicts[record['Position']] = record['Table'], record['Result'], record['Details']
+        logger.info(f"Resuming from {self.journal_path}: {len(self.zips)} zip files read, "
+                    f"Glue metadata {'fetched' if self.glue is not None else 'not fetched'}, "
+                    f"{len(self.verdicts)} tables compared")
+
+    def append(self, record: dict):
+        """Appends one record and forces it to disk before returning."""
+        line = json.dumps(record, default=encode_schema) + '\n'
+        with self.lock:
+            self.journal_fl.write(line)
+            self.journal_fl.flush()
+            os.fsync(self.journal_fl.fileno())
+
+    def get_zip_metadata(self, zip_file: str):
+        """Returns the metadata journaled for a zip file, or None if it still has to be read."""
+        return self.zips.get(os.path.basename(zip_file))
+
+    def record_zip(self, zip_file: str, file_metadata_dict: dict):
+        """Journals the metadata read from the parquet files of a zip file."""
+        self.zips[os.path.basename(zip_file)] = file_metadata_dict
+        self.append({'Type': 'zip', 'Zip_File': os.path.basename(zip_file), 'Metadata': file_metadata_dict})
+
+    def record_glue(self, tbl_md_dict: dict):
+        """Journals the metadata fetched for the Glue tables."""
+        self.glue = tbl_md_dict
+        self.append({'Type': 'glue', 'Metadata': tbl_md_dict})
+
+    def get_verdict(self, position: int):
+        """Returns the (table name, result, details report entry) journaled for a configured table, or None."""
+        return self.verdicts.get(position)
+
+    def record_verdict(self, position: int, table_name: str, result: str, details: str):
+        """Journals the verdict and details report entry of the table at a position of the config."""
+        self.verdicts[position] = table_name, result, details
+        self.append({'Type': 'verdict', 'Position': position, 'Table': table_name, 'Result': result,
+                     'Details': details})
+
+    def close(self):
+        """Closes the journal, keeping it for the next attempt."""
+        with self.lock:
+            if not self.journal_fl.closed:
+                self.journal_fl.close()
+
+    def complete(self):
+        """Removes the journal once the run produced its reports."""
+        self.close()
+        os.remove(self.journal_path)
+        logger.info(f"Run completed, removed journal {self.journal_path}")
+
+
+def open_run_journal(table_list: list, zip_files: list, extract_members: bool,
+                     journal_dir: str = JOURNAL_DIR) -> RunJournal:
+    """Opens the journal of a run, replaying the work an interrupted attempt over the same inputs completed."""
+    run_key = get_run_key(table_list, zip_files, extract_members)
+    os.makedirs(journal_dir, exist_ok=True)
+    return RunJournal(os.path.join(journal_dir, f'DR_COMP_Journal_{run_key}.jsonl'))
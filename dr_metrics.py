@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from aws_utils_func import configure_logging
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Logger configuration
+logger = configure_logging()
+
+# Stages of a DR comparison run, in the order they are reported
+DR_STAGES = ('zip_listing', 'extraction', 'footer_read', 'glue_fetch', 'compare', 'report_write')
+
+
+def get_peak_rss() -> dict:
+    """Returns the peak resident set size in bytes of this process and of its finished child processes."""
+    if resource is None:
+        return {'Self': None, 'Children': None}
+    # ru_maxrss is reported in kilobytes on Linux
+    return {'Self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'Children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024}
+
+
+class StageMetrics:
+    """Counters of one pipeline stage; wall time spans from its first start to its last end."""
+
+    __slots__ = ('name', 'first_start', 'last_end', 'busy_seconds', 'items', 'bytes_read',
+                 'glue_calls', 'glue_throttles', 'max_queue_depth')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.first_start = None
+        self.last_end = None
+        self.busy_seconds = 0.0
+        self.items = 0
+        self.bytes_read = 0
+        self.glue_calls = 0
+        self.glue_throttles = 0
+        self.max_queue_depth = 0
+
+    def to_dict(self) -> dict:
+        wall_seconds = (self.last_end - self.first_start) if self.first_start is not None else 0.0
+        return {
+            'Stage': self.name,
+            'Wall_Seconds': round(wall_seconds, 4),
+            'Busy_Seconds': round(self.busy_seconds, 4),
+            'Items': self.items,
+            'Items_Per_Second': round(self.items / wall_seconds, 2) if wall_seconds else None,
+            'Bytes_Read': self.bytes_read,
+            'Glue_Calls': self.glue_calls,
+            'Glue_Throttles': self.glue_throttles,
+            'Max_Queue_Depth': self.max_queue_depth
+        }
+
+
+class RunMetrics:
+    """Per-stage timing, throughput and resource counters of one DR comparison run."""
+
+    def __init__(self):
+        self.stages = {name: StageMetrics(name) for name in DR_STAGES}
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def get_stage(self, name: str) -> StageMetrics:
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    def record(self, name: str, items: int = 0, bytes_read: int = 0, glue_calls: int = 0, glue_throttles: int = 0):
+        """Adds work done by a stage."""
+        with self.lock:
+            stage = self.get_stage(name)
+            stage.items += items
+            stage.bytes_read += bytes_read
+            stage.glue_calls += glue_calls
+            stage.glue_throttles += glue_throttles
+
+    def record_queue_depth(self, name: str, depth: int):
+        """Keeps the largest number of tasks seen waiting in front of a stage."""
+        with self.lock:
+            stage = self.get_stage(name)
+            stage.max_queue_depth = max(stage.max_queue_depth, depth)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a block of work belonging to a stage; concurrent blocks widen the same wall time window."""
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                stage = self.get_stage(name)
+                stage.first_start = start if stage.first_start is None else min(stage.first_start, start)
+                stage.last_end = end if stage.last_end is None else max(stage.last_end, end)
+                stage.busy_seconds += end - start
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            stages = [stage.to_dict() for stage in self.stages.values()]
+        return {
+            'Started_At': self.started_at,
+            'Total_Seconds': round(time.time() - self.started_at, 4),
+            'Peak_RSS_Bytes': get_peak_rss(),
+            'Stages': stages
+        }
+
+
+# Metrics of the run in progress, replaced at the start of every dr_glue_main_process call
+run_metrics = RunMetrics()
+
+
+def start_run_metrics() -> RunMetrics:
+    """Starts collecting metrics for a new run."""
+    global run_metrics
+    run_metrics = RunMetrics()
+    return run_metrics
+
+
+def get_run_metrics() -> RunMetrics:
+    """Returns the metrics of the run in progress."""
+    return run_metrics
+
+
+def get_metrics_path(summary_file_path: str) -> str:
+    """Returns the JSON sidecar path next to a DR_COMP_Summary_Report_*.txt file."""
+    directory, summary_file_name = os.path.split(summary_file_path)
+    metrics_file_name = summary_file_name.replace('Summary_Report', 'Metrics_Report').rsplit('.', 1)[0] + '.json'
+    return os.path.join(directory, metrics_file_name)
+
+
+def write_run_metrics(summary_file_path: str) -> str:
+    """Writes the metrics of the run in progress to the sidecar of a summary report and returns its path."""
+    metrics_file_path = get_metrics_path(summary_file_path)
+    try:
+        with open(metrics_file_path, 'w') as metrics_fl:
+            json.dump(run_metrics.to_dict(), metrics_fl, indent=2)
+        logger.info(f"Wrote run metrics to {metrics_file_path}")
+    except OSError as e:
+        logger.error(f"Unable to write run metrics to {metrics_file_path}: {e}")
+    return metrics_file_path
+
+
+def load_stage_metrics(metrics_file_path: str) -> list:
+    """Loads the stage metrics of a sidecar file for the HTML report."""
+    with open(metrics_file_path, 'r') as metrics_fl:
+        return json.load(metrics_fl).get('Stages', [])
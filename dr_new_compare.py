@@ -4,18 +4,28 @@ import logging
 import traceback
 from glob import glob
 from datetime import datetime
-import boto3
 import pyarrow.parquet as pq
 import concurrent.futures
-from botocore.exceptions import ClientError
 from aws_utils_func import log_errors, configure_logging
+from dr_zip_reader import (read_zip_parquet_headers, read_zip_manifest, get_zip_staging_dir,
+                           get_cached_zip_headers, put_zip_headers, extract_zip_incremental)
+from glue_catalog import get_glue_catalog_metadata
+from dr_schema_cache import cached_parquet_metadata, get_schema_cache
 
 # logger configuration
 logger = configure_logging()
 
-def unzip_file(input_zip_file: str, output_dir: str) -> bool:
-    """Unzips the specified zip file to the given output directory."""
+def unzip_file(input_zip_file: str, output_dir: str, incremental: bool = False) -> bool:
+    """
+    Unzips the specified zip file to the given output directory.
+
+    With incremental only the members whose CRC32, size or timestamp differ from the files on disk are rewritten;
+    the per-zip staging directories of the DR runs are extracted that way.
+    """
     try:
+        if incremental:
+            extract_zip_incremental(input_zip_file, output_dir)
+            return True
         with zipfile.ZipFile(input_zip_file, 'r') as zip_ref:
             for member in zip_ref.namelist():
                 target_path = os.path.join(output_dir, member)
@@ -30,11 +40,12 @@ def unzip_file(input_zip_file: str, output_dir: str) -> bool:
         logger.error("".join(tb.format()))
         return False
 
-def read_parquet_file_metadata(parquet_file: str) -> dict:
-    """Reads metadata from the specified parquet file."""
+@cached_parquet_metadata('pyarrow')
+def read_parquet_file_metadata(parquet_file: str, source=None) -> dict:
+    """Reads metadata from the specified parquet file, or from an already opened source for it."""
     try:
         parquet_file_name = os.path.basename(parquet_file).split('.parquet')[0]
-        pq_df = pq.read_schema(parquet_file)
+        pq_df = pq.read_schema(parquet_file if source is None else source)
         pq_cols_name_ls = pq_df.names
         metadata = {
             'File_Columns_Names': pq_cols_name_ls,
@@ -53,10 +64,15 @@ def read_parquet_file_metadata(parquet_file: str) -> dict:
         }
 
 def process_zip_file(zip_file: str, output_dr_dir: str) -> dict:
-    """Processes a single zip file: unzips it and reads metadata from contained parquet files."""
+    """Processes a single zip file: stages it in its own directory and reads metadata from the parquet files in its manifest."""
+    file_metadata_dict = get_cached_zip_headers(zip_file, read_parquet_file_metadata)
+    if file_metadata_dict is not None:
+        return file_metadata_dict
+
     file_metadata_dict = {}
-    if unzip_file(zip_file, output_dr_dir):
-        parquet_files = glob(f"{output_dr_dir}/*.parquet")
+    staging_dir = get_zip_staging_dir(zip_file, output_dr_dir)
+    if unzip_file(zip_file, staging_dir, incremental=True):
+        parquet_files = [os.path.join(staging_dir, member) for member in read_zip_manifest(zip_file)]
         with concurrent.futures.ThreadPoolExecutor() as executor:
             future_to_parquet = {
                 executor.submit(read_parquet_file_metadata, file): file
@@ -66,20 +82,31 @@ def process_zip_file(zip_file: str, output_dr_dir: str) -> dict:
                 file = future_to_parquet[future]
                 parquet_file_name, metadata = future.result()
                 file_metadata_dict[parquet_file_name] = metadata
+        put_zip_headers(zip_file, file_metadata_dict, read_parquet_file_metadata)
     return file_metadata_dict
 
-def get_dr_file_header(input_dr_zip_dir: str, output_dr_dir: str) -> dict:
-    """Retrieves metadata for parquet files within zip files in the specified directory."""
+def process_zip_file_in_place(zip_file: str) -> dict:
+    """Processes a single zip file: reads metadata from contained parquet files without extracting them."""
+    return read_zip_parquet_headers(zip_file, read_parquet_file_metadata)
+
+def get_dr_file_header(input_dr_zip_dir: str, output_dr_dir: str, extract_members: bool = True) -> dict:
+    """Retrieves metadata for parquet files within zip files, extracting them only if extract_members is set."""
     try:
         zip_files = glob(f"{input_dr_zip_dir}/*.zip")
         logger.info(f"Found {len(zip_files)} zip files in {input_dr_zip_dir}")
 
         file_metadata_dict = {}
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_to_zip = {
-                executor.submit(process_zip_file, zip_file, output_dr_dir): zip_file
-                for zip_file in zip_files
-            }
+            if extract_members:
+                future_to_zip = {
+                    executor.submit(process_zip_file, zip_file, output_dr_dir): zip_file
+                    for zip_file in zip_files
+                }
+            else:
+                future_to_zip = {
+                    executor.submit(process_zip_file_in_place, zip_file): zip_file
+                    for zip_file in zip_files
+                }
             for future in concurrent.futures.as_completed(future_to_zip):
                 zip_file = future_to_zip[future]
                 try:
@@ -88,63 +115,22 @@ def get_dr_file_header(input_dr_zip_dir: str, output_dr_dir: str) -> dict:
                 except Exception as e:
                     logger.error(f"Error processing zip file: {zip_file}")
                     log_errors(e, detailed_traceback=True)
-        
+
+        if get_schema_cache():
+            get_schema_cache().log_stats()
         return file_metadata_dict
     except Exception as e:
         log_errors(e, detailed_traceback=True)
         return {}
 
-def get_glue_table_metadata(client, db_name: str, table_name: str) -> dict:
-    """Retrieves metadata for a specific Glue table."""
-    table_metadata = {}
-    try:
-        response = client.get_table(DatabaseName=db_name, Name=table_name)
-        if response:
-            tbl_name = response['Table']['Name']
-            if table_name == tbl_name:
-                tbl_cols_names = [col['Name'] for col in response['Table']['StorageDescriptor']['Columns']]
-                table_metadata['Table_Columns_Names'] = tbl_cols_names
-                table_metadata['Table_Columns_Counts'] = len(tbl_cols_names)
-            else:
-                logger.warning(f"Retrieved incorrect metadata for table: {table_name}")
-                table_metadata['Table_Columns_Names'] = []
-                table_metadata['Table_Columns_Counts'] = 0
-        else:
-            logger.warning(f"No response received for Glue table: {db_name}.{table_name}")
-            table_metadata['Table_Columns_Names'] = []
-            table_metadata['Table_Columns_Counts'] = 0
-    except ClientError as e:
-        log_errors(e, detailed_traceback=True)
-        if e.response['Error']['Code'] == 'EntityNotFoundException':
-            logger.error(f"Table does not exist: {db_name}.{table_name}")
-        table_metadata['Table_Columns_Names'] = []
-        table_metadata['Table_Columns_Counts'] = 0
-    except Exception as e:
-        log_errors(e, detailed_traceback=True)
-        table_metadata['Table_Columns_Names'] = []
-        table_metadata['Table_Columns_Counts'] = 0
-    return table_metadata
-
 def get_glue_tbls_metadata(tables_list: list) -> dict:
-    """Retrieves metadata for a list of Glue tables."""
-    client = boto3.client('glue')
-    table_metadata_dict = {}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_table = {
-            executor.submit(get_glue_table_metadata, client, table.split(',')[0].lower(), table.split(',')[1].lower()): table
-            for table in tables_list
-        }
-        for future in concurrent.futures.as_completed(future_to_table):
-            table = future_to_table[future]
-            table_name = table.split(',')[1].lower()
-            try:
-                table_metadata = future.result()
-                table_metadata_dict[table_name] = table_metadata
-            except Exception as e:
-                logger.error(f"Error retrieving metadata for table: {table}")
-                log_errors(e, detailed_traceback=True)
-                table_metadata_dict[table_name] = {'Table_Columns_Names': [], 'Table_Columns_Counts': 0}
-    return table_metadata_dict
+    """
+    Retrieves metadata for a list of Glue tables, pulling each database with paginated get_tables calls.
+
+    :raises GlueFetchError: If a table could not be fetched despite retries; dr_glue_main_process then fails
+        the run rather than comparing the file headers with an empty schema.
+    """
+    return get_glue_catalog_metadata(tables_list)
 
 def compare_glue_tbl_structure(table_list: list, file_md_dict: dict, tbl_md_dict: dict) -> str:
     """Compares Glue table structures with parquet file headers."""
@@ -195,14 +181,14 @@ def compare_glue_tbl_structure(table_list: list, file_md_dict: dict, tbl_md_dict
         logger.error("".join(tb.format()))
         return "FAILED"
 
-def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str) -> dict:
+def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str, extract_members: bool = False) -> dict:
     """Main process to fetch and compare Glue table structures and DR file headers."""
     try:
         with open(f'./config/dr_table_config.txt', 'r') as tbl_cfg_fl:
             table_list = tbl_cfg_fl.read().splitlines()
             if table_list:
                 logger.info(f"Fetching DR Parquet Files Headers.")
-                file_md_dict = get_dr_file_header(dr_zip_file_dir, dr_input_file_dir)
+                file_md_dict = get_dr_file_header(dr_zip_file_dir, dr_input_file_dir, extract_members)
                 logger.info(f"Fetching Glue Tables Metadata.")
                 tbl_md_dict = get_glue_tbls_metadata(table_list)
                 logger.info(f"Comparing the Glue Tables Structure vs Parquet File Header.")
@@ -228,6 +214,7 @@ def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str) -> dict:
 import os
 import pyarrow.parquet as pq
 import logging
+from dr_schema_cache import cached_parquet_metadata
 
 logger = logging.getLogger(__name__)
 
@@ -237,11 +224,12 @@ def log_errors(exception, detailed_traceback=False):
     if detailed_traceback:
         logger.exception(exception)
 
-def read_parquet_file_metadata(parquet_file: str) -> dict:
-    """Reads metadata from the specified parquet file."""
+@cached_parquet_metadata('pyarrow')
+def read_parquet_file_metadata(parquet_file: str, source=None) -> dict:
+    """Reads metadata from the specified parquet file, or from an already opened source for it."""
     try:
         parquet_file_name = os.path.basename(parquet_file).split('.parquet')[0]
-        parquet_file_obj = pq.ParquetFile(parquet_file)
+        parquet_file_obj = pq.ParquetFile(parquet_file if source is None else source)
         pq_cols_name_ls = parquet_file_obj.schema_arrow.names
         metadata = {
             'File_Columns_Names': pq_cols_name_ls,
@@ -263,6 +251,7 @@ def read_parquet_file_metadata(parquet_file: str) -> dict:
 import os
 import logging
 from fastparquet import ParquetFile
+from dr_schema_cache import cached_parquet_metadata
 
 logger = logging.getLogger(__name__)
 
@@ -272,11 +261,12 @@ def log_errors(exception, detailed_traceback=False):
     if detailed_traceback:
         logger.exception(exception)
 
-def read_parquet_file_metadata(parquet_file: str) -> dict:
-    """Reads metadata from the specified parquet file."""
+@cached_parquet_metadata('fastparquet')
+def read_parquet_file_metadata(parquet_file: str, source=None) -> dict:
+    """Reads metadata from the specified parquet file, or from an already opened source for it."""
     try:
         parquet_file_name = os.path.basename(parquet_file).split('.parquet')[0]
-        parquet_file_obj = ParquetFile(parquet_file)
+        parquet_file_obj = ParquetFile(parquet_file if source is None else source)
         pq_cols_name_ls = parquet_file_obj.columns
         metadata = {
             'File_Columns_Names': pq_cols_name_ls,
@@ -310,6 +300,7 @@ def read_parquet_file_metadata(parquet_file: str) -> dict:
 import os
 import logging
 import pandas as pd
+from dr_schema_cache import cached_parquet_metadata
 
 logger = logging.getLogger(__name__)
 
@@ -319,12 +310,13 @@ def log_errors(exception, detailed_traceback=False):
     if detailed_traceback:
         logger.exception(exception)
 
-def read_parquet_file_metadata(parquet_file: str) -> dict:
-    """Reads metadata from the specified parquet file."""
+@cached_parquet_metadata('pandas')
+def read_parquet_file_metadata(parquet_file: str, source=None) -> dict:
+    """Reads metadata from the specified parquet file, or from an already opened source for it."""
     try:
         parquet_file_name = os.path.basename(parquet_file).split('.parquet')[0]
         # Reading just the metadata
-        pq_df = pd.read_parquet(parquet_file, engine='auto', columns=[])
+        pq_df = pd.read_parquet(parquet_file if source is None else source, engine='auto', columns=[])
         pq_cols_name_ls = pq_df.columns.tolist()
         metadata = {
             'File_Columns_Names': pq_cols_name_ls,
@@ -355,6 +347,8 @@ import os
 import glob
 import logging
 import pandas as pd
+from dr_zip_reader import extract_zip_incremental, get_zip_staging_dir, read_zip_manifest
+from dr_schema_cache import cached_parquet_metadata
 
 logger = logging.getLogger(__name__)
 
@@ -364,24 +358,33 @@ def log_errors(exception, detailed_traceback=False):
     if detailed_traceback:
         logger.exception(exception)
 
-def unzip_file(zip_file: str, output_dir: str) -> bool:
-    # Assuming a function to unzip the file
+def unzip_file(zip_file: str, output_dir: str, incremental: bool = False) -> bool:
+    # With incremental, only members whose CRC32, size or timestamp changed are rewritten
     # Returns True if unzipping is successful, False otherwise
     try:
+        if incremental:
+            extract_zip_incremental(zip_file, output_dir)
+            return True
         import zipfile
         with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            for member in zip_ref.namelist():
+                target_path = os.path.join(output_dir, member)
+                if os.path.exists(target_path):
+                    os.remove(target_path)
+                    logger.info(f"Removed existing file: {target_path}")
             zip_ref.extractall(output_dir)
         return True
     except Exception as e:
         log_errors(e, detailed_traceback=True)
         return False
 
-def read_parquet_file_metadata(parquet_file: str) -> dict:
-    """Reads metadata from the specified parquet file."""
+@cached_parquet_metadata('pandas')
+def read_parquet_file_metadata(parquet_file: str, source=None) -> dict:
+    """Reads metadata from the specified parquet file, or from an already opened source for it."""
     try:
         parquet_file_name = os.path.basename(parquet_file).split('.parquet')[0]
         # Reading just the metadata
-        pq_df = pd.read_parquet(parquet_file, engine='auto')
+        pq_df = pd.read_parquet(parquet_file if source is None else source, engine='auto')
         pq_cols_name_ls = pq_df.columns.tolist()
         metadata = {
             'File_Columns_Names': pq_cols_name_ls,
@@ -400,10 +403,11 @@ def read_parquet_file_metadata(parquet_file: str) -> dict:
         }
 
 def process_zip_file(zip_file: str, output_dir: str) -> dict:
-    """Processes a single zip file: unzips it and reads metadata from contained parquet files."""
+    """Processes a single zip file: stages it in its own directory and reads metadata from the parquet files in its manifest."""
     file_metadata_dict = {}
-    if unzip_file(zip_file, output_dir):
-        parquet_files = glob.glob(f"{output_dir}/*.parquet")
+    staging_dir = get_zip_staging_dir(zip_file, output_dir)
+    if unzip_file(zip_file, staging_dir, incremental=True):
+        parquet_files = [os.path.join(staging_dir, member) for member in read_zip_manifest(zip_file)]
         for file in parquet_files:
             parquet_file_name, metadata = read_parquet_file_metadata(file)
             file_metadata_dict[parquet_file_name] = metadata
@@ -0,0 +1,250 @@
+import os
+import queue
+import traceback
+import concurrent.futures
+from glob import glob
+from datetime import datetime
+from aws_utils_func import log_errors, configure_logging
+from dr_zip_reader import (scan_zip_parquet_headers, read_compressed_member_header, read_zip_manifest,
+                           get_zip_staging_dir, get_cached_zip_headers, put_zip_headers)
+from glue_catalog import group_tables_by_database, split_table_config, get_glue_catalog_metadata, get_glue_client
+from dr_schema_cache import get_schema_cache
+from dr_metrics import get_run_metrics, write_run_metrics
+from dr_run_history import record_run_history
+from dr_table_schema import intern_schema
+
+# Logger configuration
+logger = configure_logging()
+
+# Completed work items buffered between the scanning/fetching stages and the comparison stage
+PIPELINE_QUEUE_SIZE = 256
+
+
+def get_report_paths(current_timestamp: str = None) -> tuple:
+    """Returns the summary and details report paths for a comparison run."""
+    current_timestamp = current_timestamp or datetime.now().strftime('%Y%m%d%H%M%S')
+    return (f'./logs/DR_COMP_Summary_Report_{current_timestamp}.txt',
+            f'./logs/DR_COMP_Details_Report_{current_timestamp}.txt')
+
+
+def write_table_comparison(dtl_fl, table: str, file_md_dict: dict, tbl_md_dict: dict) -> tuple:
+    """
+    Compares one configured table with its parquet file header and writes its details report entry.
+
+    :param dtl_fl: Open details report file.
+    :param table: Configured table in the format "database_name,table_name".
+    :param file_md_dict: Metadata dictionary of the parquet files.
+    :param tbl_md_dict: Metadata dictionary of the Glue tables.
+    :return: Tuple of the table name and 'SUCCEEDED' or 'FAILED'.
+    """
+    db_name, table_name = table.split(',')[0].lower(), table.split(',')[1].lower()
+    logger.info(f"Comparing {db_name} - {table_name}")
+
+    dtl_fl.write(f"\n{'-' * 25}| {db_name} - {table_name} |{'-' * 25}\n")
+    dtl_fl.write(f"\tTable Columns Names - {tbl_md_dict[table_name]['Table_Columns_Names']}\n")
+    dtl_fl.write(f"\tTable Columns Counts - {len(tbl_md_dict[table_name]['Table_Columns_Names'])}\n")
+    dtl_fl.write(f"\tFile Columns Names - {file_md_dict[table_name]['File_Columns_Names']}\n")
+    dtl_fl.write(f"\tFile Columns Counts - {len(file_md_dict[table_name]['File_Columns_Names'])}\n")
+
+    file_schema = intern_schema(file_md_dict[table_name]['File_Columns_Names'])
+    table_schema = intern_schema(tbl_md_dict[table_name]['Table_Columns_Names'])
+    # Equal schemas are one interned object; the columns are only walked when the fingerprints match
+    if file_schema == table_schema:
+        logger.info(f'Glue Table Structure validation for {table_name} - Passed')
+        result = 'SUCCEEDED'
+    else:
+        logger.info(f'Glue Table Structure validation for {table_name} - Failed, '
+                    f'differing positions (position, file, table): {file_schema.diff(table_schema)[:10]}')
+        result = 'FAILED'
+
+    dtl_fl.write(f"{'-' * 75}")
+    return table_name, result
+
+
+def write_comparison_summary(sum_fl, comparison_result: dict, file_md_dict: dict, tbl_md_dict: dict) -> str:
+    """Writes the failed and passed tables to the summary report and returns the overall validation result."""
+    failed_tables = [key for key, val in comparison_result.items() if 'FAILED' in val]
+    passed_tables = [key for key, val in comparison_result.items() if 'SUCCEEDED' in val]
+    validation = "FAILED" if failed_tables else "SUCCEEDED"
+
+    if failed_tables:
+        sum_fl.write(f"{'-' * 25}| Failed |{'-' * 25}\n")
+        for idx, item in enumerate(failed_tables, start=1):
+            sum_fl.write(f"{idx}. {item} - FAILED\n")
+            sum_fl.write(
+                f"\tDifference - {set(file_md_dict[item]['File_Columns_Names']) - set(tbl_md_dict[item]['Table_Columns_Names'])}\n")
+
+    if passed_tables:
+        sum_fl.write(f"{'-' * 25}| Passed |{'-' * 25}\n")
+        for idx, item in enumerate(passed_tables, start=1):
+            sum_fl.write(f"{idx}. {item} - PASSED\n")
+    return validation
+
+
+def read_staged_zip_headers(zip_file: str, staging_dir: str, read_metadata) -> dict:
+    """Reads the parquet files of an extracted zip file listed in its manifest and caches them by member."""
+    file_metadata_dict = {}
+    with get_run_metrics().stage('footer_read'):
+        for member in read_zip_manifest(zip_file):
+            parquet_file_name, metadata = read_metadata(os.path.join(staging_dir, member))
+            file_metadata_dict[parquet_file_name] = metadata
+    get_run_metrics().record('footer_read', items=len(file_metadata_dict))
+    put_zip_headers(zip_file, file_metadata_dict, read_metadata)
+    return file_metadata_dict
+
+
+def run_dr_validation_pipeline(table_list: list, dr_zip_file_dir: str, dr_input_file_dir: str, read_metadata,
+                               unzip_file=None, extract_members: bool = False, io_workers: int = None,
+                               cpu_workers: int = None, network_workers: int = None,
+                               queue_size: int = PIPELINE_QUEUE_SIZE, zip_files: list = None) -> str:
+    """
+    Scans the DR zip files, fetches the Glue schemas and compares them as a streaming pipeline.
+
+    Zip scanning runs on a disk I/O pool, footer decompression and parquet reads on a CPU pool and
+    Glue calls on a network pool. Completed work flows through a bounded queue to the calling thread,
+    which writes each table's details entry, in configuration order, as soon as both of its schemas
+    are known. The reports are identical to those of compare_glue_tbl_structure.
+
+    :param table_list: List of tables in the format "database_name,table_name".
+    :param dr_zip_file_dir: Directory containing the zip files.
+    :param dr_input_file_dir: Directory the zip files are staged into when members are extracted.
+    :param read_metadata: Parquet metadata reader decorated with cached_parquet_metadata.
+    :param unzip_file: Callable extracting a zip file into a directory, required when extracting members.
+    :param extract_members: Extract every member to disk first; otherwise only parquet footers are read.
+    :param io_workers: Number of threads scanning or extracting zip files.
+    :param cpu_workers: Number of threads decompressing footers and reading parquet schemas.
+    :param network_workers: Number of threads fetching Glue databases.
+    :param queue_size: Number of completed work items buffered before producers block.
+    :param zip_files: Only read these zip files instead of every zip file in dr_zip_file_dir.
+    :return: 'SUCCEEDED' or 'FAILED'.
+    """
+    results = queue.Queue(maxsize=queue_size)
+    run_metrics = get_run_metrics()
+    with run_metrics.stage('zip_listing'):
+        zip_files = sorted(glob(f"{dr_zip_file_dir}/*.zip") if zip_files is None else zip_files)
+    run_metrics.record('zip_listing', items=len(zip_files))
+    tables_by_db = group_tables_by_database(table_list)
+    logger.info(f"Pipelining {len(zip_files)} zip files and {len(tables_by_db)} Glue databases")
+
+    cpu_pool = concurrent.futures.ThreadPoolExecutor(max_workers=cpu_workers or os.cpu_count())
+    io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=io_workers)
+    network_pool = concurrent.futures.ThreadPoolExecutor(max_workers=network_workers)
+
+    def read_member(zip_file, zip_info):
+        try:
+            parquet_file_name, metadata = read_compressed_member_header(zip_file, zip_info, read_metadata)
+            results.put(('file', {parquet_file_name: metadata}, 0))
+        except Exception as e:
+            logger.error(f"Error reading member {zip_info.filename} of {zip_file}")
+            log_errors(e, detailed_traceback=True)
+            results.put(('file', {}, 0))
+
+    def read_staged(zip_file, staging_dir):
+        try:
+            results.put(('file', read_staged_zip_headers(zip_file, staging_dir, read_metadata), 0))
+        except Exception as e:
+            logger.error(f"Error processing zip file: {zip_file}")
+            log_errors(e, detailed_traceback=True)
+            results.put(('file', {}, 0))
+
+    def scan_zip(zip_file):
+        # The scan result, with the number of CPU tasks it spawns, is queued before those tasks are submitted
+        # so the comparison stage always knows about pending work before it can complete
+        try:
+            if extract_members:
+                cached = get_cached_zip_headers(zip_file, read_metadata)
+                if cached is not None:
+                    results.put(('file', cached, 0))
+                    return
+                staging_dir = get_zip_staging_dir(zip_file, dr_input_file_dir)
+                if not unzip_file(zip_file, staging_dir):
+                    results.put(('file', {}, 0))
+                    return
+                results.put(('file', {}, 1))
+                cpu_pool.submit(read_staged, zip_file, staging_dir)
+            else:
+                file_metadata_dict, compressed_members = scan_zip_parquet_headers(zip_file, read_metadata,
+                                                                                  stored_only=True)
+                results.put(('file', file_metadata_dict, len(compressed_members)))
+                for zip_info in compressed_members:
+                    cpu_pool.submit(read_member, zip_file, zip_info)
+        except Exception as e:
+            logger.error(f"Error processing zip file: {zip_file}")
+            log_errors(e, detailed_traceback=True)
+            results.put(('file', {}, 0))
+
+    def fetch_database(client, db_name, table_names):
+        try:
+            db_metadata = get_glue_catalog_metadata([f"{db_name},{table_name}" for table_name in table_names],
+                                                    client=client)
+        except Exception as e:
+            logger.error(f"Error listing tables of Glue database: {db_name}")
+            log_errors(e, detailed_traceback=True)
+            db_metadata = {}
+        results.put(('glue', (db_name, db_metadata), 0))
+
+    # Every database is fetched through the process-wide client, whose connections stay warm between runs;
+    # the call counters of concurrent fetches only see the requests made in their own context
+    glue_client = get_glue_client()
+    for db_name, table_names in tables_by_db.items():
+        network_pool.submit(fetch_database, glue_client, db_name, table_names)
+    for zip_file in zip_files:
+        io_pool.submit(scan_zip, zip_file)
+
+    file_md_dict, tbl_md_dict = {}, {}
+    fetched_dbs = set()
+    pending = {'file': len(zip_files), 'glue': len(tables_by_db)}
+    comparison_result = {}
+    next_table = 0
+    validation = None
+    summary_file_path, details_file_path = get_report_paths()
+    try:
+        with open(summary_file_path, 'w+') as sum_fl, open(details_file_path, 'w+') as dtl_fl:
+            while validation is None:
+                while next_table < len(table_list):
+                    db_name, table_name = split_table_config(table_list[next_table])
+                    file_ready = table_name in file_md_dict or not pending['file']
+                    if not file_ready or db_name not in fetched_dbs:
+                        break
+                    with run_metrics.stage('compare'):
+                        table_name, result = write_table_comparison(dtl_fl, table_list[next_table], file_md_dict,
+                                                                    tbl_md_dict)
+                    run_metrics.record('compare', items=1)
+                    comparison_result[table_name] = result
+                    dtl_fl.flush()
+                    next_table += 1
+
+                if next_table == len(table_list) and not pending['file'] and not pending['glue']:
+                    with run_metrics.stage('report_write'):
+                        validation = write_comparison_summary(sum_fl, comparison_result, file_md_dict, tbl_md_dict)
+                    run_metrics.record('report_write', items=len(comparison_result))
+                    break
+
+                run_metrics.record_queue_depth('compare', results.qsize())
+                stage, payload, spawned = results.get()
+                pending[stage] += spawned - 1
+                if stage == 'file':
+                    file_md_dict.update(payload)
+                else:
+                    db_name, db_metadata = payload
+                    tbl_md_dict.update(db_metadata)
+                    fetched_dbs.add(db_name)
+        write_run_metrics(summary_file_path)
+        record_run_history(summary_file_path, table_list, comparison_result, file_md_dict, tbl_md_dict, validation)
+    except Exception as e:
+        tb = traceback.TracebackException.from_exception(e, capture_locals=True)
+        logger.error("".join(tb.format()))
+        validation = "FAILED"
+        # Keep draining so that producers blocked on the bounded queue can finish
+        while pending['file'] or pending['glue']:
+            stage, payload, spawned = results.get()
+            pending[stage] += spawned - 1
+    finally:
+        io_pool.shutdown(wait=True)
+        cpu_pool.shutdown(wait=True)
+        network_pool.shutdown(wait=True)
+
+    if get_schema_cache():
+        get_schema_cache().log_stats()
+    logger.info(f"Pipelined comparison of {len(comparison_result)} tables completed: {validation}")
+    return validation
@@ -0,0 +1,157 @@
+import json
+import datetime
+import pyarrow.parquet as pq
+from aws_utils_func import log_errors, configure_logging
+from glue_catalog import split_table_config
+
+try:
+    from oracle import rs_fetchall
+    from dr_reconcile import quote_identifier
+except ImportError:  # Redshift counts are optional; psycopg2/cx_Oracle may not be installed
+    rs_fetchall = None
+
+# Logger configuration
+logger = configure_logging()
+
+
+def get_footer_statistics(file_metadata: pq.FileMetaData) -> dict:
+    """
+    Collects the row count and the null count of every column from a parquet footer.
+
+    Only the footer is read: the null counts of each row group's column chunks are summed, no data page
+    is decoded. Min/max values are not kept, since the validation does not use them and they would be
+    stored with every file's metadata.
+
+    :param file_metadata: Footer of the parquet file, as returned by pq.read_metadata.
+    :return: Dictionary with File_Num_Rows, File_Row_Groups and File_Column_Stats keyed by column path;
+        a column is Complete when every row group recorded its null count.
+    """
+    column_stats = {}
+    for row_group in range(file_metadata.num_row_groups):
+        row_group_metadata = file_metadata.row_group(row_group)
+        for column in range(row_group_metadata.num_columns):
+            column_chunk = row_group_metadata.column(column)
+            stats = column_stats.setdefault(column_chunk.path_in_schema, {'Null_Count': 0, 'Complete': True})
+            statistics = column_chunk.statistics
+            if statistics is None or not statistics.has_null_count:
+                stats['Complete'] = False
+            else:
+                stats['Null_Count'] += statistics.null_count
+    return {
+        'File_Num_Rows': file_metadata.num_rows,
+        'File_Row_Groups': file_metadata.num_row_groups,
+        'File_Column_Stats': column_stats
+    }
+
+
+def fetch_redshift_counts(conn, redshift_table: str, columns: list):
+    """
+    Runs a single COUNT(*), COUNT(column)... aggregate against a Redshift table.
+
+    :param conn: Redshift connection from oracle.get_redshift_conn.
+    :param redshift_table: Table name in the format "schema.table".
+    :param columns: Columns whose non-null values are counted.
+    :return: Tuple of the row count and a dictionary of non-null counts by column, or None if the query failed.
+    """
+    if rs_fetchall is None:
+        logger.warning("Redshift counts are unavailable, the oracle module could not be imported.")
+        return None
+    table = '.'.join(quote_identifier(part) for part in redshift_table.split('.'))
+    counts = ''.join(f', COUNT({quote_identifier(column)})' for column in columns)
+    rows = rs_fetchall(conn, f'SELECT COUNT(*){counts} FROM {table}')
+    if not rows:
+        return None
+    return rows[0][0], dict(zip(columns, rows[0][1:]))
+
+
+def quick_validate_table(table_name: str, file_metadata: dict, table_metadata: dict, conn=None,
+                         redshift_table: str = None) -> dict:
+    """
+    Validates the footer statistics of one parquet file without reading its data pages.
+
+    The file fails when its row count differs from the count recorded in the Glue table parameters, or, given a Redshift connection, from a COUNT(*) of the Redshift table, whose
+    COUNT(column) values are then also checked against the footer null counts.
+
+    :param table_name: Name of the table.
+    :param file_metadata: Metadata read by read_parquet_file_metadata, including the footer statistics.
+    :param table_metadata: Metadata of the Glue table, including Table_Row_Count.
+    :param conn: Optional Redshift connection to count the table with.
+    :param redshift_table: Redshift table in the format "schema.table" the file was loaded into.
+    :return: Dictionary with the validation result, the row counts and the list of problems found.
+    """
+    file_rows = file_metadata.get('File_Num_Rows')
+    expected_rows = table_metadata.get('Table_Row_Count')
+    column_stats = file_metadata.get('File_Column_Stats', {})
+    problems = []
+    result = {'Table': table_name, 'File_Rows': file_rows, 'Expected_Rows': expected_rows,
+              'Expected_Rows_Source': 'Glue' if expected_rows is not None else None}
+
+    if file_rows is None:
+        problems.append("Parquet footer could not be read")
+
+    if conn is not None and redshift_table and file_rows is not None:
+        try:
+            # Nested leaf columns have no Redshift counterpart to count
+            columns = [column for column, stats in column_stats.items() if stats['Complete'] and '.' not in column]
+            counts = fetch_redshift_counts(conn, redshift_table, columns)
+        except Exception as e:
+            log_errors(e, detailed_traceback=True)
+            counts = None
+        if counts is None:
+            problems.append(f"Unable to count rows of Redshift table {redshift_table}")
+        else:
+            expected_rows, non_null_counts = counts
+            result['Expected_Rows'], result['Expected_Rows_Source'] = expected_rows, 'Redshift'
+            for column, non_null_count in non_null_counts.items():
+                file_non_null_count = file_rows - column_stats[column]['Null_Count']
+                if file_non_null_count != non_null_count:
+                    problems.append(f"Column {column} has {file_non_null_count} non-null values in the file "
+                                    f"and {non_null_count} in Redshift")
+
+    # An empty file is only a problem when the table is expected to hold rows; empty DR tables are legitimate
+    if file_rows == 0 and expected_rows:
+        problems.append("Parquet file has no rows")
+    if file_rows is not None and expected_rows is not None and file_rows != expected_rows:
+        problems.append(f"File has {file_rows} rows, {result['Expected_Rows_Source']} expects {expected_rows}")
+    if file_rows:
+        all_null_columns = [column for column, stats in column_stats.items()
+                            if stats['Complete'] and stats['Null_Count'] == file_rows]
+        if all_null_columns:
+            logger.warning(f"{table_name}: columns without any value: {all_null_columns}")
+            result['All_Null_Columns'] = all_null_columns
+
+    result['Problems'] = problems
+    result['Status'] = 'FAILED' if problems else 'SUCCEEDED'
+    return result
+
+
+def quick_validate_tables(table_list: list, file_md_dict: dict, tbl_md_dict: dict, conn=None,
+                          report_file_path: str = None) -> str:
+    """
+    Validates the footer statistics of every configured table and writes a JSON report.
+
+    :param table_list: List of tables in the format "database_name,table_name".
+    :param file_md_dict: Metadata dictionary of the parquet files, including footer statistics.
+    :param tbl_md_dict: Metadata dictionary of the Glue tables.
+    :param conn: Optional Redshift connection; tables are counted as "database_name.table_name".
+    :param report_file_path: Path of the JSON report, by default ./logs/DR_QUICK_Report_<timestamp>.json.
+    :return: 'SUCCEEDED' or 'FAILED'.
+    """
+    results = []
+    for table in table_list:
+        db_name, table_name = split_table_config(table)
+        if table_name not in file_md_dict:
+            results.append({'Table': table_name, 'Status': 'FAILED', 'Problems': ["Parquet file not found"]})
+            continue
+        results.append(quick_validate_table(table_name, file_md_dict[table_name], tbl_md_dict.get(table_name, {}),
+                                            conn, f'{db_name}.{table_name}'))
+
+    failed_tables = [result['Table'] for result in results if result['Status'] == 'FAILED']
+    validation = "FAILED" if failed_tables else "SUCCEEDED"
+    report_file_path = report_file_path or \
+        f"./logs/DR_QUICK_Report_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    with open(report_file_path, 'w') as report_fl:
+        json.dump({"Quick Validation": validation, "Tables": results}, report_fl, indent=2)
+    logger.info(f"Quick validation of {len(results)} tables: {validation}, {len(failed_tables)} failed, "
+                f"report written to {report_file_path}")
+    return validation
@@ -0,0 +1,468 @@
+import os
+import re
+import sys
+import json
+import math
+import argparse
+from glob import glob
+from datetime import datetime
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from aws_utils_func import log_errors, configure_logging, fetch_db_credential
+from oracle import get_redshift_conn, rs_fetchall
+from config import APP_CONFIG
+
+# Logger configuration
+logger = configure_logging()
+
+# Key-range buckets a table is split into at the top level, and sub-buckets each mismatching bucket is split into
+RECONCILE_BUCKET_COUNT = 64
+DRILL_DOWN_FANOUT = 16
+# Mismatching key ranges are no longer split once they hold fewer rows than this, or after this many levels
+MIN_DRILL_DOWN_ROWS = 1000
+MAX_DRILL_DOWN_DEPTH = 4
+# Rows decoded from the parquet file at a time
+RECONCILE_BATCH_SIZE = 128 * 1024
+# Floating point sums are accumulated in a different order on each side
+FLOAT_RELATIVE_TOLERANCE = 1e-9
+# Bucket numbers of the Redshift keys below and above the key range of the parquet file
+BELOW_RANGE_BUCKET = -1
+ABOVE_RANGE_BUCKET = -2
+
+REDSHIFT_IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+
+def get_crc32c_tables() -> np.ndarray:
+    """
+    Returns the slicing-by-4 lookup tables of CRC-32C (Castagnoli), the checksum of the Redshift CRC32 function.
+
+    Table 0 advances a checksum by one byte, and table k by the byte k positions before the end of a 4-byte word.
+    """
+    table = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ np.uint32(0x82F63B78), table >> 1).astype(np.uint32)
+    tables = [table]
+    for _ in range(3):
+        tables.append((tables[-1] >> 8) ^ table[tables[-1] & 0xFF])
+    return np.stack(tables)
+
+
+CRC32C_TABLES = get_crc32c_tables()
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes a Redshift schema, table or column name, rejecting anything that is not a plain identifier."""
+    if not REDSHIFT_IDENTIFIER_PATTERN.match(name):
+        raise ValueError(f"Invalid Redshift identifier: {name}")
+    return f'"{name.lower()}"'
+
+
+def get_aggregate_specs(schema: pa.Schema, key_column: str) -> list:
+    """
+    Chooses the order-independent aggregates computed for every column of a table on both sides.
+
+    Numeric columns are summed, integers exactly as decimals. Strings contribute their total byte length
+    and the sum of the CRC-32C of their UTF-8 bytes, so a value changed to another of the same length is
+    still caught. Booleans contribute their number of true values and temporal columns their earliest and
+    latest epoch value. Every column also contributes its non-null count.
+
+    :param schema: Arrow schema of the parquet file.
+    :param key_column: Integer column the table is bucketed on.
+    :return: List of (aggregate name, kind, column name) tuples.
+    """
+    specs = []
+    for field in schema:
+        if field.name == key_column:
+            continue
+        kinds = ['count']
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_decimal(field.type):
+            kinds.append('sum')
+        elif pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            kinds.extend(['sum_length', 'sum_crc32'])
+        elif pa.types.is_boolean(field.type):
+            kinds.append('sum_true')
+        elif pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+            kinds.extend(['min_epoch', 'max_epoch'])
+        specs.extend((f'{field.name}_{kind}', kind, field.name) for kind in kinds)
+    return specs
+
+
+def get_epoch_array(array: pa.Array) -> pa.Array:
+    """Converts a timestamp array to epoch seconds and a date array to epoch days."""
+    if pa.types.is_timestamp(array.type):
+        return pc.cast(pc.cast(array, pa.timestamp('s', tz=array.type.tz), safe=False), pa.int64())
+    return pc.cast(pc.cast(array, pa.date32()), pa.int32()).cast(pa.int64())
+
+
+def get_crc32c_array(array: pa.Array) -> pa.Array:
+    """
+    Computes the CRC-32C of every value of a string array, as Redshift's CRC32 does, with null for null values.
+
+    Values are grouped by byte length and each group is laid out as a matrix with one row per value, so the
+    checksums of a group advance together four bytes per step, without a Python call per value.
+    """
+    array = array.cast(pa.large_binary())
+    offsets = np.frombuffer(array.buffers()[1], dtype=np.int64)[array.offset:array.offset + len(array) + 1]
+    data = np.frombuffer(array.buffers()[2], dtype=np.uint8) if array.buffers()[2] is not None else \
+        np.empty(0, dtype=np.uint8)
+    starts = offsets[:-1]
+    lengths = offsets[1:] - starts
+    crc = np.full(len(array), 0xFFFFFFFF, dtype=np.uint32)
+    by_length = np.argsort(lengths, kind='stable')
+    for group in np.split(by_length, np.flatnonzero(np.diff(lengths[by_length])) + 1):
+        length = int(lengths[group[0]]) if group.size else 0
+        if not length:
+            continue
+        values = data[starts[group, None] + np.arange(length)]
+        group_crc = crc[group]
+        word_count = length // 4
+        if word_count:
+            words = np.ascontiguousarray(values[:, :word_count * 4]).view('<u4')
+            for word in range(word_count):
+                group_crc = group_crc ^ words[:, word]
+                group_crc = CRC32C_TABLES[3][group_crc & 0xFF] ^ CRC32C_TABLES[2][(group_crc >> 8) & 0xFF] ^ \
+                    CRC32C_TABLES[1][(group_crc >> 16) & 0xFF] ^ CRC32C_TABLES[0][group_crc >> 24]
+        for position in range(word_count * 4, length):
+            group_crc = CRC32C_TABLES[0][(group_crc ^ values[:, position]) & 0xFF] ^ (group_crc >> 8)
+        crc[group] = group_crc
+    crc ^= np.uint32(0xFFFFFFFF)
+    return pa.array(crc.astype(np.int64), mask=array.is_null().to_numpy(zero_copy_only=False))
+
+
+def get_aggregate_input(array: pa.Array, kind: str) -> tuple:
+    """Returns the array and pyarrow hash aggregate computing one aggregate kind."""
+    if kind == 'count':
+        return array, 'count'
+    if kind == 'sum':
+        if pa.types.is_integer(array.type):
+            # int64 sums of a batch can overflow, and pyarrow wraps them silently
+            return pc.cast(array, pa.decimal128(38, 0)), 'sum'
+        return array, 'sum'
+    if kind == 'sum_length':
+        return pc.cast(pc.binary_length(array), pa.int64()), 'sum'
+    if kind == 'sum_crc32':
+        return get_crc32c_array(array), 'sum'
+    if kind == 'sum_true':
+        return pc.cast(array, pa.int64()), 'sum'
+    return get_epoch_array(array), 'min' if kind == 'min_epoch' else 'max'
+
+
+def get_sql_aggregate(kind: str, column: str, data_type: pa.DataType) -> str:
+    """Returns the Redshift expression computing one aggregate kind."""
+    column = quote_identifier(column)
+    if kind == 'count':
+        return f'COUNT({column})'
+    if kind == 'sum':
+        # Redshift sums integers as BIGINT, which can overflow
+        return f'SUM({column}::DECIMAL(38,0))' if pa.types.is_integer(data_type) else f'SUM({column})'
+    if kind == 'sum_length':
+        return f'SUM(OCTET_LENGTH({column}))'
+    if kind == 'sum_crc32':
+        return f'SUM(STRTOL(CRC32({column}), 16)::DECIMAL(38,0))'
+    if kind == 'sum_true':
+        return f'SUM(CASE WHEN {column} THEN 1 ELSE 0 END)'
+    unit = 'second' if pa.types.is_timestamp(data_type) else 'day'
+    function = 'MIN' if kind == 'min_epoch' else 'MAX'
+    return f"{function}(DATEDIFF({unit}, '1970-01-01', {column}))"
+
+
+def merge_aggregate(kind: str, current, value):
+    """Folds the aggregate of one batch into the running aggregate of a bucket."""
+    if current is None:
+        return value
+    if value is None:
+        return current
+    if kind == 'min_epoch':
+        return min(current, value)
+    if kind == 'max_epoch':
+        return max(current, value)
+    return current + value
+
+
+def get_key_range(parquet_file: pq.ParquetFile, key_column: str) -> tuple:
+    """Returns the smallest and largest key of a parquet file from its row group statistics."""
+    key_index = parquet_file.schema_arrow.get_field_index(key_column)
+    min_key, max_key = None, None
+    for row_group in range(parquet_file.metadata.num_row_groups):
+        statistics = parquet_file.metadata.row_group(row_group).column(key_index).statistics
+        if statistics is None or not statistics.has_min_max:
+            keys = parquet_file.read_row_group(row_group, columns=[key_column]).column(0)
+            row_group_min, row_group_max = pc.min_max(keys).values()
+            row_group_min, row_group_max = row_group_min.as_py(), row_group_max.as_py()
+        else:
+            row_group_min, row_group_max = statistics.min, statistics.max
+        if row_group_min is not None:
+            min_key = row_group_min if min_key is None else min(min_key, row_group_min)
+            max_key = row_group_max if max_key is None else max(max_key, row_group_max)
+    return min_key, max_key
+
+
+def get_overlapping_row_groups(parquet_file: pq.ParquetFile, key_column: str, low_key: int, high_key: int) -> list:
+    """Lists the row groups whose key statistics overlap a key range, so the others are never decoded."""
+    key_index = parquet_file.schema_arrow.get_field_index(key_column)
+    row_groups = []
+    for row_group in range(parquet_file.metadata.num_row_groups):
+        statistics = parquet_file.metadata.row_group(row_group).column(key_index).statistics
+        if statistics is not None and statistics.has_min_max and \
+                (statistics.max < low_key or statistics.min > high_key):
+            continue
+        row_groups.append(row_group)
+    return row_groups
+
+
+def compute_parquet_buckets(parquet_file: pq.ParquetFile, key_column: str, specs: list, low_key: int,
+                            high_key: int, width: int, batch_size: int = RECONCILE_BATCH_SIZE,
+                            include_null_keys: bool = False) -> dict:
+    """
+    Computes the row count and aggregates of each key-range bucket of a parquet file, one batch at a time.
+
+    :param parquet_file: Open parquet file.
+    :param key_column: Integer column the table is bucketed on.
+    :param specs: Aggregates to compute, as returned by get_aggregate_specs.
+    :param low_key: First key of bucket 0; rows below it are not read.
+    :param high_key: Last key of the range; rows above it are not read.
+    :param width: Number of keys per bucket.
+    :param batch_size: Number of rows decoded at a time.
+    :param include_null_keys: Aggregate the rows with a null key into bucket None, as Redshift does when
+        the range is not bounded.
+    :return: Dictionary of bucket number to [row count, aggregate values...].
+    """
+    columns = [key_column] + sorted({column for _, _, column in specs})
+    row_groups = get_overlapping_row_groups(parquet_file, key_column, low_key, high_key)
+    buckets = {}
+    if not row_groups:
+        return buckets
+    for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=columns):
+        keys = batch.column(key_column)
+        in_range = pc.and_kleene(pc.greater_equal(keys, low_key), pc.less_equal(keys, high_key))
+        if include_null_keys:
+            in_range = pc.or_kleene(pc.is_null(keys), in_range)
+        batch = batch.filter(in_range)
+        if not batch.num_rows:
+            continue
+        arrays = {'bucket': pc.divide(pc.subtract(batch.column(key_column), low_key), width)}
+        aggregations = [([], 'count_all')]
+        for name, kind, column in specs:
+            arrays[name], function = get_aggregate_input(batch.column(column), kind)
+            aggregations.append((name, function))
+        aggregated = pa.table(arrays).group_by('bucket').aggregate(aggregations)
+        for row in aggregated.to_pylist():
+            bucket = buckets.setdefault(row['bucket'], [0] + [None] * len(specs))
+            bucket[0] += row['count_all']
+            for idx, (name, kind, _) in enumerate(specs, start=1):
+                value = row[f'{name}_{aggregations[idx][1]}']
+                bucket[idx] = merge_aggregate(kind, bucket[idx], value)
+    return buckets
+
+
+def compute_redshift_buckets(conn, redshift_table: str, key_column: str, specs: list, schema: pa.Schema,
+                             low_key: int, high_key: int, width: int, bounded: bool = True) -> dict:
+    """
+    Computes the same bucket aggregates server-side in Redshift, so that no row crosses the network.
+
+    :param conn: Redshift connection from oracle.get_redshift_conn.
+    :param redshift_table: Table name in the format "schema.table".
+    :param key_column: Integer column the table is bucketed on.
+    :param specs: Aggregates to compute, as returned by get_aggregate_specs.
+    :param schema: Arrow schema of the parquet file, used to pick the epoch unit of temporal columns.
+    :param low_key: First key of bucket 0.
+    :param high_key: Last key of the range.
+    :param width: Number of keys per bucket.
+    :param bounded: Only aggregate keys within the range; otherwise keys below it fall into bucket
+        BELOW_RANGE_BUCKET, keys above it into ABOVE_RANGE_BUCKET and null keys into bucket None.
+    :return: Dictionary of bucket number to [row count, aggregate values...], or None if the query failed.
+    """
+    key = quote_identifier(key_column)
+    table = '.'.join(quote_identifier(part) for part in redshift_table.split('.'))
+    aggregates = ''.join(f', {get_sql_aggregate(kind, column, schema.field(column).type)}'
+                         for _, kind, column in specs)
+    query = (f'SELECT CASE WHEN {key} < %(low_key)s THEN {BELOW_RANGE_BUCKET} '
+             f'WHEN {key} > %(high_key)s THEN {ABOVE_RANGE_BUCKET} '
+             f'ELSE ({key} - %(low_key)s) / %(width)s END AS bucket, COUNT(*){aggregates} FROM {table}')
+    if bounded:
+        query += f' WHERE {key} BETWEEN %(low_key)s AND %(high_key)s'
+    query += ' GROUP BY 1'
+    rows = rs_fetchall(conn, query, low_key=low_key, high_key=high_key, width=width)
+    if rows is None:
+        return None
+    return {row[0]: list(row[1:]) for row in rows}
+
+
+def is_aggregate_equal(file_value, redshift_value) -> bool:
+    """Compares one aggregate of both sides, allowing for rounding in floating point sums."""
+    if file_value is None or redshift_value is None:
+        return file_value is None and redshift_value is None
+    if isinstance(file_value, float) or isinstance(redshift_value, float):
+        return math.isclose(float(file_value), float(redshift_value), rel_tol=FLOAT_RELATIVE_TOLERANCE)
+    return file_value == redshift_value
+
+
+def get_mismatched_buckets(file_buckets: dict, redshift_buckets: dict) -> list:
+    """Lists the buckets whose row count or aggregates differ between the parquet file and Redshift."""
+    mismatched = []
+    for bucket in sorted(set(file_buckets) | set(redshift_buckets), key=lambda value: (value is None, value)):
+        file_values = file_buckets.get(bucket)
+        redshift_values = redshift_buckets.get(bucket)
+        if file_values is None or redshift_values is None or \
+                not all(map(is_aggregate_equal, file_values, redshift_values)):
+            mismatched.append(bucket)
+    return mismatched
+
+
+def get_bucket_range(bucket, low_key: int, high_key: int, width: int) -> tuple:
+    """Returns the first and last key of a bucket, None standing for an unbounded side."""
+    if bucket is None:
+        return None, None
+    if bucket == BELOW_RANGE_BUCKET:
+        return None, low_key - 1
+    if bucket == ABOVE_RANGE_BUCKET:
+        return high_key + 1, None
+    bucket_low = low_key + bucket * width
+    return bucket_low, min(bucket_low + width - 1, high_key)
+
+
+def reconcile_key_range(parquet_file: pq.ParquetFile, conn, redshift_table: str, key_column: str, specs: list,
+                        low_key: int, high_key: int, depth: int = 0, bucket_count: int = RECONCILE_BUCKET_COUNT,
+                        max_depth: int = MAX_DRILL_DOWN_DEPTH) -> list:
+    """
+    Compares a key range bucket by bucket and drills into the mismatching buckets only.
+
+    :return: List of mismatching key ranges with the row counts of both sides.
+    """
+    width = max(1, math.ceil((high_key - low_key + 1) / bucket_count))
+    file_buckets = compute_parquet_buckets(parquet_file, key_column, specs, low_key, high_key, width,
+                                           include_null_keys=depth == 0)
+    redshift_buckets = compute_redshift_buckets(conn, redshift_table, key_column, specs, parquet_file.schema_arrow,
+                                                low_key, high_key, width, bounded=depth > 0)
+    if redshift_buckets is None:
+        raise RuntimeError(f"Unable to aggregate {redshift_table} between keys {low_key} and {high_key}")
+
+    mismatched_ranges = []
+    for bucket in get_mismatched_buckets(file_buckets, redshift_buckets):
+        bucket_low, bucket_high = get_bucket_range(bucket, low_key, high_key, width)
+        file_rows = file_buckets.get(bucket, [0])[0]
+        redshift_rows = redshift_buckets.get(bucket, [0])[0]
+        can_split = bucket_low is not None and bucket_high is not None and bucket_high > bucket_low
+        if can_split and depth + 1 < max_depth and max(file_rows, redshift_rows) > MIN_DRILL_DOWN_ROWS:
+            mismatched_ranges.extend(reconcile_key_range(parquet_file, conn, redshift_table, key_column, specs,
+                                                         bucket_low, bucket_high, depth + 1, DRILL_DOWN_FANOUT,
+                                                         max_depth))
+        else:
+            mismatched_ranges.append({'Key_From': bucket_low, 'Key_To': bucket_high,
+                                      'File_Rows': file_rows, 'Redshift_Rows': redshift_rows})
+    return mismatched_ranges
+
+
+def reconcile_table(parquet_file_path: str, conn, redshift_table: str, key_column: str,
+                    bucket_count: int = RECONCILE_BUCKET_COUNT, max_depth: int = MAX_DRILL_DOWN_DEPTH) -> dict:
+    """
+    Reconciles the rows of a DR parquet file with its Redshift table without pulling rows across the network.
+
+    The table is split into key-range buckets of an integer key column. Row counts and order-independent
+    aggregates of every column are computed per bucket with pyarrow over the parquet row groups, and with
+    the same aggregates server-side in Redshift; only mismatching buckets are split further.
+
+    :param parquet_file_path: Path to the parquet file.
+    :param conn: Redshift connection from oracle.get_redshift_conn.
+    :param redshift_table: Table name in the format "schema.table".
+    :param key_column: Integer column the table is bucketed on.
+    :param bucket_count: Number of top-level buckets.
+    :param max_depth: Number of levels mismatching buckets are split into at most.
+    :return: Reconciliation result with the mismatching key ranges.
+    """
+    result = {'Table': redshift_table, 'Parquet_File': parquet_file_path, 'Key_Column': key_column,
+              'File_Rows': None, 'Mismatched_Ranges': [], 'Status': 'FAILED'}
+    try:
+        parquet_file = pq.ParquetFile(parquet_file_path)
+        key_type = parquet_file.schema_arrow.field(key_column).type
+        if not pa.types.is_integer(key_type):
+            raise ValueError(f"Key column {key_column} of {parquet_file_path} is {key_type}, not an integer")
+        result['File_Rows'] = parquet_file.metadata.num_rows
+        specs = get_aggregate_specs(parquet_file.schema_arrow, key_column)
+        low_key, high_key = get_key_range(parquet_file, key_column)
+        if low_key is None:
+            low_key, high_key = 0, 0
+        result['Mismatched_Ranges'] = reconcile_key_range(parquet_file, conn, redshift_table, key_column, specs,
+                                                          low_key, high_key, 0, bucket_count, max_depth)
+        result['Status'] = 'FAILED' if result['Mismatched_Ranges'] else 'SUCCEEDED'
+        logger.info(f"Data reconciliation for {redshift_table} - {result['Status']} "
+                    f"({len(result['Mismatched_Ranges'])} mismatching key ranges)")
+    except Exception as e:
+        logger.error(f"Unable to reconcile {parquet_file_path} with {redshift_table}")
+        log_errors(e, detailed_traceback=True)
+        result['Status'] = 'ERROR'
+    return result
+
+
+def find_parquet_file(dr_input_file_dir: str, table_name: str):
+    """Finds the extracted parquet file of a table, searching the per-zip staging directories too."""
+    matches = glob(os.path.join(dr_input_file_dir, '**', f'{table_name}.parquet'), recursive=True)
+    return matches[0] if matches else None
+
+
+def reconcile_dr_tables(dr_input_file_dir: str, conn_str: dict,
+                        config_file: str = './config/dr_reconcile_config.txt') -> dict:
+    """
+    Reconciles every table listed in the reconcile config with Redshift and writes a JSON report.
+
+    Each config line has the format "redshift_schema,table_name,key_column".
+
+    :param dr_input_file_dir: Directory the DR parquet files were extracted to.
+    :param conn_str: Redshift connection settings for oracle.get_redshift_conn.
+    :param config_file: Path to the reconcile config.
+    :return: Dictionary with the overall result and the result of every table.
+    """
+    with open(config_file, 'r') as cfg_fl:
+        table_configs = [line.split(',') for line in cfg_fl.read().splitlines() if line.strip()]
+
+    conn = get_redshift_conn(conn_str)
+    if conn is None:
+        return {"Data Reconciliation": "FAILED", "Tables": []}
+    # Every query stands alone, so that a failed aggregate does not abort the transaction of the next tables
+    conn.autocommit = True
+    try:
+        results = []
+        for schema_name, table_name, key_column in table_configs:
+            parquet_file_path = find_parquet_file(dr_input_file_dir, table_name)
+            if parquet_file_path is None:
+                logger.error(f"Parquet file not found for table: {table_name}")
+                results.append({'Table': f'{schema_name}.{table_name}', 'Status': 'ERROR'})
+                continue
+            results.append(reconcile_table(parquet_file_path, conn, f'{schema_name}.{table_name}', key_column))
+    finally:
+        conn.close()
+
+    validation = "SUCCEEDED" if all(result['Status'] == 'SUCCEEDED' for result in results) else "FAILED"
+    report_file_path = f"./logs/DR_RECON_Report_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    with open(report_file_path, 'w') as report_fl:
+        json.dump({"Data Reconciliation": validation, "Tables": results}, report_fl, indent=2, default=str)
+    logger.info(f"Data reconciliation result: {validation}, report written to {report_file_path}")
+    return {"Data Reconciliation": validation, "Tables": results}
+
+
+def main(argv: list = None) -> int:
+    """Command line entry point for the DR data reconciliation with Redshift."""
+    parser = argparse.ArgumentParser(description="Reconcile the rows of extracted DR parquet files with Redshift.")
+    parser.add_argument('dr_input_file_dir', help="Directory the DR parquet files were extracted to.")
+    parser.add_argument('--config-file', default='./config/dr_reconcile_config.txt',
+                        help="Reconcile config, one \"redshift_schema,table_name,key_column\" line per table.")
+    parser.add_argument('--redshift-secret-name',
+                        default=APP_CONFIG.get('AWS_Secret_Name', {}).get('Redshift_Secret_Name'),
+                        help="Secrets Manager secret holding the Redshift dbname, username, host, password and port.")
+    args = parser.parse_args(argv)
+    if not args.redshift_secret_name:
+        parser.error("--redshift-secret-name is required when APP_CONFIG has no Redshift_Secret_Name.")
+
+    conn_str = fetch_db_credential(APP_CONFIG.get('App_Short_Name'), args.redshift_secret_name)
+    if not conn_str:
+        logger.error(f"Unable to fetch the Redshift credentials from secret {args.redshift_secret_name}")
+        return 1
+    result = reconcile_dr_tables(args.dr_input_file_dir, conn_str, args.config_file)
+    logger.info(f"DR data reconciliation result: {result['Data Reconciliation']}")
+    return 0 if result["Data Reconciliation"] == "SUCCEEDED" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,106 +1,9 @@
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <title>Test Automation Report</title>
-    <style>
-        :root {{
-            --success-color: #4CAF50;
-            --fail-color: #F44336;
-            --not-run-color: #FF9800;
-            --error-color: #F44336;
-            --not-required-color: #607D8B;
-            --background-color: #f2f2f2;
-        }}
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            margin: 20px;
-        }}
-        h1 {{
-            text-align: center;
-        }}
-        .report-container {{
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(320px, 1fr));
-            gap: 20px;
-        }}
-        .report-item {{
-            border: 1px solid #ddd;
-            padding: 1em;
-            margin-top: 10px;
-            border-radius: 5px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            overflow: hidden;
-        }}
-        .report-item h2 {{
-            font-size: 20px;
-            padding: 0.1em;
-            text-align: center;
-        }}
-        .status {{
-            padding: 5px 10px;
-            color: white;
-            border-radius: 4px;
-            margin-top: 5px;
-            margin-right: 10px;
-            white-space: nowrap;
-            text-align: center;
-        }}
-        .succeeded {{ background-color: var(--success-color); }}
-        .failed {{ background-color: var(--fail-color); }}
-        .not-run {{ background-color: var(--not-run-color); }}
-        .error {{ background-color: var(--error-color); }}
-        .not-required {{ background-color: var(--not-required-color); }}
-        .metadata {{
-            margin-top: 20px;
-            background: var(--background-color);
-            padding: 10px;
-            border-radius: 4px;
-        }}
-        .explanation {{
-            margin-top: 20px;
-            font-style: italic;
-        }}
-        .chart-container {{
-            width: 80%;
-            height: 80%;
-            max-width: 4in;
-            max-height: 4in;
-            margin: auto;
-            text-align: center;
-        }}
-        .chart-container h2 {{
-            text-align: center;
-            font-size: 20px;
-        }}
-    </style>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-</head>
-<body>
-    <h1>{{test_name}}</h1>
-    <div class="metadata">
-        <p>Environment: {{environment}}</p>
-        <p>Test Execution Timestamp: {{timestamp}}</p>
-    </div>
-    <div class="report-container">
-        {{rows}}
-    </div>
-    {{multievent_explanation}}
-    <script>
-        {{chart_script}}
-    </script>
-</body>
-</html>
-
-
-
-
-
-
-
+import json
+import string
 import logging
+import threading
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Iterator, List, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -114,6 +17,50 @@ status_classes = {
     'not_required': 'not-required'
 }
 
+# Template of the HTML reports, relative to the working directory
+HTML_TEMPLATE_PATH = "test_reports/dr_html_report.html"
+
+# Steps per JSON result chunk of a streamed report; the page fetches one chunk at a time as it is scrolled
+RESULT_CHUNK_SIZE = 1000
+
+
+class CompiledTemplate:
+    """
+    HTML template parsed once into its literal text and str.format placeholders.
+
+    Rendering yields the literal segments and the placeholder values in order instead of building the page
+    as one string, so a value may itself be an iterable of chunks that is streamed as it is produced.
+    """
+
+    def __init__(self, template: str):
+        # Formatter.parse unescapes the doubled braces of the styles and scripts exactly like str.format
+        self.segments = [(literal_text, field_name)
+                         for literal_text, field_name, _, _ in string.Formatter().parse(template)]
+
+    def render(self, **values) -> Iterator[str]:
+        """Yield the page chunk by chunk; each value is either a string or an iterable of strings."""
+        for literal_text, field_name in self.segments:
+            if literal_text:
+                yield literal_text
+            if field_name is not None:
+                value = values[field_name]
+                if isinstance(value, str):
+                    yield value
+                else:
+                    yield from value
+
+    def write(self, output_file, **values) -> int:
+        """Stream the rendered page into an open text file and return the number of characters written."""
+        written = 0
+        for chunk in self.render(**values):
+            written += output_file.write(chunk)
+        return written
+
+
+# Compiled templates by path, recompiled when their file changes on disk
+compiled_templates = {}
+compiled_templates_lock = threading.Lock()
+
 def read_html_file(html_file_path: Path) -> str:
     """Read the HTML template file and return its content as a string."""
     try:
@@ -126,6 +73,22 @@ def read_html_file(html_file_path: Path) -> str:
         logging.error(f"Error reading HTML file: {e}")
         raise
 
+def get_compiled_template(html_file_path: Path) -> CompiledTemplate:
+    """Return the compiled HTML template, reading and compiling it only on first use or after it changed."""
+    try:
+        modified_at = html_file_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        logging.error(f"HTML file not found: {html_file_path}")
+        raise
+    with compiled_templates_lock:
+        cached = compiled_templates.get(html_file_path)
+        if cached is not None and cached[0] == modified_at:
+            return cached[1]
+    html_template = CompiledTemplate(read_html_file(html_file_path))
+    with compiled_templates_lock:
+        compiled_templates[html_file_path] = modified_at, html_template
+    return html_template
+
 def create_chart_script(test_passed: int, test_failed: int) -> str:
     """Create JavaScript for rendering the chart in the HTML report."""
     return f"""
@@ -167,7 +130,9 @@ def create_chart_script(test_passed: int, test_failed: int) -> str:
 def generate_html_report(test_results: Dict[str, Dict[str, str]], 
                          current_timestamp: str, 
                          test_environment: str, 
-                         result_count: Tuple[int, int] = None) -> str:
+                         result_count: Tuple[int, int] = None,
+                         stage_metrics: List[Dict] = None,
+                         run_trends: Dict[str, List[Dict]] = None) -> str:
     """
     Generate an HTML report for the test automation results.
 
@@ -175,34 +140,38 @@ def generate_html_report(test_results: Dict[str, Dict[str, str]],
     :param current_timestamp: Timestamp of the test execution
     :param test_environment: Environment in which the tests were run
     :param result_count: Tuple containing the count of passed and failed tests
+    :param stage_metrics: Stage metrics of the DR comparison run, as stored in its metrics sidecar
+    :param run_trends: Daily failures and stage runtimes, as loaded by dr_run_history.RunHistory.load_run_trends
     :return: Generated HTML report as a string
     """
     try:
-        html_file_path = Path("test_reports/dr_html_report.html").resolve()
-        html_template = read_html_file(html_file_path)
-        
-        rows, multievent_explanation, chart_script = "", "", ""
+        html_template = get_compiled_template(Path(HTML_TEMPLATE_PATH).resolve())
+
+        rows, multievent_explanation, chart_script = [], "", ""
         test_passed, test_failed = result_count if result_count else (0, 0)
 
         for event, results in test_results.items():
-            row = create_report_item(event, results)
+            rows.append(create_report_item(event, results))
             if event == 'gluecompare':
-                row += create_chart_container()
+                rows.append(create_chart_container())
                 chart_script = create_chart_script(test_passed, test_failed)
-            rows += row
             if event == "multievent":
-                multievent_explanation = ("<div class='explanation'>The 'multievent' encompasses scenarios: mismatch, "
-                                          "scanned, and missingfile.</div>")
+                multievent_explanation = create_multievent_explanation()
+        if stage_metrics:
+            rows.append(create_timing_panel(stage_metrics))
+        if run_trends:
+            rows.append(create_trend_panel())
+            chart_script += create_trend_chart_script(run_trends)
 
-        # Ensure the HTML template placeholders are correctly formatted
-        return html_template.format(
+        return "".join(html_template.render(
             test_name='DR Test Automation Report',
             timestamp=current_timestamp,
             rows=rows,
             environment=test_environment,
             multievent_explanation=multievent_explanation,
-            chart_script=chart_script
-        )
+            chart_script=chart_script,
+            results_script=""
+        ))
     except KeyError as e:
         logging.error(f"KeyError encountered: {e}")
         raise
@@ -210,14 +179,179 @@ def generate_html_report(test_results: Dict[str, Dict[str, str]],
         logging.error(f"Error generating HTML report: {e}")
         raise
 
+def write_html_report(output_path: Path,
+                      test_results: Dict[str, Dict[str, str]],
+                      current_timestamp: str,
+                      test_environment: str,
+                      result_count: Tuple[int, int] = None,
+                      stage_metrics: List[Dict] = None,
+                      chunk_size: int = RESULT_CHUNK_SIZE,
+                      run_trends: Dict[str, List[Dict]] = None) -> Path:
+    """
+    Stream an HTML report for a large result set straight to a file.
+
+    The steps are not inlined: they are written to paginated JSON chunks in a "<report name>_results"
+    directory next to the page, and each event gets a card with its step counts per status that the page
+    fills in, one chunk at a time, as its end is scrolled into view. Browsers only fetch the chunks when
+    the report is served over HTTP, not opened from the local file system.
+
+    :param output_path: Path of the HTML page to write
+    :param test_results: Dictionary containing test events and their results
+    :param current_timestamp: Timestamp of the test execution
+    :param test_environment: Environment in which the tests were run
+    :param result_count: Tuple containing the count of passed and failed tests
+    :param stage_metrics: Stage metrics of the DR comparison run, as stored in its metrics sidecar
+    :param chunk_size: Steps per JSON result chunk
+    :param run_trends: Daily failures and stage runtimes, as loaded by dr_run_history.RunHistory.load_run_trends
+    :return: Path of the HTML page written
+    """
+    try:
+        html_template = get_compiled_template(Path(HTML_TEMPLATE_PATH).resolve())
+        output_path = Path(output_path)
+        chunk_dir = output_path.with_name(f"{output_path.stem}_results")
+        events, step_counts, chunk_count = write_result_chunks(test_results, chunk_dir, chunk_size)
+
+        test_passed, test_failed = result_count if result_count else (0, 0)
+        chart_script = create_chart_script(test_passed, test_failed) if 'gluecompare' in events else ""
+        multievent_explanation = create_multievent_explanation() if 'multievent' in events else ""
+        if run_trends:
+            chart_script += create_trend_chart_script(run_trends)
+        with output_path.open('w', encoding='utf-8') as output_file:
+            html_template.write(
+                output_file,
+                test_name='DR Test Automation Report',
+                timestamp=current_timestamp,
+                rows=iter_event_cards(events, step_counts, stage_metrics, run_trends),
+                environment=test_environment,
+                multievent_explanation=multievent_explanation,
+                chart_script=chart_script,
+                results_script=create_results_script(chunk_dir.name, chunk_count)
+            )
+        logging.info(f"Wrote {output_path} with {sum(map(sum, (counts.values() for counts in step_counts)))} steps "
+                     f"in {chunk_count} result chunks")
+        return output_path
+    except KeyError as e:
+        logging.error(f"KeyError encountered: {e}")
+        raise
+    except Exception as e:
+        logging.error(f"Error writing HTML report: {e}")
+        raise
+
+def write_result_chunks(test_results: Dict[str, Dict[str, str]], chunk_dir: Path,
+                        chunk_size: int) -> Tuple[List[str], List[Dict[str, int]], int]:
+    """
+    Write the steps of every event to numbered JSON chunks of [event index, step, status] rows.
+
+    :return: The events, their step counts per status, and the number of chunks written
+    """
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    for stale_chunk in chunk_dir.glob('chunk_*.json'):
+        stale_chunk.unlink()
+    events, step_counts, chunk = [], [], []
+    chunk_count = 0
+    for event_index, (event, results) in enumerate(test_results.items()):
+        events.append(event)
+        counts = {}
+        for step, status in results.items():
+            counts[status] = counts.get(status, 0) + 1
+            chunk.append([event_index, step, status])
+            if len(chunk) >= chunk_size:
+                write_result_chunk(chunk_dir, chunk_count, chunk)
+                chunk_count += 1
+                chunk = []
+        step_counts.append(counts)
+    if chunk:
+        write_result_chunk(chunk_dir, chunk_count, chunk)
+        chunk_count += 1
+    return events, step_counts, chunk_count
+
+def write_result_chunk(chunk_dir: Path, chunk_number: int, chunk: List[list]):
+    """Write one JSON result chunk."""
+    with (chunk_dir / f"chunk_{chunk_number:05d}.json").open('w', encoding='utf-8') as chunk_file:
+        json.dump(chunk, chunk_file, separators=(',', ':'))
+
+def iter_event_cards(events: List[str], step_counts: List[Dict[str, int]], stage_metrics: List[Dict] = None,
+                     run_trends: Dict[str, List[Dict]] = None) -> Iterator[str]:
+    """Yield the HTML cards of the events of a streamed report, their steps being loaded from the chunks."""
+    for event_index, event in enumerate(events):
+        counts = ", ".join(f"{count} {status}" for status, count in step_counts[event_index].items())
+        yield (f'<div class="report-item">\n<h2>{event}</h2>\n'
+               f'<p class="step-counts">{sum(step_counts[event_index].values())} steps: {counts}</p>\n'
+               f'<div id="event-steps-{event_index}"></div>\n</div>\n')
+        if event == 'gluecompare':
+            yield create_chart_container()
+    if stage_metrics:
+        yield create_timing_panel(stage_metrics)
+    if run_trends:
+        yield create_trend_panel()
+
+def create_results_script(chunk_dir_name: str, chunk_count: int) -> str:
+    """Create JavaScript fetching the next result chunk whenever the end of the page scrolls into view."""
+    # "</" is escaped so that a directory name cannot close the script element
+    result_index = json.dumps({'chunkDir': chunk_dir_name, 'chunkCount': chunk_count,
+                               'statusClasses': status_classes}).replace('</', '<\\/')
+    return f"""
+    const resultIndex = {result_index};
+    let nextChunk = 0;
+    let loading = false;
+    const sentinel = document.createElement('div');
+    sentinel.className = 'results-sentinel';
+    document.querySelector('.report-container').after(sentinel);
+
+    function loadNextChunk() {{
+        if (loading || nextChunk >= resultIndex.chunkCount) {{
+            return;
+        }}
+        loading = true;
+        const chunkPath = resultIndex.chunkDir + '/chunk_' + String(nextChunk).padStart(5, '0') + '.json';
+        sentinel.textContent = 'Loading results ' + (nextChunk + 1) + ' of ' + resultIndex.chunkCount + '...';
+        fetch(chunkPath)
+            .then(response => response.json())
+            .then(steps => {{
+                const fragments = {{}};
+                for (const [event, step, status] of steps) {{
+                    const item = document.createElement('div');
+                    item.className = 'status ' + (resultIndex.statusClasses[status] || 'not-run');
+                    item.textContent = step + ': ' + status;
+                    (fragments[event] = fragments[event] || document.createDocumentFragment()).appendChild(item);
+                }}
+                for (const event in fragments) {{
+                    document.getElementById('event-steps-' + event).appendChild(fragments[event]);
+                }}
+                nextChunk += 1;
+                loading = false;
+                sentinel.textContent = nextChunk < resultIndex.chunkCount ? '' : 'All results loaded.';
+                // Observing again reports the sentinel if it is still in view, loading the next chunk
+                observer.unobserve(sentinel);
+                observer.observe(sentinel);
+            }})
+            .catch(error => {{
+                loading = false;
+                sentinel.textContent = 'Unable to load ' + chunkPath + ': ' + error;
+            }});
+    }}
+
+    const observer = new IntersectionObserver(entries => {{
+        if (entries.some(entry => entry.isIntersecting)) {{
+            loadNextChunk();
+        }}
+    }});
+    observer.observe(sentinel);
+    """
+
 def create_report_item(event: str, results: Dict[str, str]) -> str:
     """Create an HTML div for a report item."""
-    row = f'<div class="report-item">\n<h2>{event}</h2>\n'
+    parts = [f'<div class="report-item">\n<h2>{event}</h2>\n']
     for step, status in results.items():
         css_class = status_classes.get(status, "not-run")
-        row += f'<div class="status {css_class}">{step}: {status}</div>\n'
-    row += "</div>\n"
-    return row
+        parts.append(f'<div class="status {css_class}">{step}: {status}</div>\n')
+    parts.append("</div>\n")
+    return "".join(parts)
+
+def create_multievent_explanation() -> str:
+    """Create an HTML div explaining the scenarios of the multievent."""
+    return ("<div class='explanation'>The 'multievent' encompasses scenarios: mismatch, "
+            "scanned, and missingfile.</div>")
 
 def create_chart_container() -> str:
     """Create an HTML div for the chart container."""
@@ -228,10 +362,93 @@ def create_chart_container() -> str:
     </div>
     """
 
+def create_timing_panel(stage_metrics: List[Dict]) -> str:
+    """Create an HTML table with the wall time, throughput and resource counters of each DR comparison stage."""
+    longest = max((stage['Wall_Seconds'] for stage in stage_metrics), default=0) or 1
+    panel = ('<div class="report-item timing-panel">\n<h2>DR Comparison Stage Timings</h2>\n<table>\n'
+             '<tr><th>Stage</th><th>Wall (s)</th><th></th><th>Items</th><th>Items/s</th><th>Bytes Read</th>'
+             '<th>Glue Calls</th><th>Glue Throttles</th><th>Max Queue Depth</th></tr>\n')
+    for stage in stage_metrics:
+        bar_width = round(100 * stage['Wall_Seconds'] / longest)
+        items_per_second = stage['Items_Per_Second'] if stage['Items_Per_Second'] is not None else '-'
+        panel += (f'<tr><td>{stage["Stage"]}</td><td>{stage["Wall_Seconds"]}</td>'
+                  f'<td style="width: 30%"><div class="bar" style="width: {bar_width}%"></div></td>'
+                  f'<td>{stage["Items"]}</td><td>{items_per_second}</td><td>{stage["Bytes_Read"]}</td>'
+                  f'<td>{stage["Glue_Calls"]}</td><td>{stage["Glue_Throttles"]}</td>'
+                  f'<td>{stage["Max_Queue_Depth"]}</td></tr>\n')
+    panel += "</table>\n</div>\n"
+    return panel
+
+def create_trend_panel() -> str:
+    """Create an HTML div for the cross-run trend charts."""
+    return """
+    <div class="report-item trend-panel">
+        <h2>DR Validation Trends</h2>
+        <div class="trend-chart"><canvas id="failureTrendChart"></canvas></div>
+        <div class="trend-chart"><canvas id="stageTrendChart"></canvas></div>
+    </div>
+    """
+
+def create_trend_chart_script(run_trends: Dict[str, List[Dict]]) -> str:
+    """Create JavaScript for rendering the failures per day and the mean runtime per stage and day."""
+    daily_failures = run_trends.get('Daily_Failures', [])
+    daily_stage_runtimes = run_trends.get('Daily_Stage_Runtimes', [])
+    run_dates = sorted({day['Run_Date'] for day in daily_failures} |
+                       {day['Run_Date'] for day in daily_stage_runtimes})
+    failures_by_date = {day['Run_Date']: day for day in daily_failures}
+    stage_runtimes = {}
+    for day in daily_stage_runtimes:
+        stage_runtimes.setdefault(day['Stage'], {})[day['Run_Date']] = day['Mean_Wall_Seconds']
+    trend_data = json.dumps({
+        'dates': run_dates,
+        'failedTables': [failures_by_date.get(run_date, {}).get('Failed_Verdicts') for run_date in run_dates],
+        'failedRuns': [failures_by_date.get(run_date, {}).get('Failed_Runs') for run_date in run_dates],
+        'stages': {stage: [runtimes.get(run_date) for run_date in run_dates]
+                   for stage, runtimes in stage_runtimes.items()}
+    }).replace('</', '<\\/')
+    return f"""
+    const trendData = {trend_data};
+    new Chart(document.getElementById('failureTrendChart').getContext('2d'), {{
+        type: 'bar',
+        data: {{
+            labels: trendData.dates,
+            datasets: [
+                {{label: 'Failed tables', data: trendData.failedTables, backgroundColor: '#ff6384'}},
+                {{label: 'Failed runs', data: trendData.failedRuns, type: 'line', borderColor: '#FF9800'}}
+            ]
+        }},
+        options: {{
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {{title: {{display: true, text: 'Failures per day'}}}}
+        }}
+    }});
+    new Chart(document.getElementById('stageTrendChart').getContext('2d'), {{
+        type: 'line',
+        data: {{
+            labels: trendData.dates,
+            datasets: Object.entries(trendData.stages).map(([stage, seconds]) => ({{
+                label: stage, data: seconds, spanGaps: true
+            }}))
+        }},
+        options: {{
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {{title: {{display: true, text: 'Mean runtime per stage (s)'}}}}
+        }}
+    }});
+    """
+
 # Example usage:
 # test_results = {'event1': {'step1': 'succeeded', 'step2': 'failed'}, 'gluecompare': {'step1': 'succeeded'}}
 # current_timestamp = '2023-06-18 12:00:00'
 # test_environment = 'Production'
 # result_count = (5, 2)
-# report = generate_html_report(test_results, current_timestamp, test_environment, result_count)
+# stage_metrics = dr_metrics.load_stage_metrics('./logs/DR_COMP_Metrics_Report_20230618120000.json')
+# run_trends = dr_run_history.RunHistory().load_run_trends(days=365)
+# report = generate_html_report(test_results, current_timestamp, test_environment, result_count, stage_metrics,
+#                               run_trends)
 # print(report)
+# For tens of thousands of steps, stream the page and its paginated JSON result chunks instead:
+# write_html_report(Path('./logs/DR_HTML_Report.html'), test_results, current_timestamp, test_environment,
+#                   result_count, stage_metrics)
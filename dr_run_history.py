@@ -0,0 +1,257 @@
+import os
+import json
+import uuid
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+from aws_utils_func import configure_logging
+from dr_table_schema import intern_schema
+from dr_metrics import get_run_metrics
+from dr_sqlite import SqliteStore
+
+# Logger configuration
+logger = configure_logging()
+
+RUN_HISTORY_PATH = './history/dr_run_history.db'
+RUN_HISTORY_MODES = ('record', 'off')
+# Positional differences kept per failed table; the column set differences are always kept in full
+RUN_HISTORY_MAX_DIFF_POSITIONS = 100
+# Days of history the trend charts cover by default
+RUN_HISTORY_TREND_DAYS = 365
+
+RUN_HISTORY_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS dr_runs ('
+    'run_id TEXT PRIMARY KEY, run_date TEXT NOT NULL, started_at REAL NOT NULL, total_seconds REAL, '
+    'validation TEXT NOT NULL, table_count INTEGER NOT NULL, failed_count INTEGER NOT NULL, '
+    'peak_rss_bytes INTEGER)',
+    'CREATE INDEX IF NOT EXISTS dr_runs_by_date ON dr_runs (run_date)',
+    'CREATE TABLE IF NOT EXISTS dr_table_verdicts ('
+    'run_id TEXT NOT NULL, run_date TEXT NOT NULL, db_name TEXT NOT NULL, table_name TEXT NOT NULL, '
+    'result TEXT NOT NULL, file_columns INTEGER, table_columns INTEGER, diff TEXT, '
+    'PRIMARY KEY (run_id, db_name, table_name)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS dr_table_verdicts_by_table ON dr_table_verdicts (table_name, run_date)',
+    'CREATE INDEX IF NOT EXISTS dr_table_verdicts_by_date ON dr_table_verdicts (run_date, result)',
+    'CREATE TABLE IF NOT EXISTS dr_stage_timings ('
+    'run_id TEXT NOT NULL, run_date TEXT NOT NULL, stage TEXT NOT NULL, wall_seconds REAL NOT NULL, '
+    'busy_seconds REAL, items INTEGER, bytes_read INTEGER, glue_calls INTEGER, glue_throttles INTEGER, '
+    'PRIMARY KEY (run_id, stage)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS dr_stage_timings_by_date ON dr_stage_timings (run_date, stage)',
+    # Daily rollups maintained with every recorded run, so that trend charts read one row per day and stage
+    'CREATE TABLE IF NOT EXISTS dr_daily_results ('
+    'run_date TEXT PRIMARY KEY, runs INTEGER NOT NULL, failed_runs INTEGER NOT NULL, '
+    'table_verdicts INTEGER NOT NULL, failed_verdicts INTEGER NOT NULL) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS dr_daily_stages ('
+    'run_date TEXT NOT NULL, stage TEXT NOT NULL, runs INTEGER NOT NULL, wall_seconds_total REAL NOT NULL, '
+    'wall_seconds_max REAL NOT NULL, PRIMARY KEY (run_date, stage)) WITHOUT ROWID',
+)
+
+
+def get_run_id(summary_file_path: str) -> str:
+    """
+    Returns a unique id for the run of a DR_COMP_Summary_Report_<timestamp>.txt file.
+
+    The report timestamp only has a one second resolution, so the process id and a random suffix are appended
+    to keep two runs started within the same second apart.
+    """
+    timestamp = os.path.splitext(os.path.basename(summary_file_path))[0].rsplit('_', 1)[-1]
+    return f"{timestamp}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+
+
+def get_run_date(run_id: str) -> str:
+    """Returns the YYYY-MM-DD date of a run from its id, which starts with the YYYYMMDDHHMMSS report timestamp."""
+    return f"{run_id[:4]}-{run_id[4:6]}-{run_id[6:8]}"
+
+
+def get_table_diff(file_metadata: dict, table_metadata: dict) -> str:
+    """Returns the JSON column differences of a failed table, as shown in its summary and details entries."""
+    file_schema = intern_schema(file_metadata.get('File_Columns_Names', []))
+    table_schema = intern_schema(table_metadata.get('Table_Columns_Names', []))
+    return json.dumps({
+        'File_Only': sorted(set(file_schema) - set(table_schema)),
+        'Table_Only': sorted(set(table_schema) - set(file_schema)),
+        'Positions': file_schema.diff(table_schema)[:RUN_HISTORY_MAX_DIFF_POSITIONS]
+    })
+
+
+class RunHistory(SqliteStore):
+    """
+    Local SQLite history of DR comparison runs: the verdict and column differences of every table and
+    the timings of every stage, indexed by table and by date.
+
+    Daily rollups of the results and stage timings are updated in the same transaction as each run, so
+    trend queries over a year of runs read a few hundred rows whatever the number of tables.
+    """
+
+    SCHEMA = RUN_HISTORY_SCHEMA
+
+    def __init__(self, db_path: str = RUN_HISTORY_PATH):
+        super().__init__(db_path)
+        self.lock = threading.Lock()
+
+    def record_run(self, run_id: str, table_list: list, comparison_result: dict, file_md_dict: dict,
+                   tbl_md_dict: dict, validation: str, run_metrics: dict) -> bool:
+        """
+        Appends a run to the history.
+
+        :param run_id: Unique id of the run, as returned by get_run_id.
+        :param table_list: Configured tables in the format "database_name,table_name".
+        :param comparison_result: Verdict of every compared table, by table name.
+        :param file_md_dict: Metadata dictionary of the parquet files.
+        :param tbl_md_dict: Metadata dictionary of the Glue tables.
+        :param validation: Overall 'SUCCEEDED' or 'FAILED' of the run.
+        :param run_metrics: Run metrics as written to the metrics sidecar.
+        :return: False if the run was already recorded.
+        """
+        run_date = get_run_date(run_id)
+        db_names = {}
+        for table in table_list:
+            db_name, table_name = table.split(',')[0].lower(), table.split(',')[1].lower()
+            db_names.setdefault(table_name, db_name)
+        verdicts = []
+        for table_name, result in comparison_result.items():
+            file_metadata = file_md_dict.get(table_name, {})
+            table_metadata = tbl_md_dict.get(table_name, {})
+            verdicts.append((run_id, run_date, db_names.get(table_name, ''), table_name, result,
+                             len(file_metadata.get('File_Columns_Names', [])),
+                             len(table_metadata.get('Table_Columns_Names', [])),
+                             get_table_diff(file_metadata, table_metadata) if result != 'SUCCEEDED' else None))
+        failed_count = sum(1 for verdict in verdicts if verdict[4] != 'SUCCEEDED')
+        stages = [(run_id, run_date, stage['Stage'], stage['Wall_Seconds'], stage['Busy_Seconds'], stage['Items'],
+                   stage['Bytes_Read'], stage['Glue_Calls'], stage['Glue_Throttles'])
+                  for stage in run_metrics.get('Stages', [])]
+
+        with self.lock:
+            conn = self.get_connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('SELECT 1 FROM dr_runs WHERE run_id = ?', (run_id,)).fetchone():
+                    conn.execute('ROLLBACK')
+                    logger.warning(f"Run {run_id} is already in the run history {self.db_path}")
+                    return False
+                conn.execute('INSERT INTO dr_runs (run_id, run_date, started_at, total_seconds, validation, '
+                             'table_count, failed_count, peak_rss_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (run_id, run_date, run_metrics.get('Started_At', 0.0), run_metrics.get('Total_Seconds'),
+                              validation, len(verdicts), failed_count,
+                              (run_metrics.get('Peak_RSS_Bytes') or {}).get('Self')))
+                conn.executemany('INSERT OR REPLACE INTO dr_table_verdicts (run_id, run_date, db_name, table_name, '
+                                 'result, file_columns, table_columns, diff) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                 verdicts)
+                conn.executemany('INSERT INTO dr_stage_timings (run_id, run_date, stage, wall_seconds, '
+                                 'busy_seconds, items, bytes_read, glue_calls, glue_throttles) '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', stages)
+                conn.execute('INSERT INTO dr_daily_results (run_date, runs, failed_runs, table_verdicts, '
+                             'failed_verdicts) VALUES (?, 1, ?, ?, ?) ON CONFLICT (run_date) DO UPDATE SET '
+                             'runs = runs + 1, failed_runs = failed_runs + excluded.failed_runs, '
+                             'table_verdicts = table_verdicts + excluded.table_verdicts, '
+                             'failed_verdicts = failed_verdicts + excluded.failed_verdicts',
+                             (run_date, int(validation != 'SUCCEEDED'), len(verdicts), failed_count))
+                conn.executemany('INSERT INTO dr_daily_stages (run_date, stage, runs, wall_seconds_total, '
+                                 'wall_seconds_max) VALUES (?, ?, 1, ?, ?) ON CONFLICT (run_date, stage) DO UPDATE '
+                                 'SET runs = runs + 1, wall_seconds_total = wall_seconds_total + '
+                                 'excluded.wall_seconds_total, wall_seconds_max = MAX(wall_seconds_max, '
+                                 'excluded.wall_seconds_max)',
+                                 [(run_date, stage[2], stage[3], stage[3]) for stage in stages])
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        logger.info(f"Recorded run {run_id} ({len(verdicts)} tables, {failed_count} failed) in {self.db_path}")
+        return True
+
+    def get_daily_failures(self, since_date: str, until_date: str = '9999-12-31') -> list:
+        """Returns the runs and table verdicts per day between two YYYY-MM-DD dates, with their failures."""
+        with self.lock:
+            rows = self.get_connection().execute(
+                'SELECT run_date, runs, failed_runs, table_verdicts, failed_verdicts FROM dr_daily_results '
+                'WHERE run_date BETWEEN ? AND ? ORDER BY run_date', (since_date, until_date)).fetchall()
+        return [{'Run_Date': run_date, 'Runs': runs, 'Failed_Runs': failed_runs, 'Table_Verdicts': table_verdicts,
+                 'Failed_Verdicts': failed_verdicts}
+                for run_date, runs, failed_runs, table_verdicts, failed_verdicts in rows]
+
+    def get_daily_stage_runtimes(self, since_date: str, until_date: str = '9999-12-31') -> list:
+        """Returns the mean and maximum wall time of every stage per day between two YYYY-MM-DD dates."""
+        with self.lock:
+            rows = self.get_connection().execute(
+                'SELECT run_date, stage, runs, wall_seconds_total, wall_seconds_max FROM dr_daily_stages '
+                'WHERE run_date BETWEEN ? AND ? ORDER BY run_date, stage', (since_date, until_date)).fetchall()
+        return [{'Run_Date': run_date, 'Stage': stage, 'Runs': runs,
+                 'Mean_Wall_Seconds': round(wall_seconds_total / runs, 4), 'Max_Wall_Seconds': wall_seconds_max}
+                for run_date, stage, runs, wall_seconds_total, wall_seconds_max in rows]
+
+    def get_table_history(self, table_name: str, since_date: str = '0000-01-01') -> list:
+        """Returns the verdicts and column differences of one table, oldest run first."""
+        with self.lock:
+            rows = self.get_connection().execute(
+                'SELECT run_id, db_name, result, file_columns, table_columns, diff FROM dr_table_verdicts '
+                'WHERE table_name = ? AND run_date >= ? ORDER BY run_date, run_id',
+                (table_name.lower(), since_date)).fetchall()
+        return [{'Run_Id': run_id, 'Database': db_name, 'Result': result, 'File_Columns': file_columns,
+                 'Table_Columns': table_columns, 'Diff': json.loads(diff) if diff else None}
+                for run_id, db_name, result, file_columns, table_columns, diff in rows]
+
+    def get_most_failing_tables(self, since_date: str, limit: int = 20) -> list:
+        """Returns the tables that failed in the most runs since a YYYY-MM-DD date."""
+        with self.lock:
+            rows = self.get_connection().execute(
+                "SELECT db_name, table_name, COUNT(*) AS failures, MAX(run_id) FROM dr_table_verdicts "
+                "WHERE run_date >= ? AND result != 'SUCCEEDED' GROUP BY db_name, table_name "
+                "ORDER BY failures DESC, table_name LIMIT ?", (since_date, limit)).fetchall()
+        return [{'Database': db_name, 'Table': table_name, 'Failures': failures, 'Last_Failed_Run': last_run_id}
+                for db_name, table_name, failures, last_run_id in rows]
+
+    def load_run_trends(self, days: int = RUN_HISTORY_TREND_DAYS) -> dict:
+        """Returns the daily failures and stage runtimes of the last days, as rendered by dr_reports."""
+        since_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        return {'Daily_Failures': self.get_daily_failures(since_date),
+                'Daily_Stage_Runtimes': self.get_daily_stage_runtimes(since_date)}
+
+
+# Process-wide run history the comparison runs are recorded in, None when recording is off
+run_history = None
+
+
+def configure_run_history(mode: str = 'record', db_path: str = RUN_HISTORY_PATH):
+    """
+    Configures the process-wide run history.
+
+    :param mode: 'record' to append every comparison run to the history, 'off' to disable it.
+    :param db_path: Path of the SQLite history file.
+    :return: The configured history, or None when recording is off.
+    """
+    global run_history
+    if mode not in RUN_HISTORY_MODES:
+        raise ValueError(f"Invalid run history mode: {mode}. Expected one of {RUN_HISTORY_MODES}")
+    run_history = RunHistory(db_path) if mode == 'record' else None
+    return run_history
+
+
+def get_run_history():
+    """Returns the process-wide run history, or None when recording is not enabled."""
+    return run_history
+
+
+def record_run_history(summary_file_path: str, table_list: list, comparison_result: dict, file_md_dict: dict,
+                       tbl_md_dict: dict, validation: str):
+    """Appends the run whose summary report was just written to the run history, if recording is enabled."""
+    history = get_run_history()
+    if history is None:
+        return
+    try:
+        history.record_run(get_run_id(summary_file_path), table_list, comparison_result, file_md_dict,
+                           tbl_md_dict, validation, get_run_metrics().to_dict())
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Unable to record the run in the run history {history.db_path}: {e}")
+
+
+def add_run_history_arguments(parser: argparse.ArgumentParser):
+    """Adds the run history switches to a command line parser."""
+    parser.add_argument('--run-history', choices=RUN_HISTORY_MODES, default='record',
+                        help="Record the verdicts and stage timings of the run in the run history, or not.")
+    parser.add_argument('--run-history-path', default=RUN_HISTORY_PATH,
+                        help="Path of the SQLite run history file.")
+
+
+def configure_run_history_from_args(args: argparse.Namespace):
+    """Configures the process-wide run history from parsed command line switches."""
+    return configure_run_history(args.run_history, args.run_history_path)
@@ -0,0 +1,295 @@
+import io
+import os
+import zlib
+import struct
+import zipfile
+import threading
+import concurrent.futures
+import pyarrow as pa
+from botocore.exceptions import ClientError
+from config import APP_CONFIG
+from aws_utils_func import log_errors, configure_logging, create_s3_client
+from dr_schema_cache import get_schema_cache, get_member_cache_key, get_parquet_file_name
+from dr_zip_reader import (ZipMemberTail, LOCAL_HEADER_STRUCT, LOCAL_HEADER_SIGNATURE, PARQUET_MAGIC,
+                           PARQUET_TRAILER_SIZE, PARQUET_FOOTER_READ_SIZE, MEMBER_TAIL_SIZE, list_parquet_members,
+                           is_stored_member, get_cached_member_header)
+from dr_drop_index import get_s3_drop_index
+from dr_metrics import get_run_metrics
+
+# Logger configuration
+logger = configure_logging()
+
+# Trailing bytes fetched up front: the end-of-central-directory record and, for most drops, the central directory
+S3_ZIP_TAIL_PREFETCH_SIZE = 128 * 1024
+# Smallest ranged GET issued for reads through S3RangeFile, and the block size deflated members are streamed in
+S3_RANGE_BLOCK_SIZE = 8 * 1024 * 1024
+# Parallel ranged GETs per zip file, matching the default connection pool of a botocore client
+S3_RANGE_WORKERS = 10
+# Local file header extra fields are rarely longer than this, so one GET usually covers the whole header
+LOCAL_HEADER_READ_SIZE = LOCAL_HEADER_STRUCT.size + 1024
+
+
+def fetch_s3_range(client, bucket: str, s3_key: str, start: int, end: int) -> bytes:
+    """Fetches bytes [start, end) of an S3 object with a single ranged GET."""
+    response = client.get_object(Bucket=bucket, Key=s3_key, Range=f'bytes={start}-{end - 1}')
+    return response['Body'].read()
+
+
+class S3RangeFile(io.RawIOBase):
+    """
+    Seekable, read-only view of an S3 object that fetches the bytes it is asked for with ranged GETs.
+
+    Reads are served from a single buffer refilled with at least block_size bytes at a time; once the
+    tail of the object is prefetched, zipfile parses the central directory without any further request.
+    """
+
+    def __init__(self, client, bucket: str, s3_key: str, size: int, block_size: int = S3_RANGE_BLOCK_SIZE):
+        self.client = client
+        self.bucket = bucket
+        self.s3_key = s3_key
+        self.size = size
+        self.block_size = block_size
+        self.position = 0
+        self.buffer = b''
+        self.buffer_start = 0
+        self.bytes_fetched = 0
+        self.requests = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def prefetch(self, start: int, end: int):
+        """Replaces the buffer with bytes [start, end) of the object."""
+        start, end = max(0, start), min(self.size, end)
+        self.buffer = fetch_s3_range(self.client, self.bucket, self.s3_key, start, end) if end > start else b''
+        self.buffer_start = start
+        self.bytes_fetched += len(self.buffer)
+        self.requests += 1
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = min(size, self.size - self.position)
+        if size <= 0:
+            return b''
+        buffer_end = self.buffer_start + len(self.buffer)
+        if self.position < self.buffer_start or self.position + size > buffer_end:
+            self.prefetch(self.position, self.position + max(size, self.block_size))
+        start = self.position - self.buffer_start
+        data = self.buffer[start:start + size]
+        self.position += len(data)
+        return data
+
+
+class RangeCounter:
+    """Thread-safe count of the ranged GETs issued for one zip file and the bytes they moved."""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_fetched = 0
+        self.lock = threading.Lock()
+
+    def fetch(self, client, bucket: str, s3_key: str, start: int, end: int) -> bytes:
+        data = fetch_s3_range(client, bucket, s3_key, start, end)
+        with self.lock:
+            self.requests += 1
+            self.bytes_fetched += len(data)
+        return data
+
+    def add(self, range_file: S3RangeFile):
+        with self.lock:
+            self.requests += range_file.requests
+            self.bytes_fetched += range_file.bytes_fetched
+
+
+def fetch_member_data_offset(client, bucket: str, s3_key: str, zip_info: zipfile.ZipInfo,
+                             counter: RangeCounter) -> int:
+    """Fetches the local file header of a zip member and returns the offset of its first data byte."""
+    header_end = zip_info.header_offset + LOCAL_HEADER_READ_SIZE + len(zip_info.filename)
+    header = counter.fetch(client, bucket, s3_key, zip_info.header_offset, header_end)
+    fields = LOCAL_HEADER_STRUCT.unpack(header[:LOCAL_HEADER_STRUCT.size])
+    if fields[0] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header for member: {zip_info.filename}")
+    return zip_info.header_offset + LOCAL_HEADER_STRUCT.size + fields[9] + fields[10]
+
+
+def get_footer_window(tail: bytes, file_size: int) -> int:
+    """Returns how many trailing bytes of a parquet file hold its footer, or 0 if the tail is not parquet."""
+    if len(tail) < PARQUET_TRAILER_SIZE or tail[-4:] != PARQUET_MAGIC:
+        return 0
+    return min(file_size, struct.unpack('<I', tail[-PARQUET_TRAILER_SIZE:-4])[0] + PARQUET_TRAILER_SIZE)
+
+
+def read_stored_member_tail(client, bucket: str, s3_key: str, zip_info: zipfile.ZipInfo, data_offset: int,
+                            counter: RangeCounter) -> bytes:
+    """Fetches only the footer window of an uncompressed parquet member."""
+    data_end = data_offset + zip_info.file_size
+    window = min(zip_info.file_size, PARQUET_FOOTER_READ_SIZE)
+    tail = counter.fetch(client, bucket, s3_key, data_end - window, data_end)
+    footer_window = get_footer_window(tail, zip_info.file_size)
+    if footer_window > len(tail):
+        logger.debug(f"Footer of {zip_info.filename} exceeds {window} bytes, fetching {footer_window} bytes")
+        tail = counter.fetch(client, bucket, s3_key, data_end - footer_window, data_end - len(tail)) + tail
+    return tail
+
+
+def read_deflated_member_tail(client, bucket: str, s3_key: str, zip_info: zipfile.ZipInfo, data_offset: int,
+                              counter: RangeCounter, tail_size: int = MEMBER_TAIL_SIZE) -> bytes:
+    """
+    Streams the compressed data of a deflated member in ranged blocks, keeping only its decompressed tail.
+
+    A deflate stream cannot be entered in the middle, so every compressed byte of the member is fetched.
+    """
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    data_end = data_offset + zip_info.compress_size
+    tail = b''
+    for block_start in range(data_offset, data_end, S3_RANGE_BLOCK_SIZE):
+        block = counter.fetch(client, bucket, s3_key, block_start, min(block_start + S3_RANGE_BLOCK_SIZE, data_end))
+        tail = (tail + decompressor.decompress(block))[-tail_size:]
+    tail = (tail + decompressor.flush())[-tail_size:]
+    footer_window = get_footer_window(tail, zip_info.file_size)
+    if footer_window > len(tail) and len(tail) < zip_info.file_size:
+        logger.debug(f"Footer of {zip_info.filename} exceeds the tail window, re-reading {footer_window} bytes")
+        return read_deflated_member_tail(client, bucket, s3_key, zip_info, data_offset, counter, footer_window)
+    return tail
+
+
+def read_s3_member_header(client, bucket: str, s3_key: str, zip_info: zipfile.ZipInfo, read_metadata,
+                          counter: RangeCounter) -> tuple:
+    """
+    Reads the footer of one parquet member of a zip file in S3 and caches it under its member key.
+
+    Uncompressed members cost two small ranged GETs, one for the local header and one for the footer.
+    Deflated members have to be decompressed from their first byte, so their compressed data is streamed.
+
+    :return: Tuple of the parquet file name and its metadata.
+    """
+    try:
+        if zip_info.flag_bits & 0x1:
+            raise zipfile.BadZipFile(f"Encrypted member: {zip_info.filename}")
+        if zip_info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise zipfile.BadZipFile(f"Compression method {zip_info.compress_type} of {zip_info.filename} "
+                                     f"is not supported for ranged reads")
+        data_offset = fetch_member_data_offset(client, bucket, s3_key, zip_info, counter)
+        if is_stored_member(zip_info):
+            tail = read_stored_member_tail(client, bucket, s3_key, zip_info, data_offset, counter)
+        else:
+            tail = read_deflated_member_tail(client, bucket, s3_key, zip_info, data_offset, counter)
+        source = pa.PythonFile(ZipMemberTail(tail, zip_info.file_size), mode='r')
+    except (zipfile.BadZipFile, zlib.error, ClientError, OSError) as e:
+        logger.error(f"Unable to open member {zip_info.filename} of s3://{bucket}/{s3_key}")
+        log_errors(e, detailed_traceback=True)
+        source = pa.BufferReader(b'')
+    with source:
+        parquet_file_name, metadata = read_metadata(os.path.basename(zip_info.filename), source)
+
+    cache = get_schema_cache()
+    reader_name = getattr(read_metadata, 'cache_reader', None)
+    if cache and reader_name and metadata['File_Columns_Counts']:
+        cache.put(get_member_cache_key(zip_info, reader_name), metadata)
+    return parquet_file_name, metadata
+
+
+def scan_s3_zip_parquet_headers(s3_key: str, read_metadata, bucket: str = None, client=None,
+                                max_workers: int = S3_RANGE_WORKERS) -> dict:
+    """
+    Reads the parquet footers of a zip file in S3 with ranged GETs, without downloading the archive.
+
+    The tail of the object is fetched first to parse the end-of-central-directory record and the
+    central directory; members already in the schema cache are skipped, and the footers of the others
+    are fetched in parallel through one pooled client.
+
+    :param s3_key: Key of the zip file.
+    :param read_metadata: Callable taking a member name and a pyarrow source, returning (file name, metadata).
+    :param bucket: Bucket of the zip file, APP_CONFIG["S3_Bucket"] if not provided.
+    :param client: The boto3 S3 client, created with create_s3_client if not provided.
+    :param max_workers: Number of parallel ranged GETs.
+    :return: Metadata dictionary for the parquet members of the zip file.
+    """
+    bucket = bucket or APP_CONFIG["S3_Bucket"]
+    client = client or create_s3_client()
+    run_metrics = get_run_metrics()
+    counter = RangeCounter()
+    file_metadata_dict = {}
+    try:
+        with run_metrics.stage('zip_listing'):
+            object_size = client.head_object(Bucket=bucket, Key=s3_key)['ContentLength']
+            range_file = S3RangeFile(client, bucket, s3_key, object_size)
+            range_file.prefetch(object_size - S3_ZIP_TAIL_PREFETCH_SIZE, object_size)
+            with zipfile.ZipFile(range_file, 'r') as zip_ref:
+                parquet_members = list_parquet_members(zip_ref)
+            counter.add(range_file)
+        run_metrics.record('zip_listing', items=1, bytes_read=range_file.bytes_fetched)
+
+        pending_members = []
+        for zip_info in parquet_members:
+            metadata = get_cached_member_header(zip_info, read_metadata)
+            if metadata is not None:
+                file_metadata_dict[get_parquet_file_name(zip_info.filename)] = metadata
+            else:
+                pending_members.append(zip_info)
+        compressed_members = sum(1 for zip_info in pending_members if not is_stored_member(zip_info))
+        if compressed_members:
+            logger.warning(f"{compressed_members} compressed members of s3://{bucket}/{s3_key} "
+                           f"are streamed in full to reach their footers")
+
+        footer_bytes = counter.bytes_fetched
+        with run_metrics.stage('footer_read'), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(read_s3_member_header, client, bucket, s3_key, zip_info, read_metadata,
+                                       counter)
+                       for zip_info in pending_members]
+            run_metrics.record_queue_depth('footer_read', len(futures))
+            for future in concurrent.futures.as_completed(futures):
+                parquet_file_name, metadata = future.result()
+                file_metadata_dict[parquet_file_name] = metadata
+        run_metrics.record('footer_read', items=len(parquet_members),
+                           bytes_read=counter.bytes_fetched - footer_bytes)
+        logger.info(f"Read {len(file_metadata_dict)} parquet footers from s3://{bucket}/{s3_key} "
+                    f"({object_size} bytes) with {counter.requests} ranged GETs moving {counter.bytes_fetched} bytes")
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as e:
+        log_errors(e, detailed_traceback=True)
+    except ClientError as e:
+        logger.error(f"Unable to read s3://{bucket}/{s3_key}")
+        log_errors(e, detailed_traceback=True)
+    return file_metadata_dict
+
+
+def get_s3_dr_file_header(s3_key_prefix: str, read_metadata, bucket: str = None,
+                          max_workers: int = S3_RANGE_WORKERS) -> dict:
+    """
+    Retrieves the parquet metadata of the latest complete DR drop under an S3 prefix.
+
+    :param s3_key_prefix: S3 prefix the DR zip files land under.
+    :param read_metadata: Parquet metadata reader decorated with cached_parquet_metadata.
+    :param bucket: Bucket of the zip files, APP_CONFIG["S3_Bucket"] if not provided.
+    :param max_workers: Number of parallel ranged GETs per zip file.
+    :return: Metadata dictionary for all parquet files of the drop.
+    """
+    zip_keys = get_s3_drop_index(s3_key_prefix, bucket).latest_complete_set()
+    if not zip_keys:
+        logger.warning(f"No complete DR drop found under s3://{bucket or APP_CONFIG['S3_Bucket']}/{s3_key_prefix}")
+        return {}
+    logger.info(f"Found {len(zip_keys)} zip files in s3://{bucket or APP_CONFIG['S3_Bucket']}/{s3_key_prefix}")
+    client = create_s3_client()
+    file_metadata_dict = {}
+    for s3_key in zip_keys:
+        file_metadata_dict.update(scan_s3_zip_parquet_headers(s3_key, read_metadata, bucket, client, max_workers))
+    return file_metadata_dict
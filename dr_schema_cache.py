@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import struct
+import hashlib
+import zipfile
+import argparse
+import functools
+import threading
+from aws_utils_func import configure_logging
+from dr_table_schema import intern_metadata, encode_schema
+from dr_sqlite import SqliteStore
+
+# Logger configuration
+logger = configure_logging()
+
+SCHEMA_CACHE_PATH = './cache/dr_schema_cache.db'
+SCHEMA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+SCHEMA_CACHE_MODES = ('use', 'bypass', 'rebuild')
+
+# Number of writes between two checks of the cache size against its limit
+EVICTION_CHECK_INTERVAL = 500
+# Fraction of the size limit the cache is trimmed down to once it overflows
+EVICTION_LOW_WATERMARK = 0.9
+
+
+class SchemaCache(SqliteStore):
+    """Persistent, content-addressed cache of parquet file metadata backed by SQLite."""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS schema_cache ('
+        'cache_key TEXT PRIMARY KEY, metadata TEXT NOT NULL, '
+        'size INTEGER NOT NULL, last_access REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS schema_cache_last_access ON schema_cache (last_access)',
+    )
+
+    def __init__(self, db_path: str = SCHEMA_CACHE_PATH, max_bytes: int = SCHEMA_CACHE_MAX_BYTES):
+        super().__init__(db_path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes_since_check = 0
+        self.lock = threading.Lock()
+
+    def get(self, cache_key: str):
+        """Returns the cached metadata for a key, or None on a miss."""
+        with self.lock:
+            conn = self.get_connection()
+            row = conn.execute('SELECT metadata FROM schema_cache WHERE cache_key = ?', (cache_key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            conn.execute('UPDATE schema_cache SET last_access = ? WHERE cache_key = ?', (time.time(), cache_key))
+        return intern_metadata(json.loads(row[0]))
+
+    def put(self, cache_key: str, metadata: dict):
+        """Stores the metadata for a key, evicting the least recently used entries when over the size limit."""
+        payload = json.dumps(metadata, default=encode_schema)
+        with self.lock:
+            conn = self.get_connection()
+            conn.execute('INSERT OR REPLACE INTO schema_cache (cache_key, metadata, size, last_access) '
+                         'VALUES (?, ?, ?, ?)', (cache_key, payload, len(payload) + len(cache_key), time.time()))
+            self.writes_since_check += 1
+            if self.writes_since_check >= EVICTION_CHECK_INTERVAL:
+                self.enforce_size_limit()
+
+    def enforce_size_limit(self):
+        """Evicts the least recently used entries until the cache fits within its size limit."""
+        conn = self.get_connection()
+        self.writes_since_check = 0
+        total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM schema_cache').fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        bytes_to_free = total_bytes - int(self.max_bytes * EVICTION_LOW_WATERMARK)
+        evicted_keys = []
+        for cache_key, size in conn.execute('SELECT cache_key, size FROM schema_cache ORDER BY last_access'):
+            if bytes_to_free <= 0:
+                break
+            evicted_keys.append((cache_key,))
+            bytes_to_free -= size
+        conn.executemany('DELETE FROM schema_cache WHERE cache_key = ?', evicted_keys)
+        self.evictions += len(evicted_keys)
+        logger.info(f"Evicted {len(evicted_keys)} entries from schema cache {self.db_path}")
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self.lock:
+            self.get_connection().execute('DELETE FROM schema_cache')
+        logger.info(f"Cleared schema cache {self.db_path}")
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters of this process along with the size of the cache."""
+        with self.lock:
+            entries, total_bytes = self.get_connection().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM schema_cache').fetchone()
+        return {
+            'Hits': self.hits,
+            'Misses': self.misses,
+            'Evictions': self.evictions,
+            'Entries': entries,
+            'Bytes': total_bytes
+        }
+
+    def log_stats(self):
+        """Logs the cache counters."""
+        logger.info(f"Schema cache statistics: {self.stats()}")
+
+
+# Process-wide cache used by the parquet metadata readers, None when caching is bypassed
+schema_cache = None
+# Until a mode is configured, the first get_schema_cache call enables the cache in 'use' mode
+schema_cache_configured = False
+schema_cache_lock = threading.Lock()
+
+
+def configure_schema_cache(mode: str = 'use', db_path: str = SCHEMA_CACHE_PATH,
+                           max_bytes: int = SCHEMA_CACHE_MAX_BYTES):
+    """
+    Configures the process-wide schema cache.
+
+    :param mode: 'use' to read and populate the cache, 'bypass' to disable it, 'rebuild' to clear it first.
+    :param db_path: Path of the SQLite cache file.
+    :param max_bytes: Size limit of the cache before least recently used entries are evicted.
+    :return: The configured cache, or None when bypassed.
+    """
+    global schema_cache, schema_cache_configured
+    if mode not in SCHEMA_CACHE_MODES:
+        raise ValueError(f"Invalid schema cache mode: {mode}. Expected one of {SCHEMA_CACHE_MODES}")
+    schema_cache_configured = True
+    if mode == 'bypass':
+        schema_cache = None
+        logger.info("Schema cache bypassed.")
+        return None
+    schema_cache = SchemaCache(db_path, max_bytes)
+    if mode == 'rebuild':
+        schema_cache.clear()
+    return schema_cache
+
+
+def get_schema_cache():
+    """
+    Returns the process-wide schema cache, or None when caching is bypassed.
+
+    Compare scripts that never configure the cache get it in 'use' mode with the default path and size.
+    """
+    if not schema_cache_configured:
+        with schema_cache_lock:
+            if not schema_cache_configured:
+                configure_schema_cache('use')
+    return schema_cache
+
+
+def get_parquet_file_name(parquet_file: str) -> str:
+    """Returns the table name a parquet file or zip member is reported under."""
+    return os.path.basename(parquet_file).split('.parquet')[0]
+
+
+def get_member_cache_key(zip_info: zipfile.ZipInfo, reader_name: str) -> str:
+    """Keys a zip member by the CRC32, size and name recorded in the zip central directory."""
+    return f"{reader_name}:zip:{zip_info.CRC:08x}:{zip_info.file_size}:{zip_info.filename}"
+
+
+def get_footer_cache_key(parquet_file: str, reader_name: str) -> str:
+    """Keys a parquet file on disk by a hash of its footer, which is all the metadata readers look at."""
+    with open(parquet_file, 'rb') as parquet_fl:
+        parquet_fl.seek(-8, os.SEEK_END)
+        footer_length = struct.unpack('<I', parquet_fl.read(4))[0]
+        parquet_fl.seek(-(footer_length + 8), os.SEEK_END)
+        footer = parquet_fl.read(footer_length)
+    return f"{reader_name}:footer:{hashlib.blake2b(footer, digest_size=16).hexdigest()}"
+
+
+def cached_parquet_metadata(reader_name: str):
+    """
+    Decorates a read_parquet_file_metadata variant so that files on disk are served from the schema cache.
+
+    Reads from an already opened source are passed through; the zip readers cache those by member instead.
+
+    :param reader_name: Name of the reader variant, part of every cache key.
+    """
+    def decorator(read_metadata):
+        @functools.wraps(read_metadata)
+        def wrapper(parquet_file: str, source=None):
+            cache = get_schema_cache()
+            if cache is None or source is not None:
+                return read_metadata(parquet_file, source)
+            try:
+                cache_key = get_footer_cache_key(parquet_file, reader_name)
+            except (OSError, struct.error):
+                return read_metadata(parquet_file, source)
+            metadata = cache.get(cache_key)
+            if metadata is not None:
+                return get_parquet_file_name(parquet_file), metadata
+            parquet_file_name, metadata = read_metadata(parquet_file, source)
+            if metadata['File_Columns_Counts']:
+                cache.put(cache_key, metadata)
+            return parquet_file_name, metadata
+        wrapper.cache_reader = reader_name
+        return wrapper
+    return decorator
+
+
+def add_schema_cache_arguments(parser: argparse.ArgumentParser):
+    """Adds the schema cache switches to a command line parser."""
+    parser.add_argument('--schema-cache', choices=SCHEMA_CACHE_MODES, default='use',
+                        help="Use the parquet schema cache, bypass it, or clear and rebuild it.")
+    parser.add_argument('--schema-cache-path', default=SCHEMA_CACHE_PATH,
+                        help="Path of the SQLite schema cache file.")
+    parser.add_argument('--schema-cache-max-mb', type=int, default=SCHEMA_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="Size limit of the schema cache in MB.")
+
+
+def configure_schema_cache_from_args(args: argparse.Namespace):
+    """Configures the process-wide schema cache from parsed command line switches."""
+    return configure_schema_cache(args.schema_cache, args.schema_cache_path, args.schema_cache_max_mb * 1024 * 1024)
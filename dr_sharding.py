@@ -0,0 +1,423 @@
+import io
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import zipfile
+import argparse
+import threading
+import multiprocessing
+from glob import glob
+from aws_utils_func import log_errors, configure_logging
+from dr_zip_reader import list_parquet_members, read_zip_parquet_headers
+from dr_schema_cache import get_parquet_file_name, add_schema_cache_arguments, configure_schema_cache_from_args
+from dr_table_schema import intern_metadata, encode_schema
+from dr_metrics import start_run_metrics, get_run_metrics, write_run_metrics
+from dr_run_history import record_run_history, add_run_history_arguments, configure_run_history_from_args
+from glue_catalog import get_glue_catalog_metadata, GLUE_MAX_CONCURRENCY
+from glue_metadata_cache import add_glue_cache_arguments, configure_glue_cache_from_args
+from dr_pipeline import get_report_paths, write_table_comparison, write_comparison_summary
+from new_dr_compare_glue import read_parquet_file_metadata
+
+# Logger configuration
+logger = configure_logging()
+
+# Shards created per worker, so that a slow shard does not leave the other workers idle at the end
+SHARDS_PER_WORKER = 4
+# How often idle workers look for work and the coordinator looks for results, in seconds
+QUEUE_POLL_INTERVAL = 0.5
+# Workers touch their claimed shards this often; a claim untouched for the lease timeout is requeued
+CLAIM_HEARTBEAT_INTERVAL = 10
+CLAIM_LEASE_TIMEOUT = 60
+
+# Layout of the shared queue directory
+QUEUE_PENDING_DIR = 'pending'
+QUEUE_CLAIMED_DIR = 'claimed'
+QUEUE_RESULTS_DIR = 'results'
+QUEUE_STOP_FILE = 'STOP'
+
+
+def get_worker_id() -> str:
+    """Identifies a worker process across hosts sharing the queue directory."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def write_json_atomically(target_path: str, content: dict):
+    """Writes a JSON file under a temporary name and renames it, so readers never see it half written."""
+    temp_path = f"{target_path}.{get_worker_id()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as json_fl:
+        json.dump(content, json_fl, default=encode_schema)
+    os.replace(temp_path, target_path)
+
+
+def read_json(file_path: str) -> dict:
+    """Reads a JSON file written by write_json_atomically."""
+    with open(file_path, 'r', encoding='utf-8') as json_fl:
+        return json.load(json_fl)
+
+
+def get_shard_id(file_name: str) -> str:
+    """Returns the shard id of a pending, claimed or result file name."""
+    return file_name.split('.')[0]
+
+
+def map_table_members(zip_files: list) -> dict:
+    """
+    Maps every parquet file name to the zip file and member holding it, reading only central directories.
+
+    When several zip files hold the same parquet file name, the last one wins, as when their metadata
+    dictionaries are merged.
+    """
+    table_members = {}
+    for zip_file in zip_files:
+        try:
+            with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+                for zip_info in list_parquet_members(zip_ref):
+                    table_members[get_parquet_file_name(zip_info.filename)] = zip_file, zip_info.filename
+        except (zipfile.BadZipFile, OSError) as e:
+            logger.error(f"Error listing zip file: {zip_file}")
+            log_errors(e, detailed_traceback=True)
+    return table_members
+
+
+def build_shards(table_list: list, zip_files: list, shard_count: int) -> list:
+    """
+    Splits the configured tables into contiguous shards, each listing the zip members its tables need.
+
+    :param table_list: Configured tables in the format "database_name,table_name".
+    :param zip_files: Zip files of the DR drop.
+    :param shard_count: Number of shards to create.
+    :return: List of shard dictionaries with the shard id, the (position, table) pairs and the members by zip file.
+    """
+    table_members = map_table_members(zip_files)
+    shard_size = -(-len(table_list) // max(1, shard_count))
+    shards = []
+    for start in range(0, len(table_list), shard_size):
+        tables = list(enumerate(table_list))[start:start + shard_size]
+        members = {}
+        for _, table in tables:
+            member = table_members.get(table.split(',')[1].lower()) if ',' in table else None
+            if member is not None:
+                zip_file, member_name = member
+                members.setdefault(os.path.abspath(zip_file), []).append(member_name)
+        shards.append({'Shard': f"shard_{len(shards):05d}", 'Tables': tables, 'Members': members})
+    return shards
+
+
+class ShardQueue:
+    """
+    Work queue of DR validation shards kept in a directory, so that workers on any host mounting it can join.
+
+    A shard moves from pending/ to claimed/ with an atomic rename, which only one worker can win. The
+    worker keeps touching its claim while it runs and writes its result to results/; claims left untouched
+    for the lease timeout, by a worker that died, are renamed back to pending/. The coordinator creates
+    the STOP file once every result is in, and idle workers exit when they see it.
+    """
+
+    def __init__(self, queue_dir: str):
+        self.queue_dir = queue_dir
+        self.pending_dir = os.path.join(queue_dir, QUEUE_PENDING_DIR)
+        self.claimed_dir = os.path.join(queue_dir, QUEUE_CLAIMED_DIR)
+        self.results_dir = os.path.join(queue_dir, QUEUE_RESULTS_DIR)
+        self.stop_path = os.path.join(queue_dir, QUEUE_STOP_FILE)
+
+    def reset(self):
+        """Empties the queue directory before a new run."""
+        for sub_dir in (self.pending_dir, self.claimed_dir, self.results_dir):
+            shutil.rmtree(sub_dir, ignore_errors=True)
+            os.makedirs(sub_dir)
+        if os.path.exists(self.stop_path):
+            os.remove(self.stop_path)
+
+    def put(self, shard: dict):
+        """Adds a shard to the pending work."""
+        write_json_atomically(os.path.join(self.pending_dir, f"{shard['Shard']}.json"), shard)
+
+    def claim(self, worker_id: str):
+        """Claims the first pending shard, returning its claim path and content, or None if nothing is pending."""
+        try:
+            file_names = sorted(os.listdir(self.pending_dir))
+        except FileNotFoundError:
+            # The coordinator is resetting the queue
+            return None
+        for file_name in file_names:
+            if not file_name.endswith('.json'):
+                continue
+            claim_path = os.path.join(self.claimed_dir, f"{get_shard_id(file_name)}.{worker_id}.json")
+            try:
+                os.rename(os.path.join(self.pending_dir, file_name), claim_path)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            # The rename keeps the time the shard was queued; the lease starts now
+            os.utime(claim_path)
+            return claim_path, read_json(claim_path)
+        return None
+
+    def complete(self, claim_path: str, result: dict):
+        """Publishes the result of a claimed shard and releases the claim."""
+        write_json_atomically(os.path.join(self.results_dir, f"{result['Shard']}.json"), result)
+        if os.path.exists(claim_path):
+            os.remove(claim_path)
+
+    def requeue_expired_claims(self, lease_timeout: float = CLAIM_LEASE_TIMEOUT) -> int:
+        """Puts the shards whose claim was not touched within the lease timeout back into the pending work."""
+        requeued = 0
+        for file_name in os.listdir(self.claimed_dir):
+            claim_path = os.path.join(self.claimed_dir, file_name)
+            try:
+                if time.time() - os.path.getmtime(claim_path) < lease_timeout:
+                    continue
+                os.rename(claim_path, os.path.join(self.pending_dir, f"{get_shard_id(file_name)}.json"))
+            except FileNotFoundError:
+                continue
+            logger.warning(f"Requeued {get_shard_id(file_name)}, its worker stopped renewing the claim")
+            requeued += 1
+        return requeued
+
+    def get_result_ids(self) -> set:
+        """Returns the ids of the shards whose result was published."""
+        return {get_shard_id(file_name) for file_name in os.listdir(self.results_dir) if file_name.endswith('.json')}
+
+    def get_result(self, shard_id: str) -> dict:
+        """Reads the result of a shard."""
+        return read_json(os.path.join(self.results_dir, f"{shard_id}.json"))
+
+    def stop(self):
+        """Tells idle workers to exit."""
+        open(self.stop_path, 'w').close()
+
+    def is_stopped(self) -> bool:
+        return os.path.exists(self.stop_path)
+
+
+def keep_claim_alive(claim_path: str, done: threading.Event):
+    """Touches a claim every heartbeat interval until the shard is done."""
+    while not done.wait(CLAIM_HEARTBEAT_INTERVAL):
+        try:
+            os.utime(claim_path)
+        except FileNotFoundError:
+            return
+
+
+def validate_shard(shard: dict, glue_max_concurrency: int = GLUE_MAX_CONCURRENCY) -> dict:
+    """
+    Reads the footers and Glue metadata of the tables of one shard and compares them.
+
+    Each table gets the details report entry write_table_comparison produces for it. A table that cannot
+    be compared keeps the part of its entry written before the error, together with the error, so that the
+    merged report stops at the same point as an unsharded run.
+
+    :param shard: Shard dictionary created by build_shards.
+    :param glue_max_concurrency: Glue requests in flight at once in this worker.
+    :return: Shard result with the verdicts and the file and Glue metadata of its tables.
+    """
+    file_md_dict = {}
+    for zip_file, member_names in shard['Members'].items():
+        file_md_dict.update(read_zip_parquet_headers(zip_file, read_parquet_file_metadata, set(member_names)))
+    table_list = [table for _, table in shard['Tables']]
+    tbl_md_dict = get_glue_catalog_metadata(table_list, max_concurrency=glue_max_concurrency)
+
+    verdicts = []
+    for position, table in shard['Tables']:
+        details_buffer = io.StringIO()
+        try:
+            table_name, result = write_table_comparison(details_buffer, table, file_md_dict, tbl_md_dict)
+            verdicts.append({'Position': position, 'Table': table_name, 'Result': result,
+                             'Details': details_buffer.getvalue()})
+        except Exception as e:
+            verdicts.append({'Position': position, 'Table': table, 'Result': None,
+                             'Details': details_buffer.getvalue(), 'Error': f"{type(e).__name__}: {e}"})
+    return {'Shard': shard['Shard'], 'Worker': get_worker_id(), 'Verdicts': verdicts,
+            'File_Metadata': file_md_dict, 'Table_Metadata': tbl_md_dict}
+
+
+def run_shard_worker(queue_dir: str, glue_max_concurrency: int = GLUE_MAX_CONCURRENCY) -> int:
+    """
+    Claims and validates shards from a queue directory until the coordinator stops the queue.
+
+    :param queue_dir: Queue directory shared with the coordinator.
+    :param glue_max_concurrency: Glue requests in flight at once in this worker.
+    :return: Number of shards validated.
+    """
+    queue = ShardQueue(queue_dir)
+    worker_id = get_worker_id()
+    shards_done = 0
+    logger.info(f"Worker {worker_id} joined {queue_dir}")
+    while not queue.is_stopped():
+        claimed = queue.claim(worker_id)
+        if claimed is None:
+            time.sleep(QUEUE_POLL_INTERVAL)
+            continue
+        claim_path, shard = claimed
+        done = threading.Event()
+        heartbeat = threading.Thread(target=keep_claim_alive, args=(claim_path, done), daemon=True)
+        heartbeat.start()
+        try:
+            start = time.perf_counter()
+            result = validate_shard(shard, glue_max_concurrency)
+            queue.complete(claim_path, result)
+            shards_done += 1
+            logger.info(f"Worker {worker_id} validated {shard['Shard']} ({len(shard['Tables'])} tables) "
+                        f"in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # Published like a result so that the coordinator fails the run, as an unsharded run would;
+            # only shards of workers that died are retried, once their claim expires
+            logger.error(f"Worker {worker_id} failed on {shard['Shard']}")
+            log_errors(e, detailed_traceback=True)
+            queue.complete(claim_path, {'Shard': shard['Shard'], 'Worker': worker_id,
+                                        'Error': f"{type(e).__name__}: {e}"})
+        finally:
+            done.set()
+    logger.info(f"Worker {worker_id} validated {shards_done} shards")
+    return shards_done
+
+
+def merge_shard_results(table_list: list, results: list) -> str:
+    """
+    Writes the summary and details reports of a sharded run, in config order, exactly as
+    compare_glue_tbl_structure writes them for the same tables.
+
+    :param table_list: Configured tables in the format "database_name,table_name".
+    :param results: Shard results of validate_shard.
+    :return: 'SUCCEEDED' or 'FAILED'.
+    """
+    failed_shards = [result for result in results if result.get('Error')]
+    if failed_shards:
+        for result in failed_shards:
+            logger.error(f"{result['Shard']} failed on worker {result['Worker']}: {result['Error']}")
+        return "FAILED"
+    verdicts = sorted((verdict for result in results for verdict in result['Verdicts']),
+                      key=lambda verdict: verdict['Position'])
+    file_md_dict = {}
+    tbl_md_dict = {}
+    for result in results:
+        file_md_dict.update({name: intern_metadata(md) for name, md in result['File_Metadata'].items()})
+        tbl_md_dict.update({name: intern_metadata(md) for name, md in result['Table_Metadata'].items()})
+    if len(verdicts) != len(table_list):
+        logger.error(f"Sharded results cover {len(verdicts)} of {len(table_list)} configured tables")
+        return "FAILED"
+
+    comparison_result = {}
+    summary_file_path, details_file_path = get_report_paths()
+    run_metrics = get_run_metrics()
+    with open(summary_file_path, 'w+') as sum_fl, open(details_file_path, 'w+') as dtl_fl:
+        for verdict in verdicts:
+            dtl_fl.write(verdict['Details'])
+            if verdict.get('Error'):
+                logger.error(f"Comparison of {verdict['Table']} failed: {verdict['Error']}")
+                return "FAILED"
+            comparison_result[verdict['Table']] = verdict['Result']
+        with run_metrics.stage('report_write'):
+            validation = write_comparison_summary(sum_fl, comparison_result, file_md_dict, tbl_md_dict)
+        run_metrics.record('report_write', items=len(comparison_result))
+    write_run_metrics(summary_file_path)
+    record_run_history(summary_file_path, table_list, comparison_result, file_md_dict, tbl_md_dict, validation)
+    return validation
+
+
+def run_sharded_validation(table_list: list, dr_zip_file_dir: str, queue_dir: str, workers: int = None,
+                           shard_count: int = None, zip_files: list = None) -> str:
+    """
+    Shards a DR comparison over worker processes through a queue directory and merges their reports.
+
+    Local worker processes are started here; workers on other hosts join by running this module with
+    the worker command against the same, shared queue directory. Each local worker gets an equal part of
+    the Glue request concurrency, and the adaptive rate limiter of each backs off on its own when Glue
+    throttles.
+
+    :param table_list: Configured tables in the format "database_name,table_name".
+    :param dr_zip_file_dir: Directory containing the DR zip files, reachable under the same path by every worker.
+    :param queue_dir: Queue directory shared with the workers.
+    :param workers: Local worker processes, the CPU count if not provided; 0 relies on remote workers only.
+    :param shard_count: Number of shards, SHARDS_PER_WORKER per local worker if not provided.
+    :param zip_files: Only read these zip files instead of every zip file in the directory.
+    :return: 'SUCCEEDED' or 'FAILED'.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    shard_count = shard_count or max(1, workers) * SHARDS_PER_WORKER
+    zip_files = glob(f"{dr_zip_file_dir}/*.zip") if zip_files is None else list(zip_files)
+    queue = ShardQueue(queue_dir)
+    queue.reset()
+    shards = build_shards(table_list, zip_files, shard_count)
+    for shard in shards:
+        queue.put(shard)
+    logger.info(f"Queued {len(table_list)} tables in {len(shards)} shards for {workers} local workers in {queue_dir}")
+
+    glue_max_concurrency = max(1, GLUE_MAX_CONCURRENCY // max(1, workers))
+    processes = [multiprocessing.Process(target=run_shard_worker, args=(queue_dir, glue_max_concurrency), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        shard_ids = {shard['Shard'] for shard in shards}
+        while not shard_ids <= queue.get_result_ids():
+            if processes and not any(process.is_alive() for process in processes):
+                logger.error(f"All local workers exited with {len(shard_ids - queue.get_result_ids())} shards left")
+                return "FAILED"
+            queue.requeue_expired_claims()
+            time.sleep(QUEUE_POLL_INTERVAL)
+    finally:
+        queue.stop()
+        for process in processes:
+            process.join()
+
+    results = [queue.get_result(shard_id) for shard_id in sorted(shard_ids)]
+    shards_by_worker = {}
+    for result in results:
+        shards_by_worker[result['Worker']] = shards_by_worker.get(result['Worker'], 0) + 1
+    logger.info(f"Shards validated per worker: {shards_by_worker}")
+    return merge_shard_results(table_list, results)
+
+
+def dr_sharded_main_process(dr_zip_file_dir: str, queue_dir: str, workers: int = None, shard_count: int = None,
+                            zip_files: list = None) -> dict:
+    """Sharded counterpart of new_dr_compare_glue.dr_glue_main_process for the tables of the config file."""
+    start_run_metrics()
+    try:
+        with open(f'./config/dr_table_config.txt', 'r') as tbl_cfg_fl:
+            table_list = tbl_cfg_fl.read().splitlines()
+        if not table_list:
+            logger.warning(f"Config Tables list is empty.")
+            return {"Glue Table Validation": "FAILED"}
+        val_res = run_sharded_validation(table_list, dr_zip_file_dir, queue_dir, workers, shard_count, zip_files)
+        return {"Glue Table Validation": val_res}
+    except Exception as e:
+        log_errors(e, detailed_traceback=True)
+        return {"Glue Table Validation": "FAILED"}
+
+
+def main(argv: list = None) -> int:
+    """Command line entry point for the sharded DR Glue comparison and its workers."""
+    parser = argparse.ArgumentParser(description="Shard the DR Glue comparison across worker processes and hosts.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    coordinate = commands.add_parser('coordinate', help="Queue the shards, run local workers and merge the reports.")
+    coordinate.add_argument('dr_zip_file_dir', help="Directory containing the DR zip files.")
+    coordinate.add_argument('queue_dir', help="Queue directory shared with the workers.")
+    coordinate.add_argument('--workers', type=int, help="Local worker processes, the CPU count by default.")
+    coordinate.add_argument('--shards', type=int, help=f"Number of shards, {SHARDS_PER_WORKER} per worker by default.")
+    worker = commands.add_parser('worker', help="Join a coordinator through its queue directory.")
+    worker.add_argument('queue_dir', help="Queue directory shared with the coordinator.")
+    worker.add_argument('--glue-max-concurrency', type=int, default=GLUE_MAX_CONCURRENCY,
+                        help="Glue requests in flight at once in this worker.")
+    for command_parser in (coordinate, worker):
+        add_schema_cache_arguments(command_parser)
+        add_glue_cache_arguments(command_parser)
+    add_run_history_arguments(coordinate)
+    args = parser.parse_args(argv)
+
+    configure_schema_cache_from_args(args)
+    configure_glue_cache_from_args(args)
+    if args.command == 'worker':
+        run_shard_worker(args.queue_dir, args.glue_max_concurrency)
+        return 0
+    configure_run_history_from_args(args)
+    result = dr_sharded_main_process(args.dr_zip_file_dir, args.queue_dir, args.workers, args.shards)
+    logger.info(f"Sharded DR Glue comparison result: {result}")
+    return 0 if result.get("Glue Table Validation") == "SUCCEEDED" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
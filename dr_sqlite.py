@@ -0,0 +1,30 @@
+import os
+import sqlite3
+
+
+class SqliteStore:
+    """
+    Base of the SQLite files shared by DR runs (schema cache, Glue cache, run history).
+
+    Subclasses list the statements creating their tables in SCHEMA. The connection is opened lazily in WAL mode
+    and reopened in a forked worker, since a SQLite connection must not be used across a fork.
+    """
+
+    SCHEMA = ()
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = None
+        self.conn_pid = None
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Returns the SQLite connection of the current process, opening it after a fork if needed."""
+        if self.conn is None or self.conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                self.conn.execute(statement)
+            self.conn_pid = os.getpid()
+        return self.conn
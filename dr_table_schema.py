@@ -0,0 +1,106 @@
+import sys
+import hashlib
+import threading
+import weakref
+
+# Metadata keys holding the ordered column names of a parquet file or a Glue table
+SCHEMA_KEYS = ('File_Columns_Names', 'Table_Columns_Names')
+
+
+def get_schema_fingerprint(columns: tuple) -> int:
+    """Returns a 64-bit fingerprint of an ordered list of column names."""
+    digest = hashlib.blake2b('\x00'.join(columns).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class TableSchema:
+    """
+    Immutable, interned list of column names with a precomputed 64-bit fingerprint.
+
+    Identical schemas share one instance, so thousands of tables with the same columns cost a single
+    tuple. The instance behaves like the column list it replaces: it has the same length, iteration
+    and printed form, and compares equal to a list with the same names.
+    """
+
+    __slots__ = ('columns', 'fingerprint', '__weakref__')
+
+    def __init__(self, columns: tuple, fingerprint: int):
+        self.columns = columns
+        self.fingerprint = fingerprint
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __getitem__(self, index):
+        return self.columns[index]
+
+    def __hash__(self) -> int:
+        return self.fingerprint
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if isinstance(other, TableSchema):
+            # Interned schemas are only distinct objects when their columns differ, unless the fingerprints collide
+            return self.fingerprint == other.fingerprint and self.columns == other.columns
+        if isinstance(other, (list, tuple)):
+            return self.columns == tuple(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        # Printed like the list it replaces so that report lines are unchanged
+        return repr(list(self.columns))
+
+    def __reduce__(self):
+        # Re-intern when unpickled in another process
+        return intern_schema, (self.columns,)
+
+    def diff(self, other) -> list:
+        """
+        Lists the positions where two schemas differ.
+
+        :param other: Schema or column list to compare with.
+        :return: List of (position, this column, other column) tuples; a missing column is None.
+        """
+        other_columns = tuple(other)
+        return [(position, self.columns[position] if position < len(self.columns) else None,
+                 other_columns[position] if position < len(other_columns) else None)
+                for position in range(max(len(self.columns), len(other_columns)))
+                if position >= len(self.columns) or position >= len(other_columns)
+                or self.columns[position] != other_columns[position]]
+
+
+# Schemas in use, keyed by their column tuple; unused schemas are dropped with their last reference
+interned_schemas = weakref.WeakValueDictionary()
+interned_schemas_lock = threading.Lock()
+
+
+def intern_schema(columns) -> TableSchema:
+    """Returns the shared TableSchema of an ordered list of column names, creating it on first use."""
+    if isinstance(columns, TableSchema):
+        return columns
+    columns = tuple(sys.intern(str(column)) for column in columns)
+    with interned_schemas_lock:
+        schema = interned_schemas.get(columns)
+        if schema is None:
+            schema = TableSchema(columns, get_schema_fingerprint(columns))
+            interned_schemas[columns] = schema
+        return schema
+
+
+def intern_metadata(metadata: dict) -> dict:
+    """Replaces the column name lists of a file or table metadata dictionary with interned schemas."""
+    for key in SCHEMA_KEYS:
+        if key in metadata:
+            metadata[key] = intern_schema(metadata[key])
+    return metadata
+
+
+def encode_schema(value):
+    """json.dumps default hook writing a TableSchema as the plain list of its column names."""
+    if isinstance(value, TableSchema):
+        return list(value.columns)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
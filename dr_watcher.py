@@ -0,0 +1,221 @@
+import os
+import sys
+import time
+import signal
+import zipfile
+import argparse
+import threading
+from datetime import datetime
+from aws_utils_func import log_errors, configure_logging
+from dr_drop_index import DropIndex, get_drop_key
+from dr_schema_cache import add_schema_cache_arguments, configure_schema_cache_from_args
+from glue_metadata_cache import add_glue_cache_arguments, configure_glue_cache_from_args
+from dr_run_history import add_run_history_arguments, configure_run_history_from_args
+from new_dr_compare_glue import dr_glue_main_process
+
+# Logger configuration
+logger = configure_logging()
+
+# Polling interval right after activity, and the ceiling it backs off to while the directory is idle
+WATCH_MIN_INTERVAL = 1.0
+WATCH_MAX_INTERVAL = 30.0
+WATCH_BACKOFF_FACTOR = 2.0
+# Consecutive polls a file must keep the same size and modification time before it counts as fully written
+WATCH_STABLE_POLLS = 2
+
+
+def get_file_signature(file_path: str):
+    """Returns the size and modification time of a file, or None if it disappeared."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class DropWatcher:
+    """
+    Polls a directory for complete par01-par03 DR drops and hands each one to a callback once all its
+    files have finished writing.
+
+    A file is considered written once its size and modification time stayed the same for
+    WATCH_STABLE_POLLS polls and its zip central directory can be read. The polling interval starts at
+    min_interval and doubles, up to max_interval, for every poll that finds nothing new.
+    """
+
+    def __init__(self, dr_zip_file_dir: str, on_drop, since=None, min_interval: float = WATCH_MIN_INTERVAL,
+                 max_interval: float = WATCH_MAX_INTERVAL, stable_polls: int = WATCH_STABLE_POLLS):
+        """
+        :param dr_zip_file_dir: Directory the DR zip files land in.
+        :param on_drop: Callable receiving the (date, time) key and the files of each ready drop.
+        :param since: Only drops at or after this date/time are handed over; by default only the drops
+            completed after the watcher started.
+        :param min_interval: Polling interval in seconds after activity.
+        :param max_interval: Polling interval in seconds the watcher backs off to while idle.
+        :param stable_polls: Polls a file must stay unchanged before it is considered written.
+        """
+        self.dr_zip_file_dir = dr_zip_file_dir
+        self.on_drop = on_drop
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stable_polls = stable_polls
+        self.drop_index = DropIndex()
+        self.signatures = {}
+        self.handled = set()
+        self.drops_handed_over = 0
+        self.stop_event = threading.Event()
+        self.drop_index.refresh_local(dr_zip_file_dir)
+        if since is None:
+            # Drops already complete at startup are left to the scheduled runs that covered them
+            self.handled.update(self.get_complete_keys())
+            self.since = None
+        else:
+            self.since = get_drop_key(since)
+
+    def get_complete_keys(self) -> list:
+        """Returns the keys of the complete drops indexed so far."""
+        with self.drop_index.lock:
+            return list(self.drop_index.complete_keys)
+
+    def is_file_ready(self, file_path: str) -> bool:
+        """Checks whether a file kept its size and modification time for enough polls and is a readable zip."""
+        signature = get_file_signature(file_path)
+        previous, stable_count = self.signatures.get(file_path, (None, 0))
+        stable_count = stable_count + 1 if signature is not None and signature == previous else 0
+        self.signatures[file_path] = signature, stable_count
+        return stable_count >= self.stable_polls and zipfile.is_zipfile(file_path)
+
+    def poll(self) -> bool:
+        """
+        Indexes new files and hands over every drop whose files are all written.
+
+        :return: True if anything changed since the previous poll.
+        """
+        activity = self.drop_index.refresh_local(self.dr_zip_file_dir) > 0
+        for drop_key in self.get_complete_keys():
+            if drop_key in self.handled or (self.since is not None and drop_key < self.since):
+                continue
+            drop_files = self.drop_index.get_drop_files(drop_key)
+            # Every file is checked on every poll so that all of them accumulate stable polls together
+            ready = [self.is_file_ready(file_path) for file_path in drop_files]
+            activity = True
+            if all(ready):
+                self.handled.add(drop_key)
+                for file_path in drop_files:
+                    self.signatures.pop(file_path, None)
+                logger.info(f"DR drop {'-'.join(drop_key)} finished writing: {drop_files}")
+                self.drops_handed_over += 1
+                self.on_drop(drop_key, drop_files)
+        return activity
+
+    def run(self, max_drops: int = None):
+        """
+        Polls until stopped, or until max_drops drops were handed over.
+
+        :param max_drops: Number of drops after which the watcher returns, unlimited if not provided.
+        """
+        interval = self.min_interval
+        logger.info(f"Watching {self.dr_zip_file_dir} for DR drops")
+        while not self.stop_event.is_set():
+            try:
+                activity = self.poll()
+            except Exception as e:
+                logger.error(f"Error polling {self.dr_zip_file_dir}")
+                log_errors(e, detailed_traceback=True)
+                activity = False
+            if max_drops is not None and self.drops_handed_over >= max_drops:
+                break
+            interval = self.min_interval if activity else min(self.max_interval, interval * WATCH_BACKOFF_FACTOR)
+            self.stop_event.wait(interval)
+        logger.info(f"Stopped watching {self.dr_zip_file_dir}")
+
+    def stop(self):
+        """Makes run return after the poll in progress."""
+        self.stop_event.set()
+
+
+def watch_dr_drops(dr_zip_file_dir: str, dr_input_file_dir: str, extract_members: bool = False,
+                   pipelined: bool = False, quick_validate: bool = False, since=None, max_drops: int = None,
+                   min_interval: float = WATCH_MIN_INTERVAL, max_interval: float = WATCH_MAX_INTERVAL) -> list:
+    """
+    Validates every new DR drop as soon as its par01-par03 files have finished writing.
+
+    The process stays up between drops, so the schema and Glue metadata caches, the Glue client and its
+    rate limiter stay warm from one drop to the next.
+
+    :param dr_zip_file_dir: Directory the DR zip files land in.
+    :param dr_input_file_dir: Directory the DR zip files are extracted to.
+    :param extract_members: Extract every member to disk first; otherwise only parquet footers are read.
+    :param pipelined: Compare each table as soon as its file and Glue schemas are available.
+    :param quick_validate: Check the footer row counts against the Glue table parameters first.
+    :param since: Also validate the drops at or after this date/time that are already complete.
+    :param max_drops: Number of drops after which the watcher returns, unlimited if not provided.
+    :param min_interval: Polling interval in seconds after activity.
+    :param max_interval: Polling interval in seconds the watcher backs off to while idle.
+    :return: List of the validation results of the drops handled.
+    """
+    results = []
+
+    def validate_drop(drop_key, drop_files):
+        drop_name = '-'.join(drop_key)
+        start = time.perf_counter()
+        try:
+            result = dr_glue_main_process(dr_zip_file_dir, dr_input_file_dir, extract_members, pipelined,
+                                          quick_validate, zip_files=drop_files)
+        except Exception as e:
+            log_errors(e, detailed_traceback=True)
+            result = {"Glue Table Validation": "FAILED"}
+        logger.info(f"DR drop {drop_name} validated in {time.perf_counter() - start:.2f}s: {result}")
+        results.append({'Drop': drop_name, 'Validated_At': datetime.now().isoformat(), **result})
+
+    watcher = DropWatcher(dr_zip_file_dir, validate_drop, since, min_interval, max_interval)
+    previous_handler = signal.getsignal(signal.SIGTERM) if threading.current_thread() is threading.main_thread() \
+        else None
+    if previous_handler is not None:
+        signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run(max_drops)
+    except KeyboardInterrupt:
+        logger.info("Watcher interrupted")
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGTERM, previous_handler)
+    return results
+
+
+def main(argv: list = None) -> int:
+    """Command line entry point for the DR drop watcher."""
+    parser = argparse.ArgumentParser(description="Validate DR drops as soon as they land in a directory.")
+    parser.add_argument('dr_zip_file_dir', help="Directory the DR zip files land in.")
+    parser.add_argument('dr_input_file_dir', help="Directory the DR zip files are extracted to.")
+    parser.add_argument('--extract-members', action='store_true',
+                        help="Extract every zip member to disk instead of reading parquet footers in place.")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Compare each table as soon as its file and Glue schemas are available.")
+    parser.add_argument('--quick-validate', action='store_true',
+                        help="Check the footer row counts against the Glue table parameters before comparing.")
+    parser.add_argument('--since', help="Also validate complete drops at or after YYYYMMDD[-HHMM].")
+    parser.add_argument('--max-drops', type=int, help="Exit after validating this many drops.")
+    parser.add_argument('--min-interval', type=float, default=WATCH_MIN_INTERVAL,
+                        help="Polling interval in seconds after activity.")
+    parser.add_argument('--max-interval', type=float, default=WATCH_MAX_INTERVAL,
+                        help="Polling interval in seconds while the directory is idle.")
+    add_schema_cache_arguments(parser)
+    add_glue_cache_arguments(parser)
+    add_run_history_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.quick_validate and args.pipeline:
+        parser.error("--quick-validate is not supported together with --pipeline.")
+
+    configure_schema_cache_from_args(args)
+    configure_glue_cache_from_args(args)
+    configure_run_history_from_args(args)
+    results = watch_dr_drops(args.dr_zip_file_dir, args.dr_input_file_dir, args.extract_members, args.pipeline,
+                             args.quick_validate, args.since, args.max_drops, args.min_interval, args.max_interval)
+    failed = [result['Drop'] for result in results if result.get("Glue Table Validation") != "SUCCEEDED"]
+    logger.info(f"Validated {len(results)} DR drops, {len(failed)} failed: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import io
+import os
+import json
+import time
+import shutil
+import struct
+import zipfile
+import tempfile
+import pyarrow as pa
+from aws_utils_func import log_errors, configure_logging
+from dr_schema_cache import get_schema_cache, get_member_cache_key, get_parquet_file_name
+from dr_metrics import get_run_metrics
+
+# Logger configuration
+logger = configure_logging()
+
+# Fixed part of a zip local file header: signature, versions, flags, method, times, crc, sizes, name/extra lengths
+LOCAL_HEADER_STRUCT = struct.Struct('<4sHHHHHIIIHH')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+# Parquet files end with a 4-byte little-endian footer length followed by the PAR1 magic
+PARQUET_MAGIC = b'PAR1'
+PARQUET_TRAILER_SIZE = 8
+
+# pyarrow speculatively reads this much from the end of a file when opening it
+PARQUET_FOOTER_READ_SIZE = 64 * 1024
+
+# Trailing window kept in memory when a compressed member has to be decompressed to reach its footer
+MEMBER_TAIL_SIZE = 1024 * 1024
+
+# Copy buffer used when extracting members to disk
+EXTRACT_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class ZipMemberTail(io.RawIOBase):
+    """Seekable, read-only view of the trailing bytes of a zip member, sized like the full member."""
+
+    def __init__(self, tail: bytes, size: int):
+        self.tail = tail
+        self.size = size
+        self.tail_start = size - len(tail)
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        if self.position < self.tail_start:
+            raise OSError(f"Read at offset {self.position} is outside the buffered footer window")
+        start = self.position - self.tail_start
+        data = self.tail[start:] if size is None or size < 0 else self.tail[start:start + size]
+        self.position += len(data)
+        return data
+
+
+def is_parquet_member(zip_info: zipfile.ZipInfo) -> bool:
+    """Checks whether a zip member is a parquet file."""
+    return not zip_info.is_dir() and zip_info.filename.endswith('.parquet')
+
+
+def list_parquet_members(zip_ref: zipfile.ZipFile) -> list:
+    """Lists the parquet members recorded in the central directory of an open zip file."""
+    return [zip_info for zip_info in zip_ref.infolist() if is_parquet_member(zip_info)]
+
+
+def read_zip_manifest(zip_file: str) -> list:
+    """Lists the parquet member names recorded in the central directory of a zip file."""
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        return [zip_info.filename for zip_info in list_parquet_members(zip_ref)]
+
+
+def get_zip_staging_dir(zip_file: str, output_dir: str) -> str:
+    """Returns the isolated directory a zip file is staged into, so concurrent extractions never collide."""
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(zip_file))[0])
+
+
+def get_member_data_offset(archive_buffer: pa.Buffer, zip_info: zipfile.ZipInfo) -> int:
+    """Returns the offset of the first data byte of a zip member inside the archive."""
+    header = LOCAL_HEADER_STRUCT.unpack(
+        archive_buffer.slice(zip_info.header_offset, LOCAL_HEADER_STRUCT.size).to_pybytes())
+    if header[0] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header for member: {zip_info.filename}")
+    name_length, extra_length = header[9], header[10]
+    return zip_info.header_offset + LOCAL_HEADER_STRUCT.size + name_length + extra_length
+
+
+def read_member_tail(zip_ref: zipfile.ZipFile, zip_info: zipfile.ZipInfo, tail_size: int = MEMBER_TAIL_SIZE) -> bytes:
+    """Decompresses a zip member in a single streaming pass, keeping only its trailing bytes."""
+    tail_start = max(0, zip_info.file_size - tail_size)
+    with zip_ref.open(zip_info) as member:
+        member.seek(tail_start)
+        return member.read()
+
+
+def open_parquet_member(zip_ref: zipfile.ZipFile, zip_info: zipfile.ZipInfo,
+                        archive_buffer: pa.Buffer = None) -> pa.NativeFile:
+    """
+    Opens a parquet zip member as a seekable pyarrow source that is good for footer reads.
+
+    ZIP_STORED members are served as a zero-copy slice of the memory-mapped archive. Compressed
+    members are decompressed once in memory and only the trailing window holding the footer is kept.
+
+    :param zip_ref: Open zip file containing the member.
+    :param zip_info: Central directory entry of the parquet member.
+    :param archive_buffer: Zero-copy buffer over the memory-mapped archive, if available.
+    :return: pyarrow source positioned at the start of the member.
+    """
+    encrypted = zip_info.flag_bits & 0x1
+    if archive_buffer is not None and zip_info.compress_type == zipfile.ZIP_STORED and not encrypted:
+        data_offset = get_member_data_offset(archive_buffer, zip_info)
+        return pa.BufferReader(archive_buffer.slice(data_offset, zip_info.file_size))
+
+    tail = read_member_tail(zip_ref, zip_info)
+    if len(tail) >= PARQUET_TRAILER_SIZE and tail[-4:] == PARQUET_MAGIC:
+        footer_length = struct.unpack('<I', tail[-PARQUET_TRAILER_SIZE:-4])[0]
+        footer_window = max(footer_length + PARQUET_TRAILER_SIZE, PARQUET_FOOTER_READ_SIZE)
+        if footer_window > len(tail) and len(tail) < zip_info.file_size:
+            logger.debug(f"Footer of {zip_info.filename} exceeds the tail window, re-reading {footer_window} bytes")
+            tail = read_member_tail(zip_ref, zip_info, footer_window)
+    return pa.PythonFile(ZipMemberTail(tail, zip_info.file_size), mode='r')
+
+
+def get_cached_zip_headers(zip_file: str, read_metadata):
+    """Returns the metadata of every parquet member of a zip file if all of them are cached, otherwise None."""
+    cache = get_schema_cache()
+    reader_name = getattr(read_metadata, 'cache_reader', None)
+    if cache is None or reader_name is None:
+        return None
+    file_metadata_dict = {}
+    try:
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            for zip_info in list_parquet_members(zip_ref):
+                metadata = cache.get(get_member_cache_key(zip_info, reader_name))
+                if metadata is None:
+                    return None
+                file_metadata_dict[get_parquet_file_name(zip_info.filename)] = metadata
+    except (zipfile.BadZipFile, OSError) as e:
+        log_errors(e, detailed_traceback=True)
+        return None
+    logger.info(f"Served {len(file_metadata_dict)} parquet headers of {zip_file} from the schema cache")
+    return file_metadata_dict
+
+
+def put_zip_headers(zip_file: str, file_metadata_dict: dict, read_metadata):
+    """Caches the metadata read for the parquet members of a zip file under their member keys."""
+    cache = get_schema_cache()
+    reader_name = getattr(read_metadata, 'cache_reader', None)
+    if cache is None or reader_name is None:
+        return
+    try:
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            for zip_info in list_parquet_members(zip_ref):
+                metadata = file_metadata_dict.get(get_parquet_file_name(zip_info.filename))
+                if metadata and metadata['File_Columns_Counts']:
+                    cache.put(get_member_cache_key(zip_info, reader_name), metadata)
+    except (zipfile.BadZipFile, OSError) as e:
+        log_errors(e, detailed_traceback=True)
+
+
+def read_member_header(zip_file: str, zip_ref: zipfile.ZipFile, zip_info: zipfile.ZipInfo, read_metadata,
+                       archive_buffer: pa.Buffer = None) -> tuple:
+    """
+    Reads the footer of one parquet zip member and caches it under its member key.
+
+    :param zip_file: Path to the zip file, used in log messages.
+    :param zip_ref: Open zip file containing the member.
+    :param zip_info: Central directory entry of the parquet member.
+    :param read_metadata: Callable taking a member name and a pyarrow source, returning (file name, metadata).
+    :param archive_buffer: Zero-copy buffer over the memory-mapped archive, if available.
+    :return: Tuple of the parquet file name and its metadata.
+    """
+    cache = get_schema_cache()
+    reader_name = getattr(read_metadata, 'cache_reader', None)
+    run_metrics = get_run_metrics()
+    with run_metrics.stage('footer_read'):
+        try:
+            source = open_parquet_member(zip_ref, zip_info, archive_buffer)
+        except (zipfile.BadZipFile, OSError, EOFError) as e:
+            logger.error(f"Unable to open member {zip_info.filename} of {zip_file}")
+            log_errors(e, detailed_traceback=True)
+            source = pa.BufferReader(b'')
+        with source:
+            parquet_file_name, metadata = read_metadata(os.path.basename(zip_info.filename), source)
+    # Stored members are sliced zero-copy, so only the footer is touched; compressed ones are streamed in full
+    bytes_read = zip_info.compress_size if not is_stored_member(zip_info) \
+        else min(zip_info.file_size, PARQUET_FOOTER_READ_SIZE)
+    run_metrics.record('footer_read', items=1, bytes_read=bytes_read)
+    if cache and reader_name and metadata['File_Columns_Counts']:
+        cache.put(get_member_cache_key(zip_info, reader_name), metadata)
+    return parquet_file_name, metadata
+
+
+def is_stored_member(zip_info: zipfile.ZipInfo) -> bool:
+    """Checks whether a zip member is stored uncompressed and unencrypted, so it can be read zero-copy."""
+    return zip_info.compress_type == zipfile.ZIP_STORED and not zip_info.flag_bits & 0x1
+
+
+def get_cached_member_header(zip_info: zipfile.ZipInfo, read_metadata):
+    """Returns the cached metadata of a parquet zip member, or None on a miss or when caching is disabled."""
+    cache = get_schema_cache()
+    reader_name = getattr(read_metadata, 'cache_reader', None)
+    if cache is None or reader_name is None:
+        return None
+    return cache.get(get_member_cache_key(zip_info, reader_name))
+
+
+def scan_zip_parquet_headers(zip_file: str, read_metadata, stored_only: bool = False, members=None) -> tuple:
+    """
+    Reads parquet footers straight out of a zip file without extracting any member to disk.
+
+    Members already in the schema cache, keyed by their CRC32, size and name, are not opened at all.
+
+    :param zip_file: Path to the zip file.
+    :param read_metadata: Callable taking a member name and a pyarrow source, returning (file name, metadata).
+    :param stored_only: Only read uncompressed members and hand the compressed ones back to the caller.
+    :param members: Only read the members with these names, every parquet member if not provided.
+    :return: Metadata dictionary for the parquet members read, and the compressed members left unread.
+    """
+    file_metadata_dict = {}
+    compressed_members = []
+    try:
+        with pa.memory_map(zip_file, 'r') as archive_map, zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            archive_buffer = archive_map.read_buffer()
+            for zip_info in list_parquet_members(zip_ref):
+                if members is not None and zip_info.filename not in members:
+                    continue
+                metadata = get_cached_member_header(zip_info, read_metadata)
+                if metadata is not None:
+                    file_metadata_dict[get_parquet_file_name(zip_info.filename)] = metadata
+                    get_run_metrics().record('footer_read', items=1)
+                elif stored_only and not is_stored_member(zip_info):
+                    compressed_members.append(zip_info)
+                else:
+                    parquet_file_name, metadata = read_member_header(zip_file, zip_ref, zip_info, read_metadata,
+                                                                     archive_buffer)
+                    file_metadata_dict[parquet_file_name] = metadata
+        logger.info(f"Read {len(file_metadata_dict)} parquet footers from {zip_file} without extraction")
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as e:
+        log_errors(e, detailed_traceback=True)
+    return file_metadata_dict, compressed_members
+
+
+def read_zip_parquet_headers(zip_file: str, read_metadata, members=None) -> dict:
+    """Reads the footers of the parquet members of a zip file in place, all of them unless members are given."""
+    return scan_zip_parquet_headers(zip_file, read_metadata, members=members)[0]
+
+
+def read_compressed_member_header(zip_file: str, zip_info: zipfile.ZipInfo, read_metadata) -> tuple:
+    """Decompresses the tail of one compressed parquet member and reads its footer."""
+    try:
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            return read_member_header(zip_file, zip_ref, zip_info, read_metadata)
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as e:
+        log_errors(e, detailed_traceback=True)
+        return read_metadata(os.path.basename(zip_info.filename), pa.BufferReader(b''))
+
+
+def get_extract_manifest_path(zip_file: str, output_dir: str) -> str:
+    """Returns the sidecar file recording the members of a zip file already extracted into a directory."""
+    return os.path.join(output_dir, f".{os.path.basename(zip_file)}.extracted.json")
+
+
+def read_extract_manifest(manifest_path: str) -> dict:
+    """Loads the extraction manifest of a zip file, or an empty one if it is missing or unreadable."""
+    try:
+        with open(manifest_path, 'r') as manifest_fl:
+            return json.load(manifest_fl)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_file_atomically(target_path: str, write_content):
+    """Writes a file through a temporary file in the same directory renamed over the target on success."""
+    target_dir = os.path.dirname(target_path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=target_dir, prefix=f".{os.path.basename(target_path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp_fl:
+            write_content(temp_fl)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def get_member_signature(zip_info: zipfile.ZipInfo) -> dict:
+    """Returns the CRC32, size and timestamp recorded for a member in the zip central directory."""
+    return {'CRC': zip_info.CRC, 'Size': zip_info.file_size, 'Date_Time': list(zip_info.date_time)}
+
+
+def is_member_extracted(zip_info: zipfile.ZipInfo, target_path: str, manifest_entry: dict) -> bool:
+    """Checks whether a member on disk is the one recorded in the manifest and unchanged in the zip file."""
+    if not manifest_entry or {key: manifest_entry.get(key) for key in ('CRC', 'Size', 'Date_Time')} \
+            != get_member_signature(zip_info):
+        return False
+    try:
+        stat = os.stat(target_path)
+    except OSError:
+        return False
+    return stat.st_size == zip_info.file_size and stat.st_mtime_ns == manifest_entry.get('Mtime_Ns')
+
+
+def extract_zip_incremental(zip_file: str, output_dir: str, buffer_size: int = EXTRACT_BUFFER_SIZE) -> dict:
+    """
+    Extracts a zip file, rewriting only the members whose CRC32, size or timestamp changed since the last run.
+
+    Each member is written to a temporary file and renamed into place, so readers never see a partial file.
+    The central directory signature of every extracted member is kept in a sidecar manifest next to it.
+
+    :param zip_file: Path to the zip file.
+    :param output_dir: Directory to extract the contents of the zip file.
+    :param buffer_size: Size of the copy buffer used for each member.
+    :return: Counts of the files and bytes written and skipped.
+    """
+    with get_run_metrics().stage('extraction'):
+        stats = extract_zip_members(zip_file, output_dir, buffer_size)
+    get_run_metrics().record('extraction', items=stats['Written_Files'], bytes_read=stats['Read_Bytes'])
+    logger.info(f"Extracted {zip_file} to {output_dir}: wrote {stats['Written_Files']} files "
+                f"({stats['Written_Bytes']} bytes), skipped {stats['Skipped_Files']} unchanged files "
+                f"({stats['Skipped_Bytes']} bytes)")
+    return stats
+
+
+def extract_zip_members(zip_file: str, output_dir: str, buffer_size: int) -> dict:
+    """Writes the changed members of a zip file and its manifest, returning the extraction counts."""
+    stats = {'Written_Files': 0, 'Written_Bytes': 0, 'Skipped_Files': 0, 'Skipped_Bytes': 0, 'Read_Bytes': 0}
+    os.makedirs(output_dir, exist_ok=True)
+    output_root = os.path.realpath(output_dir)
+    manifest_path = get_extract_manifest_path(zip_file, output_dir)
+    manifest = read_extract_manifest(manifest_path)
+    extracted = {}
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        for zip_info in zip_ref.infolist():
+            target_path = os.path.realpath(os.path.join(output_dir, zip_info.filename))
+            if os.path.commonpath([output_root, target_path]) != output_root:
+                logger.warning(f"Skipping member outside of the output directory: {zip_info.filename}")
+                continue
+            if zip_info.is_dir():
+                os.makedirs(target_path, exist_ok=True)
+                continue
+            if is_member_extracted(zip_info, target_path, manifest.get(zip_info.filename)):
+                extracted[zip_info.filename] = manifest[zip_info.filename]
+                stats['Skipped_Files'] += 1
+                stats['Skipped_Bytes'] += zip_info.file_size
+                continue
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with zip_ref.open(zip_info) as member:
+                write_file_atomically(target_path,
+                                      lambda target_fl: shutil.copyfileobj(member, target_fl, buffer_size))
+            mtime = time.mktime(zip_info.date_time + (0, 0, -1))
+            os.utime(target_path, (mtime, mtime))
+            extracted[zip_info.filename] = {**get_member_signature(zip_info),
+                                            'Mtime_Ns': os.stat(target_path).st_mtime_ns}
+            stats['Written_Files'] += 1
+            stats['Written_Bytes'] += zip_info.file_size
+            stats['Read_Bytes'] += zip_info.compress_size
+    write_file_atomically(manifest_path, lambda manifest_fl: manifest_fl.write(json.dumps(extracted).encode()))
+    return stats
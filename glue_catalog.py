@@ -0,0 +1,421 @@
+import os
+import re
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+import concurrent.futures
+from collections import Counter, defaultdict
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, EndpointConnectionError, ConnectionClosedError, ReadTimeoutError, \
+    ConnectTimeoutError
+from aws_utils_func import log_errors, configure_logging
+from rate_limiter import AdaptiveRateLimiter, get_backoff_delay
+from glue_metadata_cache import get_glue_cache
+from dr_metrics import get_run_metrics
+from dr_table_schema import intern_schema
+
+# Logger configuration
+logger = configure_logging()
+
+# Glue rejects get_tables Expression patterns longer than this
+GLUE_EXPRESSION_MAX_LENGTH = 2048
+
+# Error codes Glue answers with when a caller exceeds its request rate
+THROTTLING_ERROR_CODES = ('ThrottlingException', 'Throttling', 'TooManyRequestsException', 'RequestLimitExceeded')
+# Server-side errors and connection failures that are retried like throttling
+GLUE_TRANSIENT_ERROR_CODES = ('InternalServiceException', 'OperationTimeoutException', 'ServiceUnavailableException')
+GLUE_CONNECTION_ERRORS = (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError, ConnectTimeoutError)
+
+# Requests per second the Glue fetch starts at, and the bounds AIMD keeps the rate within
+GLUE_INITIAL_RATE = 10.0
+GLUE_MIN_RATE = 1.0
+GLUE_MAX_RATE = 100.0
+# Glue requests in flight at once, also the size of the client connection pool
+GLUE_MAX_CONCURRENCY = 32
+# Attempts per request and the bounds of the jittered exponential backoff between them
+GLUE_MAX_ATTEMPTS = 10
+GLUE_BACKOFF_BASE = 0.25
+GLUE_BACKOFF_CAP = 20.0
+
+# Table parameters that carry the row count written by crawlers and ETL jobs, in order of preference
+GLUE_ROW_COUNT_PARAMETERS = ('numRows', 'recordCount')
+
+
+class GlueFetchError(Exception):
+    """Raised when a Glue request fails, after every retry if retryable, instead of reporting an empty schema."""
+
+
+# Rate limiter shared by every Glue fetch in the process, so concurrent fetches stay within one account rate
+glue_rate_limiter = AdaptiveRateLimiter(GLUE_INITIAL_RATE, GLUE_MIN_RATE, GLUE_MAX_RATE)
+
+
+def get_glue_rate_limiter() -> AdaptiveRateLimiter:
+    """Returns the process-wide Glue rate limiter."""
+    return glue_rate_limiter
+
+
+def create_glue_client(max_concurrency: int = GLUE_MAX_CONCURRENCY):
+    """Creates a Glue client that leaves retries to the rate-limited fetcher, pooling a connection per request."""
+    return boto3.client('glue', config=Config(retries={'mode': 'standard', 'max_attempts': 1},
+                                              max_pool_connections=max_concurrency))
+
+
+# Glue client shared by every fetch of the process, so that its connection pool stays warm between runs
+glue_client = None
+glue_client_pid = None
+glue_client_lock = threading.Lock()
+
+
+def get_glue_client():
+    """Returns the process-wide Glue client, creating it on first use and again after a fork."""
+    global glue_client, glue_client_pid
+    with glue_client_lock:
+        if glue_client is None or glue_client_pid != os.getpid():
+            glue_client = create_glue_client()
+            glue_client_pid = os.getpid()
+        return glue_client
+
+
+# Clients and counters of the open count_glue_calls/count_glue_throttles contexts, by kind. Each client gets one
+# handler per kind, registered once, since registering handlers on a client other threads are calling could drop events from
+# the emitter's lookup cache; the handler credits the counters opened in the context of the call, or every open
+# counter for a call made from a thread that did not copy the context of a fetch
+open_glue_counters = {'calls': [], 'throttles': []}
+open_glue_counters_lock = threading.Lock()
+glue_counters_in_scope = contextvars.ContextVar('glue_counters_in_scope', default=None)
+
+
+def add_to_glue_counters(client, kind: str, key: str):
+    """Adds a Glue call or throttle of a client to its open counters of the given kind the current context belongs to."""
+    counters_in_scope = glue_counters_in_scope.get()
+    with open_glue_counters_lock:
+        for owner, counts in open_glue_counters[kind]:
+            if owner is client and (counters_in_scope is None or
+                                    any(counter is counts for counter in counters_in_scope)):
+                counts[key] += 1
+
+
+def record_glue_call(client, model, **kwargs):
+    add_to_glue_counters(client, 'calls', model.name)
+
+
+def record_glue_throttle(client, response=None, **kwargs):
+    if response is None:
+        return None
+    error_code = response[1].get('Error', {}).get('Code')
+    if error_code in THROTTLING_ERROR_CODES:
+        add_to_glue_counters(client, 'throttles', error_code)
+    return None
+
+
+@contextmanager
+def open_glue_counter(client, kind: str, event_name: str, handler):
+    """
+    Opens a counter of the given kind on a client, registering the client's handler of that kind on first use.
+
+    :param client: The boto3 Glue client whose calls are counted.
+    :param kind: Key of open_glue_counters, 'calls' or 'throttles'.
+    :param event_name: botocore event the handler is registered for.
+    :param handler: Handler crediting the open counters of the kind, given the client as first argument.
+    """
+    counts = Counter()
+    with open_glue_counters_lock:
+        client.meta.events.register(event_name, functools.partial(handler, client),
+                                    unique_id=f'dr-glue-{kind}-counter')
+        open_glue_counters[kind].append((client, counts))
+    token = glue_counters_in_scope.set((glue_counters_in_scope.get() or ()) + (counts,))
+    try:
+        yield counts
+    finally:
+        glue_counters_in_scope.reset(token)
+        with open_glue_counters_lock:
+            open_glue_counters[kind] = [(owner, counter) for owner, counter in open_glue_counters[kind]
+                                        if counter is not counts]
+
+
+def split_table_config(table: str) -> tuple:
+    """Splits a 'database,table' line of dr_table_config.txt into lower-cased names."""
+    return table.split(',')[0].lower(), table.split(',')[1].lower()
+
+
+def empty_table_metadata() -> dict:
+    """Returns the metadata recorded for a table whose schema could not be fetched."""
+    return {'Table_Columns_Names': intern_schema([]), 'Table_Columns_Counts': 0, 'Table_Row_Count': None}
+
+
+def get_table_row_count(table: dict):
+    """Returns the row count a Glue table definition records in its parameters, or None if it has none."""
+    parameters = table.get('Parameters', {})
+    for parameter in GLUE_ROW_COUNT_PARAMETERS:
+        try:
+            return int(float(parameters[parameter]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def get_table_columns_metadata(table: dict) -> dict:
+    """Builds the column metadata of a Glue table definition returned by get_table or get_tables."""
+    tbl_cols_names = intern_schema(col['Name'] for col in table.get('StorageDescriptor', {}).get('Columns', []))
+    return {'Table_Columns_Names': tbl_cols_names, 'Table_Columns_Counts': len(tbl_cols_names),
+            'Table_Row_Count': get_table_row_count(table)}
+
+
+def get_table_version(table: dict) -> tuple:
+    """Returns the (VersionId, UpdateTime) pair that identifies the revision of a Glue table definition."""
+    update_time = table.get('UpdateTime')
+    return str(table.get('VersionId', '')), update_time.isoformat() if update_time else ''
+
+
+def group_tables_by_database(tables_list: list) -> dict:
+    """Groups the configured tables by their Glue database."""
+    tables_by_db = defaultdict(list)
+    for table in tables_list:
+        db_name, table_name = split_table_config(table)
+        if table_name not in tables_by_db[db_name]:
+            tables_by_db[db_name].append(table_name)
+    return tables_by_db
+
+
+def build_table_expressions(table_names: list, max_length: int = GLUE_EXPRESSION_MAX_LENGTH) -> list:
+    """Packs table names into as few get_tables Expression patterns as fit within the Glue length limit."""
+    expressions, current = [], []
+    for table_name in sorted(table_names):
+        candidate = current + [re.escape(table_name)]
+        if current and len('|'.join(candidate)) > max_length:
+            expressions.append('|'.join(current))
+            candidate = [re.escape(table_name)]
+        current = candidate
+    if current:
+        expressions.append('|'.join(current))
+    return expressions
+
+
+def count_glue_calls(client):
+    """Counts the Glue API calls made through a client while the context is open, per operation name."""
+    return open_glue_counter(client, 'calls', 'after-call.glue', record_glue_call)
+
+
+def count_glue_throttles(client):
+    """Counts the Glue responses rejected for throttling, including those botocore retried, while the context is open."""
+    return open_glue_counter(client, 'throttles', 'needs-retry.glue', record_glue_throttle)
+
+
+async def call_glue(client, executor, slots: asyncio.Semaphore, limiter: AdaptiveRateLimiter, operation: str,
+                    **params) -> dict:
+    """
+    Sends one Glue request through the rate limiter, retrying throttling and transient errors with
+    jittered exponential backoff.
+
+    :param client: The boto3 Glue client, whose blocking calls run on the executor.
+    :param executor: Thread pool the blocking boto3 calls are offloaded to.
+    :param slots: Semaphore bounding the requests waiting on the limiter or in flight, so that retries
+        do not queue behind the token reservations of every pending table.
+    :param limiter: Rate limiter every attempt waits on and reports its outcome to.
+    :param operation: Name of the client method, e.g. 'get_tables'.
+    :return: The response of the request.
+    :raises GlueFetchError: If the request still fails after GLUE_MAX_ATTEMPTS attempts.
+    :raises ClientError: On an error that is not retried, left for the caller to inspect its code.
+    """
+    loop = asyncio.get_running_loop()
+    request = functools.partial(getattr(client, operation), **params)
+    error = None
+    for attempt in range(GLUE_MAX_ATTEMPTS):
+        try:
+            async with slots:
+                await limiter.acquire()
+                # The executor threads run the call in the context of this fetch, so its counters see it
+                response = await loop.run_in_executor(executor, contextvars.copy_context().run, request)
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code in THROTTLING_ERROR_CODES:
+                limiter.on_throttle()
+            elif error_code not in GLUE_TRANSIENT_ERROR_CODES:
+                raise
+            error = e
+        except GLUE_CONNECTION_ERRORS as e:
+            error = e
+        else:
+            limiter.on_success()
+            return response
+        delay = get_backoff_delay(attempt, GLUE_BACKOFF_BASE, GLUE_BACKOFF_CAP)
+        logger.debug(f"Retrying Glue {operation} in {delay:.2f}s after attempt {attempt + 1}: {error}")
+        await asyncio.sleep(delay)
+    raise GlueFetchError(f"Glue {operation} failed after {GLUE_MAX_ATTEMPTS} attempts: {error}") from error
+
+
+async def fetch_database_tables(client, executor, slots: asyncio.Semaphore, limiter: AdaptiveRateLimiter,
+                                db_name: str, table_names: list, use_expression: bool = True) -> dict:
+    """
+    Pulls the requested tables of one Glue database with paginated get_tables calls.
+
+    :param client: The boto3 Glue client.
+    :param executor: Thread pool the blocking boto3 calls are offloaded to.
+    :param slots: Semaphore bounding the Glue requests in flight.
+    :param limiter: Rate limiter shared by every Glue request.
+    :param db_name: The name of the Glue database.
+    :param table_names: Names of the configured tables in the database.
+    :param use_expression: Restrict the listing to the configured tables with Expression filters, listed concurrently.
+    :return: Dictionary of (metadata, version) pairs for the configured tables that were found.
+    """
+    wanted = set(table_names)
+    table_metadata_dict = {}
+
+    async def list_tables(expression):
+        params = {'DatabaseName': db_name}
+        if expression:
+            params['Expression'] = expression
+        while True:
+            page = await call_glue(client, executor, slots, limiter, 'get_tables', **params)
+            for table in page.get('TableList', []):
+                table_name = table['Name'].lower()
+                if table_name in wanted:
+                    table_metadata_dict[table_name] = get_table_columns_metadata(table), get_table_version(table)
+            if not page.get('NextToken'):
+                break
+            params['NextToken'] = page['NextToken']
+
+    expressions = build_table_expressions(table_names) if use_expression else [None]
+    await asyncio.gather(*(list_tables(expression) for expression in expressions))
+    logger.info(f"Fetched {len(table_metadata_dict)} of {len(wanted)} configured tables from Glue database {db_name}")
+    return table_metadata_dict
+
+
+async def fetch_table(client, executor, slots: asyncio.Semaphore, limiter: AdaptiveRateLimiter, db_name: str,
+                      table_name: str) -> tuple:
+    """
+    Retrieves metadata for a single Glue table with get_table, with its version.
+
+    Only a table that does not exist yields empty metadata; any other failure is raised so that it is
+    never reported as a schema mismatch.
+    """
+    try:
+        response = await call_glue(client, executor, slots, limiter, 'get_table', DatabaseName=db_name, Name=table_name)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'EntityNotFoundException':
+            raise
+        logger.error(f"Table does not exist: {db_name}.{table_name}")
+        return empty_table_metadata(), None
+    if response['Table']['Name'].lower() != table_name:
+        logger.warning(f"Retrieved incorrect metadata for table: {table_name}")
+        return empty_table_metadata(), None
+    return get_table_columns_metadata(response['Table']), get_table_version(response['Table'])
+
+
+async def fetch_glue_tables(client, tables_by_db: dict, use_expression: bool = True,
+                            max_concurrency: int = GLUE_MAX_CONCURRENCY, limiter: AdaptiveRateLimiter = None) -> dict:
+    """
+    Fetches the configured tables of every database concurrently, then the tables the bulk listings missed.
+
+    :param client: The boto3 Glue client.
+    :param tables_by_db: Configured table names grouped by Glue database.
+    :param use_expression: Restrict each database listing to the configured tables.
+    :param max_concurrency: Number of Glue requests in flight at once.
+    :param limiter: Rate limiter shared by every Glue request, the process-wide limiter if not provided.
+    :return: Dictionary of database name to a dictionary of (metadata, version) pairs by table name.
+    """
+    limiter = limiter or get_glue_rate_limiter()
+    db_results = {}
+    slots = asyncio.Semaphore(max_concurrency)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        async def fetch_database(db_name, table_names):
+            try:
+                db_results[db_name] = await fetch_database_tables(client, executor, slots, limiter, db_name,
+                                                                  table_names, use_expression)
+            except Exception as e:
+                # The tables are fetched one by one below, so a listing failure only costs extra calls
+                logger.error(f"Error listing tables of Glue database: {db_name}")
+                log_errors(e, detailed_traceback=True)
+                db_results[db_name] = {}
+
+        await asyncio.gather(*(fetch_database(db_name, table_names) for db_name, table_names in tables_by_db.items()))
+
+        stragglers = [(db_name, table_name) for db_name, table_names in tables_by_db.items()
+                      for table_name in table_names if table_name not in db_results[db_name]]
+        if stragglers:
+            logger.info(f"Fetching {len(stragglers)} Glue tables missing from the bulk listing with get_table")
+        straggler_results = await asyncio.gather(*(fetch_table(client, executor, slots, limiter, db_name, table_name)
+                                                   for db_name, table_name in stragglers))
+    for (db_name, table_name), result in zip(stragglers, straggler_results):
+        db_results[db_name][table_name] = result
+    return db_results
+
+
+def record_table_version(glue_cache, db_name: str, table_name: str, version: tuple, metadata: dict,
+                         cache_counts: Counter):
+    """Compares a fetched table against its cached version, refreshing the cache entry when it changed."""
+    if glue_cache.get(db_name, table_name, version) is not None:
+        glue_cache.touch(db_name, [table_name])
+        cache_counts['Unchanged'] += 1
+    else:
+        glue_cache.put(db_name, table_name, version, metadata)
+        cache_counts['Refreshed'] += 1
+
+
+def get_glue_catalog_metadata(tables_list: list, client=None, use_expression: bool = True,
+                              max_concurrency: int = GLUE_MAX_CONCURRENCY, glue_cache=None) -> dict:
+    """
+    Retrieves metadata for a list of Glue tables with one paginated get_tables pass per database.
+
+    Tables the bulk pass did not return are fetched one by one with get_table. Requests are sent from an
+    asyncio event loop through the process-wide adaptive rate limiter and retried on throttling, so a
+    throttled table is fetched late rather than reported with an empty schema. With the Glue metadata
+    cache enabled, tables validated within the cache TTL are served without any API call, and the
+    VersionId/UpdateTime of every listed table is compared with the cache to refresh only changed entries.
+
+    :param tables_list: List of tables in the format "database_name,table_name".
+    :param client: The boto3 Glue client, the process-wide client if not provided.
+    :param use_expression: Restrict each database listing to the configured tables.
+    :param max_concurrency: Number of Glue requests in flight at once.
+    :param glue_cache: Glue metadata cache, the process-wide cache if not provided.
+    :return: Dictionary containing metadata for each table.
+    :raises GlueFetchError: If a table could not be fetched despite retries, or Glue refused a request with
+        any error other than a missing table.
+    """
+    client = client or get_glue_client()
+    glue_cache = glue_cache or get_glue_cache()
+    tables_by_db = group_tables_by_database(tables_list)
+    table_metadata_dict = {}
+    cache_counts = Counter()
+
+    if glue_cache:
+        for db_name, table_names in list(tables_by_db.items()):
+            fresh_tables = glue_cache.get_fresh_tables(db_name, table_names)
+            table_metadata_dict.update(fresh_tables)
+            cache_counts['Fresh'] += len(fresh_tables)
+            remaining = [table_name for table_name in table_names if table_name not in fresh_tables]
+            if remaining:
+                tables_by_db[db_name] = remaining
+            else:
+                del tables_by_db[db_name]
+
+    run_metrics = get_run_metrics()
+    run_metrics.record_queue_depth('glue_fetch', sum(len(table_names) for table_names in tables_by_db.values()))
+    with run_metrics.stage('glue_fetch'), count_glue_calls(client) as call_counts, \
+            count_glue_throttles(client) as throttle_counts:
+        try:
+            db_results = asyncio.run(fetch_glue_tables(client, tables_by_db, use_expression, max_concurrency))
+        except ClientError as e:
+            raise GlueFetchError(f"Glue {e.operation_name} failed with {e.response['Error']['Code']}: {e}") from e
+        for db_name, db_metadata in db_results.items():
+            for table_name, (metadata, version) in db_metadata.items():
+                table_metadata_dict[table_name] = metadata
+                if glue_cache and version is not None:
+                    record_table_version(glue_cache, db_name, table_name, version, metadata, cache_counts)
+
+    run_metrics.record('glue_fetch', items=len(table_metadata_dict), glue_calls=sum(call_counts.values()),
+                       glue_throttles=sum(throttle_counts.values()))
+    logger.info(f"Fetched metadata for {len(table_metadata_dict)} Glue tables in {sum(call_counts.values())} "
+                f"API calls: {dict(call_counts)}")
+    if throttle_counts:
+        logger.warning(f"Glue throttled {sum(throttle_counts.values())} requests: {dict(throttle_counts)}, "
+                       f"rate limiter: {get_glue_rate_limiter().stats()}")
+    if glue_cache:
+        # Unchanged tables were still downloaded by the listing; only the ones within the TTL cost no API call
+        logger.info(f"Served {cache_counts['Fresh']} of {len(table_metadata_dict)} Glue tables from the metadata "
+                    f"cache within its TTL of {glue_cache.ttl_seconds}s; of the fetched tables, "
+                    f"{cache_counts['Unchanged']} were validated unchanged and {cache_counts['Refreshed']} refreshed")
+    return table_metadata_dict
@@ -0,0 +1,132 @@
+import json
+import time
+import argparse
+import threading
+from aws_utils_func import configure_logging
+from dr_table_schema import intern_metadata, encode_schema
+from dr_sqlite import SqliteStore
+
+# Logger configuration
+logger = configure_logging()
+
+GLUE_CACHE_PATH = './cache/glue_metadata_cache.db'
+GLUE_CACHE_MODES = ('use', 'bypass', 'rebuild')
+# Seconds a cached table is trusted without asking Glue. The default 0 always fetches every table, so a schema
+# change is never missed; a run only skips the Glue calls of tables served within a non-zero TTL
+GLUE_CACHE_TTL = 0
+
+
+class GlueMetadataCache(SqliteStore):
+    """Persistent cache of Glue table schemas keyed by database/table and validated by VersionId/UpdateTime."""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS glue_table_cache ('
+        'db_name TEXT NOT NULL, table_name TEXT NOT NULL, '
+        'version_id TEXT NOT NULL, update_time TEXT NOT NULL, '
+        'metadata TEXT NOT NULL, fetched_at REAL NOT NULL, '
+        'PRIMARY KEY (db_name, table_name))',
+    )
+
+    def __init__(self, db_path: str = GLUE_CACHE_PATH, ttl_seconds: int = GLUE_CACHE_TTL):
+        super().__init__(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+
+    def get_fresh_tables(self, db_name: str, table_names: list) -> dict:
+        """Returns the cached metadata of the tables fetched or validated within the TTL."""
+        if self.ttl_seconds <= 0 or not table_names:
+            return {}
+        placeholders = ','.join('?' * len(table_names))
+        with self.lock:
+            rows = self.get_connection().execute(
+                f'SELECT table_name, metadata FROM glue_table_cache WHERE db_name = ? AND fetched_at >= ? '
+                f'AND table_name IN ({placeholders})',
+                [db_name, time.time() - self.ttl_seconds, *table_names]).fetchall()
+        return {table_name: intern_metadata(json.loads(metadata)) for table_name, metadata in rows}
+
+    def get(self, db_name: str, table_name: str, version: tuple):
+        """Returns the cached metadata of a table if it was cached at the given (VersionId, UpdateTime)."""
+        with self.lock:
+            row = self.get_connection().execute(
+                'SELECT metadata FROM glue_table_cache WHERE db_name = ? AND table_name = ? '
+                'AND version_id = ? AND update_time = ?', (db_name, table_name, *version)).fetchone()
+        return intern_metadata(json.loads(row[0])) if row else None
+
+    def put(self, db_name: str, table_name: str, version: tuple, metadata: dict):
+        """Stores the metadata of a table at the given (VersionId, UpdateTime)."""
+        with self.lock:
+            self.get_connection().execute(
+                'INSERT OR REPLACE INTO glue_table_cache '
+                '(db_name, table_name, version_id, update_time, metadata, fetched_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (db_name, table_name, *version, json.dumps(metadata, default=encode_schema), time.time()))
+
+    def touch(self, db_name: str, table_names: list):
+        """Restarts the TTL of tables whose cached version was confirmed unchanged."""
+        with self.lock:
+            self.get_connection().executemany(
+                'UPDATE glue_table_cache SET fetched_at = ? WHERE db_name = ? AND table_name = ?',
+                [(time.time(), db_name, table_name) for table_name in table_names])
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self.lock:
+            self.get_connection().execute('DELETE FROM glue_table_cache')
+        logger.info(f"Cleared Glue metadata cache {self.db_path}")
+
+
+# Process-wide cache shared by every get_glue_tbls_metadata variant, None when caching is bypassed
+glue_cache = None
+# Until a mode is configured, the first get_glue_cache call enables the cache in 'use' mode
+glue_cache_configured = False
+glue_cache_lock = threading.Lock()
+
+
+def configure_glue_cache(mode: str = 'use', db_path: str = GLUE_CACHE_PATH, ttl_seconds: int = GLUE_CACHE_TTL):
+    """
+    Configures the process-wide Glue metadata cache.
+
+    :param mode: 'use' to read and populate the cache, 'bypass' to disable it, 'rebuild' to clear it first.
+    :param db_path: Path of the SQLite cache file.
+    :param ttl_seconds: Seconds a cached table is served without validating its version against Glue.
+    :return: The configured cache, or None when bypassed.
+    """
+    global glue_cache, glue_cache_configured
+    if mode not in GLUE_CACHE_MODES:
+        raise ValueError(f"Invalid Glue cache mode: {mode}. Expected one of {GLUE_CACHE_MODES}")
+    glue_cache_configured = True
+    if mode == 'bypass':
+        glue_cache = None
+        logger.info("Glue metadata cache bypassed.")
+        return None
+    glue_cache = GlueMetadataCache(db_path, ttl_seconds)
+    if mode == 'rebuild':
+        glue_cache.clear()
+    return glue_cache
+
+
+def get_glue_cache():
+    """
+    Returns the process-wide Glue metadata cache, or None when caching is bypassed.
+
+    Compare scripts that never configure the cache get it in 'use' mode with the default path and TTL.
+    """
+    if not glue_cache_configured:
+        with glue_cache_lock:
+            if not glue_cache_configured:
+                configure_glue_cache('use')
+    return glue_cache
+
+
+def add_glue_cache_arguments(parser: argparse.ArgumentParser):
+    """Adds the Glue metadata cache switches to a command line parser."""
+    parser.add_argument('--glue-cache', choices=GLUE_CACHE_MODES, default='use',
+                        help="Use the Glue metadata cache, bypass it, or clear and rebuild it.")
+    parser.add_argument('--glue-cache-path', default=GLUE_CACHE_PATH,
+                        help="Path of the SQLite Glue metadata cache file.")
+    parser.add_argument('--glue-cache-ttl', type=int, default=GLUE_CACHE_TTL,
+                        help="Seconds cached tables are trusted without a version check; 0 always checks.")
+
+
+def configure_glue_cache_from_args(args: argparse.Namespace):
+    """Configures the process-wide Glue metadata cache from parsed command line switches."""
+    return configure_glue_cache(args.glue_cache, args.glue_cache_path, args.glue_cache_ttl)
@@ -1,21 +1,45 @@
+import io
 import os
+import sys
 import zipfile
+import argparse
+import functools
 import logging
 import traceback
 from glob import glob
-from datetime import datetime
-import boto3
+import pyarrow as pa
 import pyarrow.parquet as pq
 import concurrent.futures
-from botocore.exceptions import ClientError
 from aws_utils_func import log_errors, configure_logging
+from dr_zip_reader import (read_zip_parquet_headers, read_zip_manifest, get_zip_staging_dir,
+                           get_cached_zip_headers, put_zip_headers, extract_zip_incremental)
+from glue_catalog import get_glue_catalog_metadata
+from dr_drop_index import DropIndex
+from dr_s3_zip_reader import get_s3_dr_file_header
+from dr_metrics import start_run_metrics, get_run_metrics, write_run_metrics
+from dr_journal import open_run_journal
+from dr_run_history import record_run_history, add_run_history_arguments, configure_run_history_from_args
+from dr_table_schema import intern_schema
+from dr_quick_validation import get_footer_statistics, quick_validate_tables
+from dr_schema_cache import cached_parquet_metadata, get_schema_cache, add_schema_cache_arguments, \
+    configure_schema_cache_from_args
+from glue_metadata_cache import add_glue_cache_arguments, configure_glue_cache_from_args
+from dr_pipeline import run_dr_validation_pipeline, get_report_paths, write_table_comparison, write_comparison_summary
 
 # logger configuration
 logger = configure_logging()
 
-def unzip_file(input_zip_file: str, output_dir: str) -> bool:
-    """Unzips the specified zip file to the given output directory."""
+def unzip_file(input_zip_file: str, output_dir: str, incremental: bool = False) -> bool:
+    """
+    Unzips the specified zip file to the given output directory.
+
+    With incremental only the members whose CRC32, size or timestamp differ from the files on disk are rewritten;
+    the per-zip staging directories of the DR runs are extracted that way.
+    """
     try:
+        if incremental:
+            extract_zip_incremental(input_zip_file, output_dir)
+            return True
         with zipfile.ZipFile(input_zip_file, 'r') as zip_ref:
             for member in zip_ref.namelist():
                 target_path = os.path.join(output_dir, member)
@@ -30,169 +54,182 @@ def unzip_file(input_zip_file: str, output_dir: str) -> bool:
         return False
 
 
-def read_parquet_file_metadata(parquet_file: str) -> dict:
-    """Reads metadata from the specified parquet file."""
+@cached_parquet_metadata('pyarrow_counts')
+def read_parquet_file_metadata(parquet_file: str, source=None) -> dict:
+    """Reads the column names and footer statistics of the specified parquet file, or of an already opened source for it."""
     try:
         parquet_file_name = os.path.basename(parquet_file).split('.parquet')[0]
-        pq_df = pq.read_schema(parquet_file)
-        pq_cols_name_ls = pq_df.names
+        pq_md = pq.read_metadata(parquet_file if source is None else source)
+        pq_cols_name_ls = intern_schema(pq_md.schema.to_arrow_schema().names)
         metadata = {
             'File_Columns_Names': pq_cols_name_ls,
             'File_Columns_Counts': len(pq_cols_name_ls)
         }
+        metadata.update(get_footer_statistics(pq_md))
         logger.debug(f"{parquet_file_name}: {pq_cols_name_ls}")
         return parquet_file_name, metadata
-    except (pq.ArrowInvalid, OSError) as e:
+    except (pa.ArrowInvalid, OSError) as e:
         log_errors(e, detailed_traceback=True)
         return os.path.basename(parquet_file).split('.parquet')[0], {
-            'File_Columns_Names': [],
-            'File_Columns_Counts': 0
+            'File_Columns_Names': intern_schema([]),
+            'File_Columns_Counts': 0,
+            'File_Num_Rows': None
         }
 
 
 def process_zip_file(zip_file: str, output_dr_dir: str) -> dict:
-    """Processes a single zip file: unzips it and reads metadata from contained parquet files."""
+    """Processes a single zip file: stages it in its own directory and reads metadata from the parquet files in its manifest."""
+    file_metadata_dict = get_cached_zip_headers(zip_file, read_parquet_file_metadata)
+    if file_metadata_dict is not None:
+        return file_metadata_dict
+
     file_metadata_dict = {}
-    if unzip_file(zip_file, output_dr_dir):
-        parquet_files = glob(f"{output_dr_dir}/*.parquet")
-        with concurrent.futures.ThreadPoolExecutor() as executor:
+    staging_dir = get_zip_staging_dir(zip_file, output_dr_dir)
+    if unzip_file(zip_file, staging_dir, incremental=True):
+        parquet_files = [os.path.join(staging_dir, member) for member in read_zip_manifest(zip_file)]
+        with get_run_metrics().stage('footer_read'), concurrent.futures.ThreadPoolExecutor() as executor:
             future_to_parquet = {
                 executor.submit(read_parquet_file_metadata, file): file
                 for file in parquet_files
             }
+            get_run_metrics().record_queue_depth('footer_read', len(future_to_parquet))
             for future in concurrent.futures.as_completed(future_to_parquet):
                 file = future_to_parquet[future]
                 parquet_file_name, metadata = future.result()
                 file_metadata_dict[parquet_file_name] = metadata
+        get_run_metrics().record('footer_read', items=len(parquet_files))
+        put_zip_headers(zip_file, file_metadata_dict, read_parquet_file_metadata)
     return file_metadata_dict
 
 
-def get_dr_file_header(input_dr_zip_dir: str, output_dr_dir: str) -> dict:
-    """Retrieves metadata for parquet files within zip files in the specified directory."""
+def process_zip_file_in_place(zip_file: str) -> dict:
+    """Processes a single zip file: reads metadata from contained parquet files without extracting them."""
+    return read_zip_parquet_headers(zip_file, read_parquet_file_metadata)
+
+
+def get_dr_file_header(input_dr_zip_dir: str, output_dr_dir: str, extract_members: bool = True,
+                       zip_files: list = None, journal=None) -> dict:
+    """
+    Retrieves metadata for parquet files within zip files in the specified directory.
+
+    :param input_dr_zip_dir: Directory containing the zip files.
+    :param output_dr_dir: Directory to extract the files, unused when members are read in place.
+    :param extract_members: Extract every member to disk first; otherwise only parquet footers are read.
+    :param zip_files: Only read these zip files instead of every zip file in the directory.
+    :param journal: Run journal; zip files it already holds are not read again and the others are added to it.
+    :return: Metadata dictionary for all parquet files.
+    """
     try:
-        zip_files = glob(f"{input_dr_zip_dir}/*.zip")
+        run_metrics = get_run_metrics()
+        with run_metrics.stage('zip_listing'):
+            zip_files = glob(f"{input_dr_zip_dir}/*.zip") if zip_files is None else list(zip_files)
+        run_metrics.record('zip_listing', items=len(zip_files))
         logger.info(f"Found {len(zip_files)} zip files in {input_dr_zip_dir}")
 
         file_metadata_dict = {}
+        if journal is not None:
+            remaining_zip_files = []
+            for zip_file in zip_files:
+                journaled = journal.get_zip_metadata(zip_file)
+                if journaled is None:
+                    remaining_zip_files.append(zip_file)
+                else:
+                    file_metadata_dict.update(journaled)
+            logger.info(f"{len(zip_files) - len(remaining_zip_files)} zip files already read by the interrupted run")
+            zip_files = remaining_zip_files
+
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_to_zip = {
-                executor.submit(process_zip_file, zip_file, output_dr_dir): zip_file
-                for zip_file in zip_files
-            }
+            if extract_members:
+                future_to_zip = {
+                    executor.submit(process_zip_file, zip_file, output_dr_dir): zip_file
+                    for zip_file in zip_files
+                }
+            else:
+                future_to_zip = {
+                    executor.submit(process_zip_file_in_place, zip_file): zip_file
+                    for zip_file in zip_files
+                }
+            run_metrics.record_queue_depth('extraction' if extract_members else 'footer_read', len(future_to_zip))
             for future in concurrent.futures.as_completed(future_to_zip):
                 zip_file = future_to_zip[future]
                 try:
                     metadata = future.result()
                     file_metadata_dict.update(metadata)
+                    if journal is not None:
+                        journal.record_zip(zip_file, metadata)
                 except Exception as e:
                     logger.error(f"Error processing zip file: {zip_file}")
                     log_errors(e, detailed_traceback=True)
 
+        if get_schema_cache():
+            get_schema_cache().log_stats()
         return file_metadata_dict
     except Exception as e:
         log_errors(e, detailed_traceback=True)
         return {}
 
 
-def get_glue_table_metadata(client, db_name: str, table_name: str) -> dict:
-    """Retrieves metadata for a specific Glue table."""
-    table_metadata = {}
-    try:
-        response = client.get_table(DatabaseName=db_name, Name=table_name)
-        if response:
-            tbl_name = response['Table']['Name']
-            if table_name == tbl_name:
-                tbl_cols_names = [col['Name'] for col in response['Table']['StorageDescriptor']['Columns']]
-                table_metadata['Table_Columns_Names'] = tbl_cols_names
-                table_metadata['Table_Columns_Counts'] = len(tbl_cols_names)
-            else:
-                logger.warning(f"Retrieved incorrect metadata for table: {table_name}")
-                table_metadata['Table_Columns_Names'] = []
-                table_metadata['Table_Columns_Counts'] = 0
-        else:
-            logger.warning(f"No response received for Glue table: {db_name}.{table_name}")
-            table_metadata['Table_Columns_Names'] = []
-            table_metadata['Table_Columns_Counts'] = 0
-    except ClientError as e:
-        log_errors(e, detailed_traceback=True)
-        if e.response['Error']['Code'] == 'EntityNotFoundException':
-            logger.error(f"Table does not exist: {db_name}.{table_name}")
-        table_metadata['Table_Columns_Names'] = []
-        table_metadata['Table_Columns_Counts'] = 0
-    except Exception as e:
-        log_errors(e, detailed_traceback=True)
-        table_metadata['Table_Columns_Names'] = []
-        table_metadata['Table_Columns_Counts'] = 0
-    return table_metadata
-
-
-def get_glue_tbls_metadata(tables_list: list) -> dict:
-    """Retrieves metadata for a list of Glue tables."""
-    client = boto3.client('glue')
-    table_metadata_dict = {}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_table = {
-            executor.submit(get_glue_table_metadata, client, table.split(',')[0].lower(),
-                            table.split(',')[1].lower()): table
-            for table in tables_list
-        }
-        for future in concurrent.futures.as_completed(future_to_table):
-            table = future_to_table[future]
-            table_name = table.split(',')[1].lower()
-            try:
-                table_metadata = future.result()
-                table_metadata_dict[table_name] = table_metadata
-            except Exception as e:
-                logger.error(f"Error retrieving metadata for table: {table}")
-                log_errors(e, detailed_traceback=True)
-                table_metadata_dict[table_name] = {'Table_Columns_Names': [], 'Table_Columns_Counts': 0}
-    return table_metadata_dict
-
-
-def compare_glue_tbl_structure(table_list: list, file_md_dict: dict, tbl_md_dict: dict) -> str:
-    """Compares Glue table structures with parquet file headers."""
+def get_glue_tbls_metadata(tables_list: list, journal=None) -> dict:
+    """
+    Retrieves metadata for a list of Glue tables, pulling each database with paginated get_tables calls.
+
+    With a journal, the metadata an interrupted run already fetched is reused, and a new fetch is journaled.
+
+    :raises GlueFetchError: If a table could not be fetched despite retries; dr_glue_main_process then fails
+        the run rather than comparing the file headers with an empty schema.
+    """
+    if journal is not None and journal.glue is not None:
+        logger.info(f"Glue Tables Metadata already fetched by the interrupted run")
+        return journal.glue
+    tbl_md_dict = get_glue_catalog_metadata(tables_list)
+    if journal is not None:
+        journal.record_glue(tbl_md_dict)
+    return tbl_md_dict
+
+
+def compare_table(dtl_fl, position: int, table: str, file_md_dict: dict, tbl_md_dict: dict, journal=None) -> tuple:
+    """Compares one configured table, replaying its journaled verdict and details report entry if it has one."""
+    if journal is None:
+        return write_table_comparison(dtl_fl, table, file_md_dict, tbl_md_dict)
+    journaled = journal.get_verdict(position)
+    if journaled is not None:
+        table_name, result, details = journaled
+    else:
+        details_buffer = io.StringIO()
+        table_name, result = write_table_comparison(details_buffer, table, file_md_dict, tbl_md_dict)
+        details = details_buffer.getvalue()
+        journal.record_verdict(position, table_name, result, details)
+    dtl_fl.write(details)
+    return table_name, result
+
+
+def compare_glue_tbl_structure(table_list: list, file_md_dict: dict, tbl_md_dict: dict, journal=None) -> str:
+    """
+    Compares Glue table structures with parquet file headers, skipping the tables a journal already holds.
+
+    The journal is completed only once both reports are fully written; on any failure it is kept so that
+    the next resumed run picks up from it.
+    """
     comparison_result = {}
     try:
-        current_timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        summary_file_path = f'./logs/DR_COMP_Summary_Report_{current_timestamp}.txt'
-        details_file_path = f'./logs/DR_COMP_Details_Report_{current_timestamp}.txt'
+        summary_file_path, details_file_path = get_report_paths()
 
+        run_metrics = get_run_metrics()
         with open(summary_file_path, 'w+') as sum_fl, open(details_file_path, 'w+') as dtl_fl:
-            for table in table_list:
-                db_name, table_name = table.split(',')[0].lower(), table.split(',')[1].lower()
-                logger.info(f"Comparing {db_name} - {table_name}")
-
-                dtl_fl.write(f"\n{'-' * 25}| {db_name} - {table_name} |{'-' * 25}\n")
-                dtl_fl.write(f"\tTable Columns Names - {tbl_md_dict[table_name]['Table_Columns_Names']}\n")
-                dtl_fl.write(f"\tTable Columns Counts - {len(tbl_md_dict[table_name]['Table_Columns_Names'])}\n")
-                dtl_fl.write(f"\tFile Columns Names - {file_md_dict[table_name]['File_Columns_Names']}\n")
-                dtl_fl.write(f"\tFile Columns Counts - {len(file_md_dict[table_name]['File_Columns_Names'])}\n")
-
-                if file_md_dict[table_name]['File_Columns_Names'] == tbl_md_dict[table_name]['Table_Columns_Names']:
-                    logger.info(f'Glue Table Structure validation for {table_name} - Passed')
-                    comparison_result[table_name] = 'SUCCEEDED'
-                else:
-                    logger.info(f'Glue Table Structure validation for {table_name} - Failed')
-                    comparison_result[table_name] = 'FAILED'
-
-                dtl_fl.write(f"{'-' * 75}")
-
-            failed_tables = [key for key, val in comparison_result.items() if 'FAILED' in val]
-            passed_tables = [key for key, val in comparison_result.items() if 'SUCCEEDED' in val]
-            validation = "FAILED" if failed_tables else "SUCCEEDED"
-
-            if failed_tables:
-                sum_fl.write(f"{'-' * 25}| Failed |{'-' * 25}\n")
-                for idx, item in enumerate(failed_tables, start=1):
-                    sum_fl.write(f"{idx}. {item} - FAILED\n")
-                    sum_fl.write(
-                        f"\tDifference - {set(file_md_dict[item]['File_Columns_Names']) - set(tbl_md_dict[item]['Table_Columns_Names'])}\n")
-
-            if passed_tables:
-                sum_fl.write(f"{'-' * 25}| Passed |{'-' * 25}\n")
-                for idx, item in enumerate(passed_tables, start=1):
-                    sum_fl.write(f"{idx}. {item} - PASSED\n")
-
+            with run_metrics.stage('compare'):
+                for position, table in enumerate(table_list):
+                    table_name, result = compare_table(dtl_fl, position, table, file_md_dict, tbl_md_dict, journal)
+                    comparison_result[table_name] = result
+            run_metrics.record('compare', items=len(table_list))
+
+            with run_metrics.stage('report_write'):
+                validation = write_comparison_summary(sum_fl, comparison_result, file_md_dict, tbl_md_dict)
+            run_metrics.record('report_write', items=len(comparison_result))
+
+        if journal is not None:
+            journal.complete()
+        write_run_metrics(summary_file_path)
+        record_run_history(summary_file_path, table_list, comparison_result, file_md_dict, tbl_md_dict, validation)
         return validation
     except Exception as e:
         tb = traceback.TracebackException.from_exception(e, capture_locals=True)
@@ -200,18 +237,53 @@ def compare_glue_tbl_structure(table_list: list, file_md_dict: dict, tbl_md_dict
         return "FAILED"
 
 
-def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str) -> dict:
-    """Main process to fetch and compare Glue table structures and DR file headers."""
+def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str, extract_members: bool = False,
+                         pipelined: bool = False, quick_validate: bool = False, s3_zip_prefix: str = None,
+                         zip_files: list = None, resume: bool = False) -> dict:
+    """
+    Main process to fetch and compare Glue table structures and DR file headers.
+
+    With quick_validate the row counts in the parquet footers are also checked against the Glue table
+    parameters, and the comparison is skipped when they reject the drop. With s3_zip_prefix the headers
+    of the latest drop under that S3 prefix are read with ranged GETs instead of from dr_zip_file_dir,
+    and with zip_files only those zip files of dr_zip_file_dir are read.
+
+    With resume the completed work is journaled as it happens, and a run over the same tables and zip
+    files that was interrupted before writing its reports picks up from its journal: zip files already
+    read, the Glue fetch and tables already compared are replayed instead of redone.
+    """
+    start_run_metrics()
+    journal = None
     try:
         with open(f'./config/dr_table_config.txt', 'r') as tbl_cfg_fl:
             table_list = tbl_cfg_fl.read().splitlines()
-            if table_list:
+            if table_list and pipelined:
+                logger.info(f"Streaming DR Parquet Files Headers and Glue Tables Metadata into the comparison.")
+                val_res = run_dr_validation_pipeline(table_list, dr_zip_file_dir, dr_input_file_dir,
+                                                     read_parquet_file_metadata,
+                                                     functools.partial(unzip_file, incremental=True), extract_members,
+                                                     zip_files=zip_files)
+            elif table_list:
+                if resume and not s3_zip_prefix:
+                    zip_files = glob(f"{dr_zip_file_dir}/*.zip") if zip_files is None else list(zip_files)
+                    journal = open_run_journal(table_list, zip_files, extract_members)
                 logger.info(f"Fetching DR Parquet Files Headers.")
-                file_md_dict = get_dr_file_header(dr_zip_file_dir, dr_input_file_dir)
+                if s3_zip_prefix:
+                    file_md_dict = get_s3_dr_file_header(s3_zip_prefix, read_parquet_file_metadata)
+                else:
+                    file_md_dict = get_dr_file_header(dr_zip_file_dir, dr_input_file_dir, extract_members, zip_files,
+                                                      journal)
                 logger.info(f"Fetching Glue Tables Metadata.")
-                tbl_md_dict = get_glue_tbls_metadata(table_list)
+                tbl_md_dict = get_glue_tbls_metadata(table_list, journal)
+                if quick_validate:
+                    logger.info(f"Validating the Parquet File Footer Statistics.")
+                    quick_res = quick_validate_tables(table_list, file_md_dict, tbl_md_dict)
+                    if quick_res != "SUCCEEDED":
+                        if journal is not None:
+                            journal.complete()
+                        return {"Quick Validation": quick_res, "Glue Table Validation": "FAILED"}
                 logger.info(f"Comparing the Glue Tables Structure vs Parquet File Header.")
-                val_res = compare_glue_tbl_structure(table_list, file_md_dict, tbl_md_dict)
+                val_res = compare_glue_tbl_structure(table_list, file_md_dict, tbl_md_dict, journal)
             else:
                 logger.warning(f"Config Tables list is empty.")
                 return {"Glue Table Validation": "FAILED"}
@@ -220,29 +292,52 @@ def dr_glue_main_process(dr_zip_file_dir: str, dr_input_file_dir: str) -> dict:
         tb = traceback.TracebackException.from_exception(e, capture_locals=True)
         logger.error("".join(tb.format()))
         return {"Glue Table Validation": "FAILED"}
+    finally:
+        if journal is not None:
+            journal.close()
 
 
 def get_latest_files(file_list):
-    """Returns the latest files matching the required file pattern."""
-    pattern = re.compile(r'(\d{8})-\d{4}_par0[1-3]\.zip')
-    files_by_date = {}
-
-    for filename in file_list:
-        match = pattern.match(filename)
-        if match:
-            date_str = match.group(1)
-            date = datetime.strptime(date_str, '%Y%m%d')
-            if date not in files_by_date:
-                files_by_date[date] = []
-            files_by_date[date].append(filename)
-
-    sorted_dates = sorted(files_by_date.keys(), reverse=True)
-    latest_files = []
-
-    for date in sorted_dates:
-        parts = sorted(files_by_date[date])
-        latest_files.extend(parts)
-        if len(latest_files) >= 3:
-            break
-
-    return latest_files[:3]
+    """Returns the files of the latest complete DR drop (par01-par03) in a file list."""
+    drop_index = DropIndex()
+    drop_index.add_many(file_list)
+    return drop_index.latest_complete_set()
+
+
+def main(argv: list = None) -> int:
+    """Command line entry point for the DR Glue comparison."""
+    parser = argparse.ArgumentParser(description="Compare Glue table structures with DR parquet file headers.")
+    parser.add_argument('dr_zip_file_dir', help="Directory containing the DR zip files.")
+    parser.add_argument('dr_input_file_dir', help="Directory the DR zip files are extracted to.")
+    parser.add_argument('--extract-members', action='store_true',
+                        help="Extract every zip member to disk instead of reading parquet footers in place.")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Compare each table as soon as its file and Glue schemas are available.")
+    parser.add_argument('--quick-validate', action='store_true',
+                        help="Check the footer row counts against the Glue table parameters before comparing.")
+    parser.add_argument('--s3-zip-prefix',
+                        help="Read the footers of the latest DR drop under this S3 prefix with ranged GETs.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Journal the completed work and resume an interrupted run over the same inputs.")
+    add_schema_cache_arguments(parser)
+    add_glue_cache_arguments(parser)
+    add_run_history_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.quick_validate and args.pipeline:
+        parser.error("--quick-validate is not supported together with --pipeline.")
+    if args.s3_zip_prefix and (args.pipeline or args.extract_members):
+        parser.error("--s3-zip-prefix is not supported together with --pipeline or --extract-members.")
+    if args.resume and (args.pipeline or args.s3_zip_prefix):
+        parser.error("--resume is not supported together with --pipeline or --s3-zip-prefix.")
+
+    configure_schema_cache_from_args(args)
+    configure_glue_cache_from_args(args)
+    configure_run_history_from_args(args)
+    result = dr_glue_main_process(args.dr_zip_file_dir, args.dr_input_file_dir, args.extract_members,
+                                  args.pipeline, args.quick_validate, args.s3_zip_prefix, resume=args.resume)
+    logger.info(f"DR Glue comparison result: {result}")
+    return 0 if result.get("Glue Table Validation") == "SUCCEEDED" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
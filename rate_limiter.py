@@ -0,0 +1,81 @@
+import time
+import random
+import asyncio
+import threading
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose fill rate follows AIMD: it grows additively while requests succeed and is
+    halved when the service throttles.
+
+    The limiter is thread-safe and may be shared by several event loops, so that every fetch running
+    in the process stays within one account-wide request rate.
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, increase: float = 1.0,
+                 decrease: float = 0.5, burst: float = None):
+        """
+        :param rate: Initial requests per second.
+        :param min_rate: Rate the limiter never drops below.
+        :param max_rate: Rate the limiter never grows beyond.
+        :param increase: Requests per second added for every second's worth of successful requests.
+        :param decrease: Factor the rate is multiplied by on throttling.
+        :param burst: Bucket capacity, one second at the initial rate if not provided.
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.throttles = 0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token, going into debt if none is left, and returns how long to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        """Waits until a request may be sent."""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def on_success(self):
+        """Additive increase: about `increase` requests per second more after a second of successes."""
+        with self.lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        """Multiplicative decrease, applied at most once per refill interval so a burst of concurrent
+        throttles triggered by the same overshoot only halves the rate once."""
+        with self.lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self.last_decrease < 1.0:
+                return
+            self.last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # Drop any saved-up burst so the lower rate applies immediately
+            self.tokens = min(self.tokens, 0.0)
+
+    def stats(self) -> dict:
+        """Returns the current rate and the success/throttle counters."""
+        with self.lock:
+            return {'Rate': round(self.rate, 2), 'Successes': self.successes, 'Throttles': self.throttles}
+
+
+def get_backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Returns a 'full jitter' exponential backoff delay for a retry attempt, starting at 0."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import types
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# oracle needs the cx_Oracle and psycopg2 drivers; Redshift is faked below, so only its two functions are stubbed
+sys.modules.setdefault('oracle', types.SimpleNamespace(get_redshift_conn=None, rs_fetchall=None))
+
+import dr_reconcile
+
+KEY_COLUMN = 'id'
+
+
+def write_parquet(path, ids, amounts, names, row_group_size=1000) -> pq.ParquetFile:
+    """Writes a table keyed on id and opens it."""
+    table = pa.table({KEY_COLUMN: pa.array(ids, pa.int64()), 'amount': pa.array(amounts, pa.int64()),
+                      'name': pa.array(names, pa.string())})
+    pq.write_table(table, str(path), row_group_size=row_group_size)
+    return pq.ParquetFile(str(path))
+
+
+def use_parquet_as_redshift(monkeypatch, redshift_file: pq.ParquetFile):
+    """Answers the Redshift bucket queries by aggregating another parquet file the same way."""
+    specs = dr_reconcile.get_aggregate_specs(redshift_file.schema_arrow, KEY_COLUMN)
+
+    def rs_fetchall(conn, query, low_key, high_key, width):
+        buckets = dr_reconcile.compute_parquet_buckets(redshift_file, KEY_COLUMN, specs, low_key, high_key, width,
+                                                       include_null_keys='WHERE' not in query)
+        return [(bucket, *values) for bucket, values in buckets.items()]
+
+    monkeypatch.setattr(dr_reconcile, 'rs_fetchall', rs_fetchall)
+
+
+def test_null_keys_are_bucketed_like_redshift(tmp_path):
+    parquet_file = write_parquet(tmp_path / 'nulls.parquet', [1, None, 2, None], [10, 20, 30, 40],
+                                 ['a', 'b', 'c', 'd'])
+    specs = dr_reconcile.get_aggregate_specs(parquet_file.schema_arrow, KEY_COLUMN)
+    buckets = dr_reconcile.compute_parquet_buckets(parquet_file, KEY_COLUMN, specs, 1, 2, 1, include_null_keys=True)
+    assert buckets[None][0] == 2
+    assert buckets[0][0] == 1 and buckets[1][0] == 1
+    bounded = dr_reconcile.compute_parquet_buckets(parquet_file, KEY_COLUMN, specs, 1, 2, 1)
+    assert None not in bounded
+
+
+def test_last_bucket_is_clamped_to_the_range():
+    assert dr_reconcile.get_bucket_range(63, 0, 9999, 157) == (9891, 9999)
+    assert dr_reconcile.get_bucket_range(0, 0, 9999, 157) == (0, 156)
+    assert dr_reconcile.get_bucket_range(dr_reconcile.BELOW_RANGE_BUCKET, 0, 9999, 157) == (None, -1)
+    assert dr_reconcile.get_bucket_range(dr_reconcile.ABOVE_RANGE_BUCKET, 0, 9999, 157) == (10000, None)
+
+
+def test_string_checksum_matches_redshift_crc32():
+    # CRC32('Amazon Redshift') as documented for the Redshift CRC32 function
+    checksums = dr_reconcile.get_crc32c_array(pa.array(['Amazon Redshift', None, ''])).to_pylist()
+    assert checksums == [int('f2726906', 16), None, 0]
+    assert dr_reconcile.get_sql_aggregate('sum_crc32', 'name', pa.string()) == \
+        'SUM(STRTOL(CRC32("name"), 16)::DECIMAL(38,0))'
+
+
+def test_same_length_string_change_is_detected(tmp_path):
+    original = write_parquet(tmp_path / 'original.parquet', [1, 2], [1, 2], ['abc', 'xyz'])
+    changed = write_parquet(tmp_path / 'changed.parquet', [1, 2], [1, 2], ['abd', 'xyz'])
+    specs = dr_reconcile.get_aggregate_specs(original.schema_arrow, KEY_COLUMN)
+    original_buckets = dr_reconcile.compute_parquet_buckets(original, KEY_COLUMN, specs, 1, 2, 1)
+    changed_buckets = dr_reconcile.compute_parquet_buckets(changed, KEY_COLUMN, specs, 1, 2, 1)
+    assert dr_reconcile.get_mismatched_buckets(original_buckets, changed_buckets) == [0]
+
+
+def test_integer_sums_do_not_overflow(tmp_path):
+    parquet_file = write_parquet(tmp_path / 'large.parquet', [1, 2, 3, 4], [2 ** 62] * 4, ['a'] * 4)
+    specs = dr_reconcile.get_aggregate_specs(parquet_file.schema_arrow, KEY_COLUMN)
+    buckets = dr_reconcile.compute_parquet_buckets(parquet_file, KEY_COLUMN, specs, 1, 4, 4, batch_size=2)
+    amount_sum = buckets[0][1 + [name for name, _, _ in specs].index('amount_sum')]
+    assert amount_sum == Decimal(2 ** 64)
+
+
+def test_matching_table_with_null_keys_succeeds(tmp_path, monkeypatch):
+    ids = list(range(10000)) + [None] * 5
+    names = [f'name_{idx}' for idx in range(10005)]
+    parquet_file_path = tmp_path / 'file.parquet'
+    write_parquet(parquet_file_path, ids, list(range(10005)), names)
+    use_parquet_as_redshift(monkeypatch, write_parquet(tmp_path / 'redshift.parquet', ids, list(range(10005)),
+                                                       names))
+    result = dr_reconcile.reconcile_table(str(parquet_file_path), None, 'dr_schema.dr_table', KEY_COLUMN)
+    assert result['Status'] == 'SUCCEEDED'
+
+
+def test_mismatch_in_uneven_last_bucket_is_drilled_into(tmp_path, monkeypatch):
+    ids = list(range(10000))
+    names = [f'name_{idx:05d}' for idx in ids]
+    parquet_file_path = tmp_path / 'file.parquet'
+    write_parquet(parquet_file_path, ids, ids, names)
+    redshift_names = list(names)
+    redshift_names[9995] = 'name_x9995'
+    use_parquet_as_redshift(monkeypatch, write_parquet(tmp_path / 'redshift.parquet', ids, ids, redshift_names))
+    result = dr_reconcile.reconcile_table(str(parquet_file_path), None, 'dr_schema.dr_table', KEY_COLUMN,
+                                          bucket_count=64, max_depth=4)
+    assert result['Status'] == 'FAILED'
+    mismatched_range, = result['Mismatched_Ranges']
+    assert mismatched_range['Key_From'] <= 9995 <= mismatched_range['Key_To']
+    assert mismatched_range['Key_To'] - mismatched_range['Key_From'] < 157
+
+
+class FakeRedshiftConn:
+    autocommit = False
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_command_line_reconciles_every_table_in_autocommit(tmp_path, monkeypatch):
+    ids = list(range(2000))
+    names = [f'name_{idx}' for idx in ids]
+    (tmp_path / 'dr_input').mkdir()
+    write_parquet(tmp_path / 'dr_input' / 'dr_table.parquet', ids, ids, names)
+    use_parquet_as_redshift(monkeypatch, write_parquet(tmp_path / 'redshift.parquet', ids, ids, names))
+    conn = FakeRedshiftConn()
+    monkeypatch.setattr(dr_reconcile, 'get_redshift_conn', lambda conn_str: conn)
+    monkeypatch.setattr(dr_reconcile, 'fetch_db_credential', lambda app_short_name, secret_name: {'host': 'redshift'})
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+    (tmp_path / 'reconcile.txt').write_text('dr_schema,dr_table,id\ndr_schema,dr_missing_table,id\n')
+    exit_code = dr_reconcile.main(['dr_input', '--config-file', 'reconcile.txt', '--redshift-secret-name', 'dr-rs'])
+    assert exit_code == 1
+    assert conn.autocommit and conn.closed
+    report_path, = (tmp_path / 'logs').glob('DR_RECON_Report_*.json')
+    statuses = [table['Status'] for table in json.loads(report_path.read_text())['Tables']]
+    assert statuses == ['SUCCEEDED', 'ERROR']
@@ -0,0 +1,76 @@
+import os
+import sys
+import glob
+
+import boto3
+import pytest
+from moto import mock_aws
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import new_dr_compare_glue
+from dr_compare_benchmark import generate_dr_drop, populate_glue_catalog
+
+FAILING_TABLE = 5
+
+
+@pytest.fixture
+def dr_run_dir(tmp_path, monkeypatch):
+    """A DR drop of 20 tables, its config and its Glue catalog in the local stand-in."""
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    tables_list = generate_dr_drop(str(tmp_path), zip_count=2, files_per_zip=10, column_count=4, row_count=20,
+                                   row_group_size=10, compression='deflated')
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('config')
+    os.makedirs('logs')
+    with open('config/dr_table_config.txt', 'w') as tbl_cfg_fl:
+        tbl_cfg_fl.write('\n'.join(tables_list))
+    with mock_aws():
+        boto3.setup_default_session()
+        populate_glue_catalog(boto3.client('glue'), tables_list, column_count=4, mismatch_every=3)
+        yield tables_list
+
+
+def read_details_report() -> str:
+    """Returns the details report of the last run and removes the reports."""
+    details_file_path, = glob.glob('logs/DR_COMP_Details_Report_*')
+    with open(details_file_path) as dtl_fl:
+        details = dtl_fl.read()
+    for report_path in glob.glob('logs/DR_COMP_*_Report_*'):
+        os.remove(report_path)
+    return details
+
+
+def test_failed_run_keeps_journal_and_resumes(dr_run_dir, monkeypatch):
+    expected = new_dr_compare_glue.dr_glue_main_process('dr_zip', 'dr_input')
+    expected_details = read_details_report()
+
+    compared = []
+    write_table_comparison = new_dr_compare_glue.write_table_comparison
+
+    def failing_comparison(dtl_fl, table, file_md_dict, tbl_md_dict):
+        if len(compared) == FAILING_TABLE:
+            raise RuntimeError('Injected comparison failure')
+        compared.append(table)
+        return write_table_comparison(dtl_fl, table, file_md_dict, tbl_md_dict)
+
+    monkeypatch.setattr(new_dr_compare_glue, 'write_table_comparison', failing_comparison)
+    assert new_dr_compare_glue.dr_glue_main_process('dr_zip', 'dr_input', resume=True) == \
+        {"Glue Table Validation": "FAILED"}
+    assert len(glob.glob('logs/DR_COMP_Journal_*.jsonl')) == 1
+    for report_path in glob.glob('logs/DR_COMP_*_Report_*'):
+        os.remove(report_path)
+
+    resumed = []
+
+    def counting_comparison(dtl_fl, table, file_md_dict, tbl_md_dict):
+        resumed.append(table)
+        return write_table_comparison(dtl_fl, table, file_md_dict, tbl_md_dict)
+
+    monkeypatch.setattr(new_dr_compare_glue, 'write_table_comparison', counting_comparison)
+    assert new_dr_compare_glue.dr_glue_main_process('dr_zip', 'dr_input', resume=True) == expected
+    assert resumed == dr_run_dir[FAILING_TABLE:]
+    assert read_details_report() == expected_details
+    assert glob.glob('logs/DR_COMP_Journal_*.jsonl') == []
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import dr_s3_zip_reader
+from config import APP_CONFIG
+from dr_schema_cache import configure_schema_cache
+from dr_zip_reader import read_zip_parquet_headers
+from new_dr_compare_glue import read_parquet_file_metadata
+from dr_compare_benchmark import generate_dr_drop, upload_dr_drop
+
+S3_KEY_PREFIX = 'dr_drop/'
+
+
+@pytest.fixture
+def s3_zip_files(tmp_path, monkeypatch):
+    """A stored and a deflated DR zip, on disk and in the local S3 stand-in."""
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    configure_schema_cache('bypass')
+    zip_files = {}
+    for compression in ('stored', 'deflated'):
+        work_dir = tmp_path / compression
+        generate_dr_drop(str(work_dir), zip_count=1, files_per_zip=4, column_count=4, row_count=200000,
+                         row_group_size=50000, compression=compression)
+        zip_name, = os.listdir(work_dir / 'dr_zip')
+        zip_files[compression] = (str(work_dir / 'dr_zip' / zip_name), f'{S3_KEY_PREFIX}{compression}/{zip_name}')
+    with mock_aws():
+        client = boto3.client('s3')
+        for compression, (zip_file, _) in zip_files.items():
+            upload_dr_drop(client, os.path.dirname(zip_file), f'{S3_KEY_PREFIX}{compression}/')
+        yield client, zip_files
+    configure_schema_cache('use')
+
+
+def test_s3_headers_match_local_headers(s3_zip_files):
+    client, zip_files = s3_zip_files
+    for zip_file, s3_key in zip_files.values():
+        s3_metadata = dr_s3_zip_reader.scan_s3_zip_parquet_headers(s3_key, read_parquet_file_metadata, client=client)
+        assert len(s3_metadata) == 4
+        assert s3_metadata == read_zip_parquet_headers(zip_file, read_parquet_file_metadata)
+
+
+def test_stored_zip_fetches_only_its_directory_and_footers(s3_zip_files, monkeypatch):
+    client, zip_files = s3_zip_files
+    counters = []
+
+    class RecordingRangeCounter(dr_s3_zip_reader.RangeCounter):
+        def __init__(self):
+            super().__init__()
+            counters.append(self)
+
+    monkeypatch.setattr(dr_s3_zip_reader, 'RangeCounter', RecordingRangeCounter)
+    _, s3_key = zip_files['stored']
+    dr_s3_zip_reader.scan_s3_zip_parquet_headers(s3_key, read_parquet_file_metadata, client=client)
+    object_size = client.head_object(Bucket=APP_CONFIG["S3_Bucket"], Key=s3_key)['ContentLength']
+    counter, = counters
+    assert object_size > 10 * dr_s3_zip_reader.S3_ZIP_TAIL_PREFETCH_SIZE
+    assert counter.bytes_fetched < object_size / 20